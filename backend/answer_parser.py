@@ -0,0 +1,183 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Python literals that models sometimes emit instead of JSON ones:
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+class AnswerParseError(ValueError):
+    """
+    Raised when a model reply cannot be turned into a valid answer envelope.
+    """
+
+
+def extract_json_object(text: str) -> Tuple[Optional[str], bool]:
+    """
+    Extract the first complete JSON object from text in a single pass, repairing it on the way.
+
+    Braces are balanced outside of strings, so text before or after the object
+    (code fences, explanations, a second object) is ignored. Outside strings,
+    trailing commas before `}` or `]` are dropped and the Python literals
+    True/False/None are rewritten as JSON. A missing closing brace at the end
+    of the text is added.
+
+    Parameters:
+        text (str): The raw model output.
+    Returns:
+        Tuple[Optional[str], bool]: The JSON text (None if there is no object) and whether it was repaired.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, False
+    out: List[str] = []
+    depth = 0
+    in_string = False
+    escaped = False
+    repaired = False
+    pending_comma = False   # a comma whose fate depends on the next significant character
+    i, n = start, len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+
+        if ch.isspace():
+            if not pending_comma:
+                out.append(ch)
+            i += 1
+            continue
+        if pending_comma:
+            pending_comma = False
+            if ch in "}]":
+                repaired = True
+            else:
+                out.append(",")
+        if ch == ",":
+            pending_comma = True
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            depth += 1
+            out.append(ch)
+        elif ch in "}]":
+            depth -= 1
+            out.append(ch)
+            if depth == 0:
+                return "".join(out), repaired
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if word in PYTHON_LITERALS:
+                word = PYTHON_LITERALS[word]
+                repaired = True
+            out.append(word)
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if in_string or depth <= 0:
+        return None, False
+    # Truncated reply: close the open containers (objects only; arrays are not expected here).
+    return "".join(out) + "}" * depth, True
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Remove a Markdown code fence (```json ... ```) around the reply, if any.
+
+    Parameters:
+        text (str): The raw model output.
+    Returns:
+        str: The text inside the fence, or the original text.
+    """
+    stripped = text.strip()
+    if not stripped.startswith("```"):
+        return text
+    body = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+    return body.rsplit("```", 1)[0]
+
+
+def validate_envelope(data: Any, categories: Optional[List[str]] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    Check an envelope against the INITIAL_PROMPT schema and normalize it.
+
+    `ready_to_filter` given as "true"/"false" is converted, a category is matched
+    to the closed list ignoring case and surrounding spaces, and a reply that is
+    ready without a known category is turned back into a clarification turn.
+
+    Parameters:
+        data (Any): The decoded JSON.
+        categories (Optional[List[str]]): The allowed categories (not checked if None).
+    Returns:
+        Tuple[Dict[str, Any], bool]: The envelope and whether it had to be corrected.
+    Raises:
+        AnswerParseError: If there is no usable Answer text.
+    """
+    if not isinstance(data, dict):
+        raise AnswerParseError(f"Expected a JSON object, got {type(data).__name__}")
+    answer = data.get("Answer")
+    if not isinstance(answer, str) or not answer.strip():
+        raise AnswerParseError("Missing or empty 'Answer'")
+
+    corrected = False
+    ready = data.get("ready_to_filter", False)
+    if isinstance(ready, str):
+        ready, corrected = ready.strip().lower() == "true", True
+    elif not isinstance(ready, bool):
+        ready, corrected = bool(ready), True
+
+    category = data.get("selected_category")
+    if isinstance(category, str) and category.strip().lower() in ("", "null", "none"):
+        category, corrected = None, True
+    if category is not None and categories is not None:
+        lookup = {name.strip().lower(): name for name in categories}
+        match = lookup.get(str(category).strip().lower())
+        if match is None:
+            print(f"WARNING: Model selected unknown category '{category}'")
+            category, corrected = None, True
+        elif match != category:
+            category, corrected = match, True
+    if ready and category is None:
+        ready, corrected = False, True
+    return {"Answer": answer, "ready_to_filter": ready, "selected_category": category}, corrected
+
+
+def parse_answer(text: str, categories: Optional[List[str]] = None) -> Tuple[Dict[str, Any], str]:
+    """
+    Parse a clarification reply into the answer envelope.
+
+    Parameters:
+        text (str): The raw model output.
+        categories (Optional[List[str]]): The allowed categories.
+    Returns:
+        Tuple[Dict[str, Any], str]: The envelope and the outcome: 'ok', 'repaired' (fixed JSON or schema
+        corrections) or 'plain_text' (no JSON at all; the text is used as the Answer of a clarification turn).
+    Raises:
+        AnswerParseError: If the reply contains JSON that cannot be used, or is empty.
+    """
+    text = text or ""
+    unfenced = strip_code_fence(text)
+    json_text, repaired = extract_json_object(unfenced)
+    if json_text is None:
+        if "{" in unfenced or not unfenced.strip():
+            raise AnswerParseError(f"No complete JSON object in model output: {text[:200]!r}")
+        return {"Answer": unfenced.strip(), "ready_to_filter": False, "selected_category": None}, "plain_text"
+    try:
+        data = json.loads(json_text)
+    except json.JSONDecodeError as e:
+        raise AnswerParseError(f"Invalid JSON in model output ({e}): {json_text[:200]!r}") from e
+    envelope, corrected = validate_envelope(data, categories)
+    return envelope, "repaired" if repaired or corrected or unfenced is not text else "ok"
@@ -0,0 +1,107 @@
+"""
+Compare catalog serialization formats for the recommendation prompt.
+
+Run from the backend directory:
+    python -m benchmarks.bench_catalog_format --repeat 200
+
+Reports characters, tokens and render time per format for every category.
+Tokens are counted with tiktoken (cl100k_base) when it is installed, otherwise
+with a word/punctuation approximation. Results are printed and saved as JSON
+under benchmarks/results/ (tagged with the git commit).
+"""
+import argparse
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from benchmarks.load_test import RESULTS_DIR, git_commit
+from data_handler import get_categories, get_product_keys, get_products_by_category
+from catalog_serializer import SERIALIZERS, render_category, render_products
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+    TOKENIZER = "tiktoken/cl100k_base"
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return len(re.findall(r"\w+|[^\w\s]", text))
+    TOKENIZER = "approximate"
+
+
+def time_call(fn, repeat: int = 200) -> float:
+    """
+    Average the run time of a function.
+
+    Parameters:
+        fn (Callable): The function to time.
+        repeat (int): Number of runs.
+    Returns:
+        float: Average microseconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def render_uncached(serializer, products) -> str:
+    """
+    Render products without the row cache.
+
+    Parameters:
+        serializer (CatalogSerializer): The serializer.
+        products (List[Dict]): The products.
+    Returns:
+        str: The rendered product block.
+    """
+    keys = get_product_keys()
+    header = serializer.header(keys)
+    rows = [serializer.row(p, keys) for p in products]
+    return "\n".join(([header] if header is not None else []) + rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare catalog serialization formats for the recommendation prompt.")
+    parser.add_argument("--formats", default=",".join(SERIALIZERS),
+                        help=f"Comma-separated formats to compare (default: {','.join(SERIALIZERS)}).")
+    parser.add_argument("--repeat", type=int, default=200, help="Renders timed per category and format.")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in SERIALIZERS]
+    if unknown:
+        raise SystemExit(f"Unknown formats {unknown}, expected some of {list(SERIALIZERS)}")
+
+    results = {"benchmark": "bench_catalog_format", "commit": git_commit(), "timestamp": datetime.now().isoformat(),
+               "tokenizer": TOKENIZER, "repeat": args.repeat, "formats": {}}
+    for fmt in formats:
+        totals = {"chars": 0, "tokens": 0, "uncached_render_us": 0.0, "cached_render_us": 0.0}
+        for category in get_categories():
+            products = get_products_by_category(category)
+            text = render_category(category, fmt)
+            totals["chars"] += len(text)
+            totals["tokens"] += count_tokens(text)
+            totals["uncached_render_us"] += time_call(lambda: render_uncached(SERIALIZERS[fmt], products), args.repeat)
+            totals["cached_render_us"] += time_call(lambda: render_products(products, fmt), args.repeat)
+        results["formats"][fmt] = {key: round(value, 1) for key, value in totals.items()}
+
+    base = results["formats"].get("repr")
+    if base:
+        for fmt, totals in results["formats"].items():
+            totals["token_saving_percent"] = round((1 - totals["tokens"] / base["tokens"]) * 100, 1)
+
+    output = args.output or RESULTS_DIR / f"bench_catalog_format_{results['commit']}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["formats"], indent=2))
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Measure BM25 catalog search latency against catalog size.
+
+Run from the backend directory:
+    python -m benchmarks.bench_catalog_search --sizes 100,1000,10000,100000
+
+Synthetic catalogs are generated from the real one: every product gets a real
+Family, CPU and GPU, a numbered Name and a Description shuffled from real
+description words. Category lists are sampled in proportion. Reports index build
+time, index size and p50/p95 query latency per size, together with a plain
+Python scoring loop over the same postings for comparison.
+"""
+import argparse
+import json
+import math
+import random
+import time
+import numpy as np
+from catalog_search import CatalogSearchIndex
+from data_handler import get_catalog_snapshot
+from intent_classifier import tokenize
+
+QUERIES = [
+    "- Gaming laptop\n- High refresh display\n- RTX graphics",
+    "- 4K video editing and 3D rendering\n- Prefers macOS",
+    "- Lightweight laptop for business travel\n- Long battery life",
+    "- CAD and simulation workstation\n- Needs ISV certification\n- Budget under $6000",
+    "- 2-in-1 for note-taking and sketching",
+    "- Machine learning prototyping\n- NVIDIA GPU with lots of memory",
+]
+
+
+def synthetic_catalog(size: int, rng: random.Random):
+    """
+    Generate a catalog of the given size from the real products.
+
+    Parameters:
+        size (int): Number of products.
+        rng (random.Random): Random source.
+    Returns:
+        tuple: (products (List[Dict]), category_map (Dict[str, List[str]]))
+    """
+    snapshot = get_catalog_snapshot()
+    base = snapshot.products
+    words = [word for p in base for word in p["Description"].rstrip(".").split()]
+    products = []
+    for i in range(size):
+        template = base[i % len(base)]
+        products.append({
+            "SKU": f"{template['SKU']}-{i}",
+            "Vendor": template["Vendor"],
+            "Family": template["Family"],
+            "Name": f"{template['Family']} {rng.randint(100, 9999)}",
+            "Description": " ".join(rng.sample(words, rng.randint(6, 14))) + ".",
+            "CPU": rng.choice(base)["CPU"],
+            "GPU": rng.choice(base)["GPU"],
+        })
+    share = {category: len(skus) / len(base) for category, skus in snapshot.category_map.items()}
+    category_map = {category: [p["SKU"] for p in rng.sample(products, max(1, int(size * fraction)))]
+                    for category, fraction in share.items()}
+    return products, category_map
+
+
+def naive_scores(index: CatalogSearchIndex, query: str) -> list:
+    """
+    Score every product with a per-posting Python loop (the reference for the vectorized path).
+
+    Parameters:
+        index (CatalogSearchIndex): The index.
+        query (str): The query text.
+    Returns:
+        list: Score per row.
+    """
+    scores = [0.0] * len(index)
+    for term in set(tokenize(query)):
+        t = index.vocabulary.get(term)
+        if t is None:
+            continue
+        idf = float(index.idf[t])
+        for position in range(index.offsets[t], index.offsets[t + 1]):
+            row = int(index.doc_ids[position])
+            tf = float(index.term_freqs[position])
+            scores[row] += idf * tf * (index.k1 + 1) / (tf + float(index.length_norm[row]))
+    return scores
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def bench_size(size: int, repeat: int, rng: random.Random) -> dict:
+    """
+    Build an index over a synthetic catalog and time queries against it.
+
+    Parameters:
+        size (int): Catalog size.
+        repeat (int): Runs per query.
+        rng (random.Random): Random source.
+    Returns:
+        dict: Build time, index size and latency figures in milliseconds.
+    """
+    products, category_map = synthetic_catalog(size, rng)
+    start = time.perf_counter()
+    index = CatalogSearchIndex(products, category_map)
+    build_ms = (time.perf_counter() - start) * 1000
+    index_bytes = sum(array.nbytes for array in (index.offsets, index.doc_ids, index.term_freqs,
+                                                  index.idf, index.length_norm))
+
+    latencies, naive_latencies = [], []
+    categories = list(category_map)
+    for i in range(repeat):
+        for j, query in enumerate(QUERIES):
+            start = time.perf_counter()
+            index.search(query, 8, categories[(i + j) % len(categories)])
+            latencies.append((time.perf_counter() - start) * 1000)
+    naive_runs = max(1, repeat // 10)
+    for _ in range(naive_runs):
+        for query in QUERIES:
+            start = time.perf_counter()
+            naive_scores(index, query)
+            naive_latencies.append((time.perf_counter() - start) * 1000)
+
+    # The vectorized scores must match the reference loop.
+    assert np.allclose(index.scores(QUERIES[0]), naive_scores(index, QUERIES[0]), rtol=1e-4, atol=1e-5)
+    return {"products": size, "terms": len(index.vocabulary), "postings": len(index.doc_ids),
+            "build_ms": round(build_ms, 1), "index_kb": round(index_bytes / 1024, 1),
+            "query_p50_ms": round(percentile(latencies, 0.5), 3),
+            "query_p95_ms": round(percentile(latencies, 0.95), 3),
+            "naive_scoring_p50_ms": round(percentile(naive_latencies, 0.5), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 catalog search against catalog size.")
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per query and size.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    results = [bench_size(int(size), args.repeat, rng) for size in args.sizes.split(",")]
+    print(json.dumps({"queries": len(QUERIES), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
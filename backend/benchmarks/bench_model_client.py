@@ -0,0 +1,91 @@
+"""
+Benchmark the pooled async model client against the local stub server.
+
+Run from the backend directory:
+    python -m benchmarks.bench_model_client --calls 200 --concurrency 50 --latency 0.2
+
+The stub is started in a subprocess; with a non-blocking client the wall time
+should be close to (calls / concurrency) * latency.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10.0):
+    """
+    Block until a TCP port accepts connections.
+
+    Parameters:
+        host (str): Host name.
+        port (int): Port number.
+        timeout (float): Maximum seconds to wait.
+    Returns:
+        None
+    """
+    import socket
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stub server did not start on {host}:{port}")
+
+
+async def run(calls: int, concurrency: int):
+    # Import after LLM_API_URL is set so the client targets the stub.
+    from model import send_to_model, close_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_call(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await send_to_model(f"benchmark prompt {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(calls)))
+    wall = time.perf_counter() - start
+    await close_client()
+
+    latencies.sort()
+    return {
+        "calls": calls,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "calls_per_second": round(calls / wall, 1),
+        "p50_seconds": round(statistics.median(latencies), 4),
+        "p95_seconds": round(latencies[int(len(latencies) * 0.95) - 1], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the async model client.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub response delay in seconds.")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_llm_server",
+                             "--port", str(args.port), "--latency", str(args.latency)])
+    try:
+        wait_for_port("127.0.0.1", args.port)
+        os.environ["LLM_API_URL"] = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+        os.environ.setdefault("GROQ_API_KEY", "benchmark")
+        print(asyncio.run(run(args.calls, args.concurrency)))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Measure the memory and log bytes taken by monitoring logs.
+
+Run from the backend directory:
+    python -m benchmarks.bench_monitoring_log --sessions 2000
+
+The logged sessions (db/conversations_log.jsonl by default) are rebuilt through
+`Chat` with the current prompts and catalog, cycling through the log until
+`--sessions` sessions exist. Two representations of the same monitoring logs
+are compared:
+- expanded: one dict per entry with every prompt rendered into its own string
+  (the format before prompts were kept by reference, and still the format of
+  `Chat.get_monitoring_log()`).
+- compact: `LogEntry` objects with prompts as template and parameters and
+  the long texts interned (what `Chat` keeps now).
+
+Memory per live session is measured with tracemalloc; bytes per logged session
+compare the expanded JSON line with the compact line plus the texts file bytes
+it adds (texts already written by earlier sessions add nothing). Results are
+printed and saved as JSON under benchmarks/results/ (tagged with the git commit).
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from benchmarks.load_test import BACKEND_DIR, RESULTS_DIR, git_commit
+from benchmarks.replay import RECOMMENDATION_MARKER, iter_model_calls, read_logs, session_outcome
+from chat import Chat
+from data_handler import get_categories
+from monitoring_log import TextStore, expand_log, interned_count
+from prompts import conversation_summary_prompt, get_initial_prompt, recommendation_prompt
+from recommendations import recommendation_params
+
+
+def fresh(text: str) -> str:
+    # A copy of the text in its own string object, as a live session would have.
+    return text.encode("utf-8").decode("utf-8")
+
+
+def rebuild_chat(log: Dict[str, Any]) -> Chat:
+    """
+    Rebuild a logged session's monitoring log through `Chat`, with the current prompts.
+
+    Summary prompts are rendered from the session's messages so far and
+    recommendation prompts from its latest summary and its chosen category.
+
+    Parameters:
+        log (Dict[str, Any]): The logged session (expanded).
+    Returns:
+        Chat: The chat session.
+    """
+    history = log.get("conversation_history") or []
+    category = session_outcome(history)["category"]
+    if category not in get_categories():
+        category = get_categories()[0]
+    stages = {id(entry): stage for _, stage, entry in iter_model_calls(history)}
+    chat = Chat(get_initial_prompt())
+    lines: List[str] = []
+    summary = ""
+    for entry in history[1:]:
+        role, content = entry.get("role"), fresh(entry.get("content") or "")
+        extra = {key: value for key, value in entry.items() if key not in ("role", "content", "latency_seconds")}
+        if role == "system" and extra.get("stage") != "intent":
+            if RECOMMENDATION_MARKER in content:
+                chat.add_monitoring_prompt(recommendation_prompt, **recommendation_params(summary, category))
+            else:
+                chat.add_monitoring_prompt(conversation_summary_prompt, chat_history="\n".join(lines))
+            continue
+        chat.add_monitoring_log(role, content, entry.get("latency_seconds") or 0.0, **extra)
+        stage = stages.get(id(entry))
+        if role == "user" or stage == "clarification":
+            lines.append(f"{role}: {content}")
+        elif stage == "summary":
+            summary = content
+    return chat
+
+
+def traced_bytes(build) -> int:
+    """
+    Measure the memory still allocated after building something.
+
+    Parameters:
+        build (Callable[[], Any]): Builds and returns the object to keep.
+    Returns:
+        int: Bytes allocated by the kept object.
+    """
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure monitoring log memory and logged bytes per session.")
+    parser.add_argument("--log", type=Path, default=BACKEND_DIR / "db" / "conversations_log.jsonl")
+    parser.add_argument("--sessions", type=int, default=2000, help="Sessions to build (cycling through the log).")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    logs = list(read_logs(args.log))
+    if not logs:
+        raise SystemExit(f"No sessions in {args.log}")
+    sources = [logs[i % len(logs)] for i in range(args.sessions)]
+    rebuild_chat(logs[0])  # fill the catalog, prompt and fragment caches outside the measurements
+
+    expanded_bytes = traced_bytes(lambda: [rebuild_chat(log).get_monitoring_log() for log in sources])
+    compact_bytes = traced_bytes(lambda: [rebuild_chat(log).monitoring_log for log in sources])
+
+    chats = [rebuild_chat(log) for log in sources]
+    text_store = TextStore(Path(tempfile.mkdtemp(prefix="bench_monitoring_log_")) / "log.texts.jsonl")
+    expanded_line_bytes = compact_line_bytes = texts_bytes = 0
+    log_seconds = expand_seconds = 0.0
+    for chat in chats:
+        start = time.perf_counter()
+        entry = chat.log_conversation()
+        log_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        expanded = expand_log(entry)
+        expand_seconds += time.perf_counter() - start
+        expanded_line_bytes += len((json.dumps(expanded, ensure_ascii=False) + "\n").encode("utf-8"))
+        texts_bytes += text_store.write(entry.pop("texts"))
+        compact_line_bytes += len((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    n = len(chats)
+    results = {"benchmark": "bench_monitoring_log", "commit": git_commit(), "timestamp": datetime.now().isoformat(),
+               "sessions": n, "logged_sessions": len(logs), "interned_texts": interned_count(),
+               "memory_per_session": {"expanded_bytes": round(expanded_bytes / n), "compact_bytes": round(compact_bytes / n),
+                                      "reduction_percent": round((1 - compact_bytes / expanded_bytes) * 100, 1)},
+               "log_bytes_per_session": {"expanded_bytes": round(expanded_line_bytes / n),
+                                         "compact_line_bytes": round(compact_line_bytes / n),
+                                         "texts_file_bytes": round(texts_bytes / n, 1),
+                                         "reduction_percent": round((1 - (compact_line_bytes + texts_bytes)
+                                                                     / expanded_line_bytes) * 100, 1)},
+               "log_conversation_us": round(log_seconds / n * 1e6, 1),
+               "expand_us": round(expand_seconds / n * 1e6, 1)}
+
+    output = args.output or RESULTS_DIR / f"bench_monitoring_log_{results['commit']}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    memory, logged = results["memory_per_session"], results["log_bytes_per_session"]
+    print(f"{n} sessions rebuilt from {len(logs)} logged sessions, {results['interned_texts']} interned texts")
+    print(f"memory per session:  expanded {memory['expanded_bytes']} B, compact {memory['compact_bytes']} B "
+          f"(-{memory['reduction_percent']}%)")
+    print(f"log bytes per session: expanded {logged['expanded_bytes']} B, compact {logged['compact_line_bytes']} B "
+          f"+ {logged['texts_file_bytes']} B texts (-{logged['reduction_percent']}%)")
+    print(f"log_conversation {results['log_conversation_us']} us, expand {results['expand_us']} us per session")
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
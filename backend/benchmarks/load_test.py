@@ -0,0 +1,325 @@
+"""
+Load-test the backend end to end against the local LLM stub.
+
+Run from the backend directory:
+    python -m benchmarks.load_test --shoppers 200 --concurrency 50 --latency 0.3 --latency-dist lognormal
+
+The stub and the backend (uvicorn) are started in subprocesses; the backend
+logs to a temporary directory so the real conversation log is untouched.
+Simulated shoppers open a session, chat until they get a recommendation,
+send feedback, close the session and occasionally poll /logs. Event loop lag
+is sampled from the backend's /metrics while the test runs.
+
+Results (req/s and p50/p95/p99 per endpoint, loop lag, configuration and git
+commit) are printed and saved as JSON under benchmarks/results/ for comparing
+runs across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+import httpx
+from benchmarks.bench_model_client import wait_for_port
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SHOPPER_SCRIPTS = [
+    ["Hi, I need a new laptop", "Mostly video editing and some gaming", "Budget around $2500 with 32GB RAM",
+     "I prefer Windows"],
+    ["Looking for something for work travel", "It should be light with long battery life", "Under $1800 please"],
+    ["I want a desktop workstation", "For 3D rendering and simulations", "I need a strong NVIDIA GPU",
+     "Budget is flexible"],
+    ["Something for my kid's school work", "Cheap and durable", "Under $900"],
+    ["I'm a developer", "I run many containers, 64GB RAM would be nice", "macOS or Linux friendly"],
+]
+LAG_RE = re.compile(r"^event_loop_lag_seconds (\S+)$", re.MULTILINE)
+PARSE_OUTCOME_RE = re.compile(r'^model_answer_parses_total\{stage="clarification",outcome="(\w+)"\} (\S+)$',
+                              re.MULTILINE)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Parameters:
+        values (List[float]): Sorted values.
+        q (float): Percentile in [0, 100].
+    Returns:
+        float: The percentile (0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies in milliseconds.
+
+    Parameters:
+        latencies (List[float]): Latencies in seconds.
+    Returns:
+        Dict[str, float]: mean, p50, p95, p99 and max in milliseconds.
+    """
+    values = sorted(latencies)
+    return {
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0,
+    }
+
+
+class LoadTest:
+    """
+    Drives simulated shoppers against a running backend and records per-request latency.
+
+    Attributes:
+        base_url (str): The backend URL.
+        concurrency (int): Maximum shoppers in flight.
+        max_turns (int): Chat turns per shopper before giving up on a recommendation.
+        logs_ratio (float): Probability that a shopper polls /logs after its session.
+    """
+
+    def __init__(self, base_url: str, concurrency: int, max_turns: int, logs_ratio: float, seed: int = None):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.max_turns = max_turns
+        self.logs_ratio = logs_ratio
+        self.rng = random.Random(seed)
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.lag_samples: List[float] = []
+        self.recommendations = 0
+        self.parse_outcomes: Dict[str, int] = {}
+        self._etag = None
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send one request and record its latency under the endpoint path.
+
+        Returns:
+            httpx.Response: The response (None if the request itself failed).
+        """
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.samples.setdefault(path, []).append(time.perf_counter() - start)
+        if response is None or response.status_code >= 400:
+            self.errors[path] = self.errors.get(path, 0) + 1
+        return response
+
+    async def shopper(self, client: httpx.AsyncClient, index: int):
+        """
+        Run one simulated shopping session.
+        """
+        script = SHOPPER_SCRIPTS[index % len(SHOPPER_SCRIPTS)]
+        response = await self.request(client, "POST", "/new_chat")
+        session_id = response.json()["session_id"] if response is not None and response.is_success else None
+        for turn in range(self.max_turns):
+            text = script[turn % len(script)]
+            response = await self.request(client, "POST", "/chat", json={"text": text, "session_id": session_id})
+            if response is None or not response.is_success:
+                continue
+            data = response.json()
+            session_id = data["session_id"]
+            if data["is_recommendation"]:
+                self.recommendations += 1
+                break
+        feedback = self.rng.choice(["positive", "positive", "negative", "none"])
+        await self.request(client, "POST", "/feedback", json={"feedback": feedback, "session_id": session_id})
+        await self.request(client, "POST", "/new_chat", json={"session_id": session_id})
+        if self.rng.random() < self.logs_ratio:
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            response = await self.request(client, "GET", "/logs", headers=headers)
+            if response is not None and response.status_code == 200:
+                self._etag = response.headers.get("etag")
+
+    async def sample_loop_lag(self, client: httpx.AsyncClient, interval: float):
+        """
+        Poll the backend's event loop lag gauge until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                response = await client.get("/metrics")
+                match = LAG_RE.search(response.text)
+                if match:
+                    self.lag_samples.append(float(match.group(1)))
+            except httpx.HTTPError:
+                pass
+
+    async def run(self, shoppers: int, lag_interval: float) -> float:
+        """
+        Run all shoppers.
+
+        Parameters:
+            shoppers (int): Number of shopping sessions.
+            lag_interval (float): Seconds between loop lag samples.
+        Returns:
+            float: Wall time in seconds.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency + 1)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=120) as client:
+            async def bounded(i: int):
+                async with semaphore:
+                    await self.shopper(client, i)
+
+            async with httpx.AsyncClient(base_url=self.base_url, timeout=10) as metrics_client:
+                sampler = asyncio.create_task(self.sample_loop_lag(metrics_client, lag_interval))
+                start = time.perf_counter()
+                await asyncio.gather(*(bounded(i) for i in range(shoppers)))
+                wall = time.perf_counter() - start
+                sampler.cancel()
+                response = await metrics_client.get("/metrics")
+                self.parse_outcomes = {outcome: int(float(value))
+                                       for outcome, value in PARSE_OUTCOME_RE.findall(response.text)}
+        return wall
+
+    def report(self, wall: float) -> Dict[str, Any]:
+        """
+        Build the results document.
+
+        Parameters:
+            wall (float): Wall time in seconds.
+        Returns:
+            Dict[str, Any]: Throughput, latency percentiles per endpoint and loop lag.
+        """
+        total = sum(len(v) for v in self.samples.values())
+        lag = sorted(self.lag_samples)
+        return {
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "wall_seconds": round(wall, 3),
+            "requests_per_second": round(total / wall, 1) if wall else 0,
+            "recommendations": self.recommendations,
+            "all_requests": summarize([x for v in self.samples.values() for x in v]),
+            "endpoints": {path: {"count": len(values), "errors": self.errors.get(path, 0), **summarize(values)}
+                          for path, values in sorted(self.samples.items())},
+            "answer_parses": {**self.parse_outcomes,
+                              "failure_rate": round(self.parse_outcomes.get("failed", 0)
+                                                    / max(sum(self.parse_outcomes.values()), 1), 4)},
+            "event_loop_lag": {
+                "samples": len(lag),
+                "mean_ms": round(sum(lag) / len(lag) * 1000, 3) if lag else 0,
+                "p95_ms": round(percentile(lag, 95) * 1000, 3),
+                "max_ms": round(lag[-1] * 1000, 3) if lag else 0,
+            },
+        }
+
+
+def git_commit() -> str:
+    """
+    Get the current git commit, if available.
+
+    Returns:
+        str: The short commit hash, or "unknown".
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the backend against the local LLM stub.")
+    parser.add_argument("--shoppers", type=int, default=100, help="Number of shopping sessions.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Shoppers in flight.")
+    parser.add_argument("--max-turns", type=int, default=6, help="Chat turns per shopper.")
+    parser.add_argument("--logs-ratio", type=float, default=0.2, help="Probability of polling /logs per shopper.")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean stub latency in seconds.")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--jitter", type=float, default=0.5, help="Spread of the stub latency distribution.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail.")
+    parser.add_argument("--error-status", default="500,503,429", help="Stub error status codes.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of stub JSON envelopes that are malformed.")
+    parser.add_argument("--turns-to-ready", type=int, default=3, help="User turns before the stub selects a category.")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--port", type=int, default=8100, help="Backend port.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Backend worker processes (use with --env SESSION_BACKEND=sqlite or redis).")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None, help="Results file (default benchmarks/results/...).")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra backend environment variable (repeatable).")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="load_test_"))
+    env = {**os.environ,
+           "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "benchmark"),
+           "LLM_API_URL": f"http://127.0.0.1:{args.stub_port}/v1/chat/completions",
+           "CONVERSATION_LOG_PATH": str(workdir / "conversations_log.jsonl"),
+           "CONVERSATION_DB_PATH": str(workdir / "conversations.db"),
+           "SESSION_DB_PATH": str(workdir / "sessions.db"),
+           "LLM_CACHE_DB": "",
+           "CATALOG_RELOAD_INTERVAL_SECONDS": "0",
+           "EVENT_LOOP_LAG_INTERVAL_SECONDS": "0.1"}
+    env.update(item.split("=", 1) for item in args.env)
+
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_llm_server", "--port", str(args.stub_port),
+                             "--latency", str(args.latency), "--latency-dist", args.latency_dist,
+                             "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+                             "--error-status", args.error_status, "--turns-to-ready", str(args.turns_to_ready),
+                             "--seed", str(args.seed), "--malformed-rate", str(args.malformed_rate)],
+                            cwd=BACKEND_DIR)
+    server_log = open(workdir / "backend.log", "w")
+    backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                "--workers", str(args.workers), "--log-level", "warning"], cwd=BACKEND_DIR, env=env,
+                               stdout=server_log, stderr=subprocess.STDOUT)
+    try:
+        wait_for_port("127.0.0.1", args.stub_port)
+        wait_for_port("127.0.0.1", args.port, timeout=30)
+        test = LoadTest(f"http://127.0.0.1:{args.port}", args.concurrency, args.max_turns, args.logs_ratio,
+                        args.seed)
+        wall = asyncio.run(test.run(args.shoppers, lag_interval=0.2))
+        results = {
+            "benchmark": "load_test",
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output",)},
+            "results": test.report(wall),
+        }
+    finally:
+        backend.terminate()
+        backend.wait()
+        stub.terminate()
+        stub.wait()
+        server_log.close()
+
+    output = args.output or RESULTS_DIR / f"load_test_{results['commit']}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    r = results["results"]
+    print(f"{r['requests']} requests in {r['wall_seconds']}s ({r['requests_per_second']} req/s), "
+          f"{r['errors']} errors, {r['recommendations']} recommendations")
+    print(f"{'endpoint':<12} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for path, s in r["endpoints"].items():
+        print(f"{path:<12} {s['count']:>6} {s['errors']:>6} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+    lag = r["event_loop_lag"]
+    print(f"event loop lag: mean {lag['mean_ms']} ms, p95 {lag['p95_ms']} ms, max {lag['max_ms']} ms")
+    print(f"answer parses: {r['answer_parses']}")
+    print(f"Results saved to {output} (backend output in {workdir})")
+
+
+if __name__ == "__main__":
+    main()
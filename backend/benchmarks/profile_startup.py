@@ -0,0 +1,169 @@
+"""
+Profile the backend's cold start.
+
+Run from the backend directory:
+    python -m benchmarks.profile_startup
+
+Two measurements, each in a fresh interpreter:
+1. Import time of `main`, from `python -X importtime`, broken down per module:
+   the backend's own modules and the third-party packages they pull in, with
+   self and cumulative times.
+2. Time from launching uvicorn until the port accepts connections and until
+   /ready reports the warm-up as finished, with the duration of each warm-up step.
+
+Results are printed and saved as JSON under benchmarks/results/ (tagged with
+the git commit) so cold starts can be compared across commits.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+import httpx
+from benchmarks.load_test import BACKEND_DIR, RESULTS_DIR, git_commit
+
+IMPORT_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+WORKDIR = Path(tempfile.mkdtemp(prefix="profile_startup_"))
+
+
+def backend_env() -> Dict[str, str]:
+    """
+    Environment for a throwaway backend process (no real API key or log files needed).
+
+    Returns:
+        Dict[str, str]: The environment.
+    """
+    return {**os.environ,
+            "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "benchmark"),
+            "LLM_CACHE_DB": "",
+            "CATALOG_RELOAD_INTERVAL_SECONDS": "0",
+            "CONVERSATION_LOG_PATH": str(WORKDIR / "conversations_log.jsonl")}
+
+
+def import_profile(module: str = "main") -> List[Dict[str, Any]]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Parameters:
+        module (str): The module to import.
+    Returns:
+        List[Dict[str, Any]]: One entry per imported module: name, depth, self_ms and cumulative_ms.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR,
+                            env=backend_env(), capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({"name": name, "depth": len(indent) // 2,
+                            "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return entries
+
+
+def breakdown(entries: List[Dict[str, Any]], top: int) -> Dict[str, Any]:
+    """
+    Summarize an import profile.
+
+    Parameters:
+        entries (List[Dict[str, Any]]): The output of `import_profile`.
+        top (int): Number of third-party packages to list.
+    Returns:
+        Dict[str, Any]: Total import time, the backend modules, and the heaviest third-party packages
+        (self time summed over each top-level package).
+    """
+    local_modules = {path.stem for path in BACKEND_DIR.glob("*.py")}
+    total = max((e["cumulative_ms"] for e in entries if e["depth"] == 0 and e["name"] == "main"), default=0.0)
+    local = sorted(({"module": e["name"], "self_ms": round(e["self_ms"], 2),
+                     "cumulative_ms": round(e["cumulative_ms"], 2)}
+                    for e in entries if e["name"] in local_modules),
+                   key=lambda e: -e["cumulative_ms"])
+    packages: Dict[str, float] = {}
+    for e in entries:
+        package = e["name"].split(".")[0]
+        if package not in local_modules:
+            packages[package] = packages.get(package, 0.0) + e["self_ms"]
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {"total_ms": round(total, 2), "backend_modules": local,
+            "third_party_packages": [{"package": name, "self_ms": round(ms, 2)} for name, ms in heaviest]}
+
+
+def time_to_ready(port: int, timeout: float = 60.0) -> Dict[str, Any]:
+    """
+    Launch uvicorn and time the port opening and the /ready endpoint turning 200.
+
+    Parameters:
+        port (int): Port for the backend.
+        timeout (float): Seconds to wait for readiness.
+    Returns:
+        Dict[str, Any]: listening_seconds, ready_seconds and the warm-up steps.
+    """
+    start = time.perf_counter()
+    backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                "--log-level", "warning"], cwd=BACKEND_DIR, env=backend_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    response = client.get("/ready")
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                if listening is None:
+                    listening = time.perf_counter() - start
+                if response.status_code == 200:
+                    status = response.json()
+                    return {"listening_seconds": round(listening, 3),
+                            "ready_seconds": round(time.perf_counter() - start, 3),
+                            "warmup_seconds": status["elapsed_seconds"],
+                            "warmup_steps": {step["name"]: step["seconds"] for step in status["steps"]}}
+                time.sleep(0.01)
+        raise TimeoutError(f"Backend was not ready within {timeout}s")
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile backend import time and time to readiness.")
+    parser.add_argument("--port", type=int, default=8150)
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts to measure (the median run is reported).")
+    parser.add_argument("--top", type=int, default=12, help="Third-party packages to list.")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    profiles = [breakdown(import_profile(), args.top) for _ in range(args.runs)]
+    imports = sorted(profiles, key=lambda p: p["total_ms"])[len(profiles) // 2]
+    starts = sorted((time_to_ready(args.port) for _ in range(args.runs)), key=lambda r: r["ready_seconds"])
+    results = {"benchmark": "profile_startup", "commit": git_commit(), "timestamp": datetime.now().isoformat(),
+               "imports": imports, "startup": starts[len(starts) // 2],
+               "import_totals_ms": [p["total_ms"] for p in profiles]}
+
+    output = args.output or RESULTS_DIR / f"profile_startup_{results['commit']}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"import main: {imports['total_ms']} ms (runs: {results['import_totals_ms']})")
+    print(f"{'backend module':<24} {'self ms':>9} {'cumul. ms':>10}")
+    for e in imports["backend_modules"]:
+        print(f"{e['module']:<24} {e['self_ms']:>9} {e['cumulative_ms']:>10}")
+    print(f"{'third-party package':<24} {'self ms':>9}")
+    for e in imports["third_party_packages"]:
+        print(f"{e['package']:<24} {e['self_ms']:>9}")
+    start = results["startup"]
+    print(f"listening after {start['listening_seconds']}s, ready after {start['ready_seconds']}s "
+          f"(warm-up {start['warmup_seconds']}s: {start['warmup_steps']})")
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
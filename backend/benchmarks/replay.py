@@ -0,0 +1,526 @@
+"""
+Replay logged conversations through the /chat pipeline and compare the outcomes.
+
+Run from the backend directory:
+    python -m benchmarks.replay --log db/conversations_log.jsonl --concurrency 8
+
+Every logged session's user turns are sent to /chat again, in-process (the
+FastAPI app behind an ASGI transport), with the model replaced by one of:
+- recorded: each call is answered with the reply the session recorded for the
+  same stage and turn, after the recorded latency (scaled by --time-scale).
+  Calls the original session did not make get a synthesized reply
+  (counted as "synthesized" in the report).
+- stub: replies from the load-test stub (benchmarks/stub_llm_server.py) with
+  its latency model.
+
+The log (JSONL, or a conversation store .db) is read lazily and sessions run
+in parallel. For each session the original and the replayed monitoring logs are
+reduced to the same outcome: model calls and latencies per stage, the user turn
+of the first recommendation and the category chosen. The report compares them
+and lists the sessions whose outcome changed. It is printed and saved as JSON
+under benchmarks/results/ (tagged with the git commit).
+
+The replay writes its conversation log to a temporary directory and disables
+the response cache and request coalescing, so sessions never share answers.
+Backend settings under test can be passed with --env NAME=VALUE
+(e.g. --env INTENT_CLASSIFIER_ENABLED=0).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import httpx
+from answer_parser import AnswerParseError, parse_answer
+from benchmarks.load_test import BACKEND_DIR, RESULTS_DIR, git_commit, summarize
+from benchmarks.stub_llm_server import LatencyModel, build_reply, stub_usage
+from monitoring_log import TextStore, expand_log, texts_path
+
+# Marker that tells recommendation prompts from summary prompts (in old logs without a stage field, too):
+RECOMMENDATION_MARKER = "Recommendation Assistant"
+STAGES = ["clarification", "summary", "recommendation"]
+
+# Backend settings for replays (before --env overrides): no shared answers between sessions, no catalog watcher.
+REPLAY_ENV = {
+    "LLM_SINGLE_FLIGHT_ENABLED": "0",
+    "LLM_CACHE_MAX_MB": "0",
+    "LLM_CACHE_DB": "",
+    "SESSION_BACKEND": "memory",
+    "LOG_BACKEND": "jsonl",
+    "CATALOG_RELOAD_INTERVAL_SECONDS": "0",
+}
+
+CURRENT_SESSION: ContextVar[Optional["RecordedSession"]] = ContextVar("replay_session", default=None)
+
+
+def read_logs(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream conversation log entries from a JSONL log or a SQLite conversation store,
+    with prompts stored by reference expanded.
+
+    Parameters:
+        path (Path): The log file (.jsonl) or database (.db).
+    Returns:
+        Iterator[Dict[str, Any]]: Log entries, one at a time.
+    """
+    if path.suffix == ".db":
+        from conversation_store import SQLiteConversationStore
+        store = SQLiteConversationStore(path)
+        try:
+            yield from store.iter_logs()
+        finally:
+            store.close()
+        return
+    texts = TextStore(texts_path(path)).load()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield expand_log(json.loads(line), texts)
+
+
+def iter_model_calls(history: List[Dict[str, Any]]) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    """
+    Walk a monitoring log and yield its model calls and intent decisions.
+
+    The stage is taken from the entry, or for logs written before entries had
+    one, inferred from the prompt logged just before the reply.
+
+    Parameters:
+        history (List[Dict[str, Any]]): The session's monitoring log.
+    Returns:
+        Iterator[Tuple[int, str, Dict[str, Any]]]: (user turn, stage, entry), with stage 'clarification',
+        'summary', 'recommendation' or 'intent'.
+    """
+    turn = 0
+    previous = None
+    for position, entry in enumerate(history):
+        role = entry.get("role")
+        if role == "user":
+            turn += 1
+        elif role == "assistant":
+            stage = entry.get("stage")
+            if stage is None:
+                if position > 1 and previous is not None and previous.get("role") == "system":
+                    stage = "recommendation" if RECOMMENDATION_MARKER in (previous.get("content") or "") else "summary"
+                else:
+                    stage = "clarification"
+            yield turn, stage, entry
+        elif role == "system" and entry.get("stage") == "intent":
+            yield turn, "intent", entry
+        previous = entry
+
+
+def clarification_category(entry: Dict[str, Any]) -> Optional[str]:
+    """
+    Get the category a clarification reply selected, if it was ready to filter.
+
+    Parameters:
+        entry (Dict[str, Any]): The clarification entry.
+    Returns:
+        Optional[str]: The category, or None.
+    """
+    try:
+        envelope, _ = parse_answer(entry.get("content") or "")
+    except AnswerParseError:
+        return None
+    return envelope["selected_category"] if envelope["ready_to_filter"] else None
+
+
+def session_outcome(history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Reduce a monitoring log to the outcome compared by the replay.
+
+    Parameters:
+        history (List[Dict[str, Any]]): The session's monitoring log.
+    Returns:
+        Dict[str, Any]: user_turns, ready_turn (user turn of the first recommendation), category (first
+        category chosen), recommendations, and per stage the number of calls and their latencies.
+    """
+    outcome = {"user_turns": sum(1 for entry in history if entry.get("role") == "user"),
+               "ready_turn": None, "category": None, "recommendations": 0,
+               "calls": {}, "latencies": {}}
+    for turn, stage, entry in iter_model_calls(history):
+        if stage == "intent":
+            decided = (entry.get("intent") or {}).get("category")
+        else:
+            outcome["calls"][stage] = outcome["calls"].get(stage, 0) + 1
+            outcome["latencies"].setdefault(stage, []).append(entry.get("latency_seconds") or 0.0)
+            decided = clarification_category(entry) if stage == "clarification" else None
+        if decided and outcome["category"] is None:
+            outcome["category"] = decided
+        if stage == "recommendation":
+            outcome["recommendations"] += 1
+            if outcome["ready_turn"] is None:
+                outcome["ready_turn"] = turn
+    return outcome
+
+
+class RecordedSession:
+    """
+    The recorded model replies of one logged session, looked up by stage and user turn.
+
+    Attributes:
+        session_id (str): The logged session id.
+        user_messages (List[str]): The user turns to replay.
+        turn (int): The user turn being replayed (set by the driver before each /chat call).
+        synthesized (int): Replies that had no recorded counterpart.
+    """
+
+    def __init__(self, log: Dict[str, Any]):
+        history = log.get("conversation_history") or []
+        self.session_id = log.get("session_id")
+        self.user_messages = [entry.get("content") or "" for entry in history if entry.get("role") == "user"]
+        self.turn = 0
+        self.synthesized = 0
+        self._clarifications: Dict[int, Tuple[str, float]] = {}
+        self._replies: Dict[str, List[Tuple[int, str, float]]] = {"summary": [], "recommendation": []}
+        self._decisions: Dict[int, str] = {}
+        latencies: Dict[str, List[float]] = {}
+        for turn, stage, entry in iter_model_calls(history):
+            if stage == "intent":
+                category = (entry.get("intent") or {}).get("category")
+                if category:
+                    self._decisions[turn] = category
+                continue
+            reply = (entry.get("content") or "", entry.get("latency_seconds") or 0.0)
+            latencies.setdefault(stage, []).append(reply[1])
+            if stage == "clarification":
+                self._clarifications.setdefault(turn, reply)
+                category = clarification_category(entry)
+                if category:
+                    self._decisions.setdefault(turn, category)
+            elif stage in self._replies and not entry.get("cached"):
+                self._replies[stage].append((turn, *reply))
+        self._typical_latency = {stage: sorted(values)[len(values) // 2] for stage, values in latencies.items()}
+
+    def reply(self, stage: str) -> Tuple[str, float]:
+        """
+        Get the recorded reply for a model call of the current turn.
+
+        Clarifications are matched by turn; summaries and recommendations use the
+        latest one recorded up to the current turn. Without a recorded reply, one is
+        synthesized: a clarification that selects the category the original session
+        chose at this turn (if any), the user's messages as a summary, or a generic
+        recommendation.
+
+        Parameters:
+            stage (str): The stage of the call.
+        Returns:
+            Tuple[str, float]: The reply text and the latency to simulate.
+        """
+        if stage == "clarification" and self.turn in self._clarifications:
+            return self._clarifications[self.turn]
+        if stage in self._replies:
+            recorded = [reply for reply in self._replies[stage] if reply[0] <= self.turn] or self._replies[stage]
+            if recorded:
+                return recorded[-1][1], recorded[-1][2]
+
+        self.synthesized += 1
+        latency = self._typical_latency.get(stage, 0.0)
+        if stage == "clarification":
+            category = self._decisions.get(self.turn)
+            return json.dumps({"Answer": "Could you tell me a bit more about what you need?" if category is None
+                               else "Great, I have what I need.",
+                               "ready_to_filter": category is not None, "selected_category": category}), latency
+        if stage == "summary":
+            return "\n".join(f"- {message}" for message in self.user_messages[:self.turn]), latency
+        return "I recommend the first listed product.", latency
+
+
+def request_stage(messages: List[Dict[str, Any]]) -> str:
+    """
+    Tell the pipeline stage of a model request from its messages.
+
+    Parameters:
+        messages (List[Dict[str, Any]]): The request messages.
+    Returns:
+        str: 'clarification' (a chat with user turns), 'recommendation' or 'summary' (a single prompt).
+    """
+    if any(message.get("role") == "user" for message in messages):
+        return "clarification"
+    prompt = "\n".join(message.get("content") or "" for message in messages)
+    return "recommendation" if RECOMMENDATION_MARKER in prompt else "summary"
+
+
+class ReplayModel:
+    """
+    Answers the backend's model calls during a replay (used as an `httpx.MockTransport` handler).
+
+    Attributes:
+        mode (str): 'recorded' or 'stub'.
+        time_scale (float): Factor applied to recorded latencies (0 answers immediately).
+        calls (Dict[str, int]): Calls answered, per stage.
+    """
+
+    def __init__(self, mode: str, time_scale: float = 1.0, latency: float = 0.3, distribution: str = "lognormal",
+                 jitter: float = 0.5, turns_to_ready: int = 3, seed: int = 1):
+        self.mode = mode
+        self.time_scale = time_scale
+        self.turns_to_ready = turns_to_ready
+        self.rng = random.Random(seed)
+        self.latency_model = LatencyModel(latency, distribution, jitter, self.rng)
+        self.calls: Dict[str, int] = {}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        messages = body.get("messages", [])
+        stage = request_stage(messages)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        session = CURRENT_SESSION.get()
+        if self.mode == "recorded" and session is not None:
+            content, latency = session.reply(stage)
+            latency *= self.time_scale
+        else:
+            content, latency = build_reply(messages, self.turns_to_ready, self.rng), self.latency_model.sample()
+        if body.get("stream"):
+            return httpx.Response(400, json={"error": {"message": "streamed calls are not replayed"}})
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={
+            "id": "replay", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": stub_usage(body, content, latency),
+        })
+
+
+class ReplayReport:
+    """
+    Accumulates replayed sessions into the comparison report.
+
+    Only latencies and the sessions whose outcome changed are kept, not the
+    conversations themselves.
+    """
+
+    def __init__(self):
+        self.sessions = 0
+        self.failed = 0
+        self.synthesized = 0
+        self.category = {"same": 0, "changed": 0, "lost": 0, "gained": 0, "none": 0}
+        self.ready_turn = {"same": 0, "earlier": 0, "later": 0, "lost": 0, "gained": 0, "never": 0}
+        self.latencies = {"original": {}, "replay": {}}
+        self.calls = {"original": {}, "replay": {}}
+        self.turn_latencies: List[float] = []
+        self.diffs: List[Dict[str, Any]] = []
+
+    def add(self, record: Dict[str, Any]):
+        """
+        Add one replayed session.
+
+        Parameters:
+            record (Dict[str, Any]): The output of `replay_session`.
+        Returns:
+            None
+        """
+        original, replay = record["original"], record["replay"]
+        self.sessions += 1
+        self.synthesized += record["synthesized"]
+        self.turn_latencies.extend(record["turn_latencies"])
+        if record["errors"]:
+            self.failed += 1
+        for side, outcome in (("original", original), ("replay", replay)):
+            for stage, values in outcome["latencies"].items():
+                self.latencies[side].setdefault(stage, []).extend(values)
+                self.calls[side][stage] = self.calls[side].get(stage, 0) + len(values)
+
+        category_change = self._compare(original["category"], replay["category"], self.category, "none")
+        a, b = original["ready_turn"], replay["ready_turn"]
+        if a is not None and b is not None and a != b:
+            self.ready_turn["earlier" if b < a else "later"] += 1
+            ready_change = True
+        else:
+            ready_change = self._compare(a, b, self.ready_turn, "never")
+        if category_change or ready_change or record["errors"]:
+            self.diffs.append({"session_id": record["session_id"], "user_turns": original["user_turns"],
+                               "category": [original["category"], replay["category"]],
+                               "ready_turn": [a, b], "calls": [original["calls"], replay["calls"]],
+                               "errors": record["errors"]})
+
+    @staticmethod
+    def _compare(a, b, counts: Dict[str, int], neither: str) -> bool:
+        # Count same / changed / lost / gained; returns whether the outcome differs.
+        if a is None and b is None:
+            counts[neither] += 1
+            return False
+        if a == b:
+            counts["same"] += 1
+            return False
+        counts["changed" if a is not None and b is not None else "lost" if b is None else "gained"] += 1
+        return True
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Build the report.
+
+        Returns:
+            Dict[str, Any]: Outcome agreement, per-stage calls and latencies (original vs replay), replayed
+            /chat latency, and the sessions whose outcome changed.
+        """
+        stages = {}
+        for stage in STAGES:
+            original = summarize(self.latencies["original"].get(stage, []))
+            replay = summarize(self.latencies["replay"].get(stage, []))
+            stages[stage] = {"calls": [self.calls["original"].get(stage, 0), self.calls["replay"].get(stage, 0)],
+                             "original": original, "replay": replay,
+                             "delta_p50_ms": round(replay["p50_ms"] - original["p50_ms"], 2),
+                             "delta_p95_ms": round(replay["p95_ms"] - original["p95_ms"], 2)}
+        return {"sessions": self.sessions, "failed_sessions": self.failed, "changed_sessions": len(self.diffs),
+                "synthesized_replies": self.synthesized, "category": self.category, "ready_turn": self.ready_turn,
+                "stages": stages, "chat_turn_latency": summarize(self.turn_latencies), "diffs": self.diffs}
+
+
+async def replay_session(client: httpx.AsyncClient, sessions, log: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Re-drive one logged session's user turns through /chat.
+
+    Parameters:
+        client (httpx.AsyncClient): Client bound to the backend app.
+        sessions: The backend's session registry (to read the replayed monitoring log).
+        log (Dict[str, Any]): The logged session.
+    Returns:
+        Dict[str, Any]: session_id, the original and replayed outcomes, /chat latencies, errors and
+        the number of synthesized replies.
+    """
+    recorded = RecordedSession(log)
+    CURRENT_SESSION.set(recorded)  # each session runs in its own task, so the value stays local to it
+    session_id, errors, turn_latencies = None, [], []
+    for turn, text in enumerate(recorded.user_messages, start=1):
+        recorded.turn = turn
+        start = time.perf_counter()
+        try:
+            response = await client.post("/chat", json={"text": text, "session_id": session_id})
+        except Exception as e:
+            errors.append(f"turn {turn}: {type(e).__name__}: {e}")
+            break
+        turn_latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(f"turn {turn}: HTTP {response.status_code}")
+            break
+        session_id = response.json()["session_id"]
+
+    chat = await sessions.pop(session_id) if session_id else None
+    if chat is not None and chat.summary_task is not None:
+        with contextlib.suppress(Exception):
+            await chat.summary_task
+    return {"session_id": recorded.session_id,
+            "original": session_outcome(log.get("conversation_history") or []),
+            "replay": session_outcome(chat.get_monitoring_log() if chat is not None else []),
+            "turn_latencies": turn_latencies, "errors": errors, "synthesized": recorded.synthesized}
+
+
+async def replay(logs: Iterator[Dict[str, Any]], model: ReplayModel, concurrency: int, backend_log: Path) -> ReplayReport:
+    """
+    Replay sessions in parallel against the backend app running in this process.
+
+    Parameters:
+        logs (Iterator[Dict[str, Any]]): The logged sessions (consumed lazily).
+        model (ReplayModel): Answers the model calls.
+        concurrency (int): Sessions replayed at the same time.
+        backend_log (Path): File that receives the backend's output.
+    Returns:
+        ReplayReport: The accumulated report.
+    """
+    import main as backend
+    from model import use_transport
+
+    report = ReplayReport()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    def done(task: asyncio.Task):
+        tasks.discard(task)
+        semaphore.release()
+        if task.exception() is not None:
+            print(f"ERROR: Replay task failed. Error: {task.exception()}", file=sys.stderr)
+        else:
+            report.add(task.result())
+
+    await use_transport(httpx.MockTransport(model.handle))
+    with open(backend_log, "w", encoding="utf-8") as out, contextlib.redirect_stdout(out):
+        async with backend.lifespan(backend.app):
+            transport = httpx.ASGITransport(app=backend.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+                for log in logs:
+                    if not any(entry.get("role") == "user" for entry in log.get("conversation_history") or []):
+                        continue
+                    await semaphore.acquire()
+                    task = asyncio.create_task(replay_session(client, backend.sessions, log))
+                    tasks.add(task)
+                    task.add_done_callback(done)
+                while tasks:
+                    await asyncio.gather(*list(tasks), return_exceptions=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged conversations and compare latency and outcomes.")
+    parser.add_argument("--log", type=Path, default=BACKEND_DIR / "db" / "conversations_log.jsonl",
+                        help="Conversation log (.jsonl) or conversation store (.db).")
+    parser.add_argument("--model", choices=["recorded", "stub"], default="recorded")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Factor for recorded latencies (recorded model).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Sessions replayed in parallel.")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many sessions.")
+    parser.add_argument("--session", action="append", default=[], help="Only replay this session id (repeatable).")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean latency (stub model).")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--turns-to-ready", type=int, default=3, help="User turns before the stub selects a category.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Backend setting for the replay (repeatable).")
+    parser.add_argument("--output", type=Path, default=None, help="Report file (default benchmarks/results/...).")
+    parser.add_argument("--fail-on-diff", action="store_true", help="Exit with status 1 if any session's outcome changed.")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="replay_"))
+    os.environ.setdefault("GROQ_API_KEY", "replay")
+    os.environ.update(REPLAY_ENV)
+    os.environ["CONVERSATION_LOG_PATH"] = str(workdir / "conversations_log.jsonl")
+    os.environ.update(item.split("=", 1) for item in args.env)
+
+    logs = read_logs(args.log)
+    if args.session:
+        logs = (log for log in logs if log.get("session_id") in set(args.session))
+    if args.limit is not None:
+        logs = (log for _, log in zip(range(args.limit), logs))
+    model = ReplayModel(args.model, args.time_scale, args.latency, args.latency_dist, args.jitter,
+                        args.turns_to_ready, args.seed)
+
+    start = time.perf_counter()
+    report = asyncio.run(replay(logs, model, args.concurrency, workdir / "backend.log"))
+    results = {"benchmark": "replay", "commit": git_commit(), "timestamp": datetime.now().isoformat(),
+               "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items() if k != "output"},
+               "wall_seconds": round(time.perf_counter() - start, 3), "results": report.summary()}
+
+    output = args.output or RESULTS_DIR / f"replay_{results['commit']}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    r = results["results"]
+    print(f"{r['sessions']} sessions replayed in {results['wall_seconds']}s ({args.model} model), "
+          f"{r['changed_sessions']} changed, {r['failed_sessions']} failed, {r['synthesized_replies']} synthesized replies")
+    print(f"category: {r['category']}")
+    print(f"ready turn: {r['ready_turn']}")
+    print(f"{'stage':<15} {'calls':>11} {'orig p50':>9} {'p50':>9} {'orig p95':>9} {'p95':>9}")
+    for stage, s in r["stages"].items():
+        print(f"{stage:<15} {s['calls'][0]:>5}/{s['calls'][1]:<5} {s['original']['p50_ms']:>9} "
+              f"{s['replay']['p50_ms']:>9} {s['original']['p95_ms']:>9} {s['replay']['p95_ms']:>9}")
+    print(f"/chat turn latency: {r['chat_turn_latency']}")
+    for diff in r["diffs"]:
+        print(f"  {diff['session_id']}: category {diff['category'][0]} -> {diff['category'][1]}, "
+              f"ready turn {diff['ready_turn'][0]} -> {diff['ready_turn'][1]}"
+              + (f", errors {diff['errors']}" if diff["errors"] else ""))
+    print(f"Results saved to {output} (backend output in {workdir})")
+    if args.fail_on_diff and (r["changed_sessions"] or r["failed_sessions"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+A minimal OpenAI-compatible chat completions stub for local benchmarking.
+
+Run from the backend directory:
+    python -m benchmarks.stub_llm_server --port 9100 --latency 0.2
+
+Then point the backend at it with LLM_API_URL=http://127.0.0.1:9100/v1/chat/completions
+
+Replies follow the backend's prompts: clarification turns get a JSON envelope in
+the INITIAL_PROMPT format (ready_to_filter becomes true after --turns-to-ready
+user messages, with a category taken from the prompt's closed list), summary
+prompts get plain-text bullet points and recommendation prompts get a plain-text
+recommendation naming a listed product. Latency can be fixed or drawn from a
+distribution, and a fraction of requests can fail with an HTTP error. A fraction
+of envelopes can be malformed the way models do it (code fences, Python
+literals, trailing commas, surrounding prose); in JSON mode
+(`response_format`) invalid ones are rejected like Groq's json_validate_failed.
+"""
+import argparse
+import ast
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+
+QUESTIONS = [
+    "What will you mainly use it for?",
+    "Do you have a budget in mind?",
+    "Do you prefer a light laptop or a powerful desktop?",
+    "Any preference between Windows and macOS?",
+    "How important are battery life and weight to you?",
+]
+CATEGORY_LIST_RE = re.compile(r"closed list: (\[.*?\])", re.DOTALL)
+SKU_RE = re.compile(r"'SKU': '([^']+)'|^([A-Za-z0-9][\w.-]+) \|", re.MULTILINE)
+
+
+class LatencyModel:
+    """
+    Samples response latencies.
+
+    Attributes:
+        mean (float): Mean latency in seconds.
+        distribution (str): 'fixed', 'uniform' (mean +/- jitter * mean), 'lognormal' (sigma = jitter) or 'exponential'.
+        jitter (float): Spread parameter of the distribution.
+    """
+
+    def __init__(self, mean: float, distribution: str = "fixed", jitter: float = 0.5, rng: random.Random = None):
+        if distribution not in ("fixed", "uniform", "lognormal", "exponential"):
+            raise ValueError(f"Unknown latency distribution '{distribution}'")
+        self.mean = mean
+        self.distribution = distribution
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        """
+        Draw one latency.
+
+        Returns:
+            float: Seconds (never negative).
+        """
+        if self.mean <= 0 or self.distribution == "fixed":
+            return max(self.mean, 0.0)
+        if self.distribution == "uniform":
+            return max(self.rng.uniform(self.mean * (1 - self.jitter), self.mean * (1 + self.jitter)), 0.0)
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.mean)
+        # Lognormal with the requested mean: mu = ln(mean) - sigma^2 / 2.
+        sigma = self.jitter
+        return self.rng.lognormvariate(math.log(self.mean) - sigma ** 2 / 2, sigma)
+
+
+def build_reply(messages: list, turns_to_ready: int, rng: random.Random) -> str:
+    """
+    Build a reply that matches the prompt the backend sent.
+
+    Parameters:
+        messages (list): The request messages.
+        turns_to_ready (int): User messages after which the envelope selects a category.
+        rng (random.Random): Random source.
+    Returns:
+        str: The reply text.
+    """
+    user_messages = [m.get("content") or "" for m in messages if m.get("role") == "user"]
+    prompt = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+
+    if user_messages:
+        categories = []
+        match = CATEGORY_LIST_RE.search(prompt)
+        if match:
+            try:
+                categories = ast.literal_eval(match.group(1))
+            except (ValueError, SyntaxError):
+                categories = []
+        if len(user_messages) >= turns_to_ready and categories:
+            category = categories[sum(map(ord, user_messages[0])) % len(categories)]
+            return json.dumps({"Answer": "Great, I have what I need to find your best match.",
+                               "ready_to_filter": True, "selected_category": category})
+        return json.dumps({"Answer": f"Thanks! {rng.choice(QUESTIONS)}",
+                           "ready_to_filter": False, "selected_category": None})
+
+    if "Recommendation Assistant" in prompt:
+        match = SKU_RE.search(prompt.split("available products", 1)[-1].split("\n", 2)[-1])
+        sku = next((group for group in match.groups() if group), None) if match else None
+        return (f"I recommend the {sku or 'first listed product'} because it best balances performance, "
+                f"portability and price for what you described.")
+
+    # Summary prompts: echo the user's lines as short bullet points.
+    lines = [line.split(":", 1)[1].strip() for line in prompt.splitlines() if line.startswith("user:")]
+    return "\n".join(f"- {line[:80]}" for line in lines) or "- General purpose computer"
+
+
+def malform_envelope(content: str, rng: random.Random) -> str:
+    """
+    Damage a JSON envelope in one of the ways models commonly do.
+
+    Parameters:
+        content (str): The JSON envelope.
+        rng (random.Random): Random source.
+    Returns:
+        str: The malformed reply.
+    """
+    kind = rng.choice(["fence", "python", "trailing_comma", "prose"])
+    if kind == "fence":
+        return f"```json\n{content}\n```"
+    if kind == "python":
+        return content.replace("true", "True").replace("false", "False").replace("null", "None")
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    return f"Sure! Here is my answer:\n{content}\nLet me know if you need anything else."
+
+
+def is_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+
+def stub_usage(body: dict, content: str, latency: float) -> dict:
+    """
+    Build a Groq-style usage block (token counts are approximated as characters / 4).
+
+    Parameters:
+        body (dict): The request body.
+        content (str): The response text.
+        latency (float): The simulated generation time.
+    Returns:
+        dict: The usage block.
+    """
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "queue_time": 0.0, "prompt_time": 0.0, "completion_time": latency, "total_time": latency}
+
+
+def stream_chunks(content: str, model: str, latency: float, chunk_size: int = 8, usage: dict = None):
+    """
+    Yield an OpenAI-compatible SSE stream for the given content.
+
+    Parameters:
+        content (str): The full response text.
+        model (str): The model name to echo back.
+        latency (float): Total seconds spread over the chunks.
+        chunk_size (int): Characters per chunk.
+        usage (dict): Usage block sent in a final chunk, if given.
+    Returns:
+        AsyncIterator[str]: Encoded SSE lines.
+    """
+    async def generate():
+        pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        if usage is not None:
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "model": model, "choices": [],
+                     "usage": usage}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    return generate()
+
+
+def create_app(latency: float, distribution: str = "fixed", jitter: float = 0.5, error_rate: float = 0.0,
+               error_statuses: list = None, turns_to_ready: int = 3, seed: int = None,
+               malformed_rate: float = 0.0) -> FastAPI:
+    """
+    Create the stub application.
+
+    Parameters:
+        latency (float): Mean seconds to wait before answering each request.
+        distribution (str): Latency distribution (see `LatencyModel`).
+        jitter (float): Spread of the latency distribution.
+        error_rate (float): Fraction of requests answered with an HTTP error.
+        error_statuses (list): Status codes to pick errors from (default [500]).
+        turns_to_ready (int): User messages after which clarification replies select a category.
+        seed (int): Random seed for reproducible runs.
+        malformed_rate (float): Fraction of JSON envelopes that are malformed.
+    Returns:
+        FastAPI: The stub app.
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+    latency_model = LatencyModel(latency, distribution, jitter, rng)
+    error_statuses = error_statuses or [500]
+    app.state.counters = {"requests": 0, "errors": 0, "malformed": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.counters["requests"] += 1
+        delay = latency_model.sample()
+        if rng.random() < error_rate:
+            app.state.counters["errors"] += 1
+            await asyncio.sleep(delay / 2)
+            status = rng.choice(error_statuses)
+            return JSONResponse({"error": {"message": "stub error", "type": "stub"}}, status_code=status,
+                                headers={"retry-after": "0.1"} if status == 429 else None)
+
+        content = build_reply(body.get("messages", []), turns_to_ready, rng)
+        if content.startswith("{") and rng.random() < malformed_rate:
+            app.state.counters["malformed"] += 1
+            content = malform_envelope(content, rng)
+            if body.get("response_format", {}).get("type") == "json_object" and not is_json(content):
+                await asyncio.sleep(delay)
+                return JSONResponse({"error": {"message": "Failed to generate JSON.", "type": "invalid_request_error",
+                                               "code": "json_validate_failed", "failed_generation": content}},
+                                    status_code=400)
+        if body.get("stream"):
+            usage = stub_usage(body, content, delay) if body.get("stream_options", {}).get("include_usage") else None
+            return StreamingResponse(stream_chunks(content, body.get("model", "stub"), delay, usage=usage),
+                                     media_type="text/event-stream")
+        await asyncio.sleep(delay)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0,
+                         "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": stub_usage(body, content, delay),
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible LLM stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response delay in seconds.")
+    parser.add_argument("--latency-dist", default="fixed", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--jitter", type=float, default=0.5, help="Spread of the latency distribution.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--error-status", default="500", help="Comma-separated error status codes, e.g. 429,500,503.")
+    parser.add_argument("--turns-to-ready", type=int, default=3, help="User messages before a category is selected.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of malformed JSON envelopes.")
+    args = parser.parse_args()
+    app = create_app(args.latency, args.latency_dist, args.jitter, args.error_rate,
+                     [int(code) for code in args.error_status.split(",")], args.turns_to_ready, args.seed,
+                     args.malformed_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
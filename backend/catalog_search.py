@@ -0,0 +1,226 @@
+import os
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from data_handler import get_catalog_snapshot, on_catalog_reload
+from intent_classifier import tokenize
+from product_index import RECOMMENDATION_TOP_K, constraints_from_text, get_product_index, select_candidate_products
+
+
+# How recommendation candidates are chosen: 'bm25' searches the whole catalog, 'category' uses the category's SKU list:
+RECOMMENDATION_RETRIEVAL = os.getenv("RECOMMENDATION_RETRIEVAL", "bm25")
+# Score added to products of the selected category, as a fraction of the best match's score:
+CATALOG_SEARCH_CATEGORY_BOOST = float(os.getenv("CATALOG_SEARCH_CATEGORY_BOOST", "0.5"))
+
+# BM25 parameters and per-field term weights:
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"Name": 2.0, "Family": 1.5, "Description": 1.0, "CPU": 1.0, "GPU": 1.0}
+
+
+class CatalogSearchIndex:
+    """
+    Inverted index with BM25 scoring over the product catalog.
+
+    Postings are stored in CSR form: the documents and field-weighted term
+    frequencies of term `t` are `doc_ids[offsets[t]:offsets[t + 1]]` and
+    `term_freqs[...]`. A query gathers the postings of its terms and sums their
+    BM25 contributions per product with one `np.bincount`.
+
+    Attributes:
+        products (List[Dict[str, Any]]): The indexed products, one per row.
+        skus (np.ndarray): SKU per row.
+        vocabulary (Dict[str, int]): Term to term id.
+        offsets (np.ndarray): Start of each term's postings (length: terms + 1).
+        doc_ids (np.ndarray): Posting rows.
+        term_freqs (np.ndarray): Posting term frequencies.
+        idf (np.ndarray): BM25 inverse document frequency per term.
+        length_norm (np.ndarray): Per-row `k1 * (1 - b + b * length / average length)`.
+        category_rows (Dict[str, np.ndarray]): Category name to rows.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], category_map: Dict[str, List[str]],
+                 k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Build the index.
+
+        Parameters:
+            products (List[Dict[str, Any]]): The product catalog.
+            category_map (Dict[str, List[str]]): Category name to SKU list.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+        Returns:
+            None
+        """
+        self.products = products
+        self.k1 = k1
+        self.skus = np.array([p["SKU"] for p in products], dtype=object)
+        self._row_by_sku = {p["SKU"]: i for i, p in enumerate(products)}
+
+        # Collect (term id, row, frequency) triples, then sort them by term into CSR arrays.
+        # Field values repeat across products (Family, CPU, GPU), so each is tokenized once.
+        self.vocabulary: Dict[str, int] = {}
+        term_ids: List[int] = []
+        rows: List[int] = []
+        frequencies: List[float] = []
+        token_cache: Dict[str, List[str]] = {}
+        lengths = np.zeros(len(products), dtype=np.float32)
+        for row, product in enumerate(products):
+            counts: Counter = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                value = str(product.get(field) or "")
+                terms = token_cache.get(value)
+                if terms is None:
+                    terms = token_cache[value] = tokenize(value)
+                for term in terms:
+                    counts[term] += weight
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                rows.append(row)
+                frequencies.append(count)
+
+        term_array = np.array(term_ids, dtype=np.int32)
+        order = np.argsort(term_array, kind="stable")
+        sizes = np.bincount(term_array, minlength=len(self.vocabulary)).astype(np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self.doc_ids = np.array(rows, dtype=np.int32)[order]
+        self.term_freqs = np.array(frequencies, dtype=np.float32)[order]
+
+        n = max(len(products), 1)
+        self.idf = np.log(1 + (n - sizes + 0.5) / (sizes + 0.5)).astype(np.float32)
+        average_length = float(lengths.mean()) if len(products) else 1.0
+        self.length_norm = (k1 * (1 - b + b * lengths / max(average_length, 1e-9))).astype(np.float32)
+        self.category_rows = {
+            category: np.array([self._row_by_sku[sku] for sku in skus if sku in self._row_by_sku], dtype=np.int32)
+            for category, skus in category_map.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Compute the BM25 score of every product for a query.
+
+        Parameters:
+            query (str): The query text.
+        Returns:
+            np.ndarray: Score per row (0 for products that match no query term).
+        """
+        term_ids = sorted({self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary})
+        if not term_ids:
+            return np.zeros(len(self.skus), dtype=np.float32)
+        spans = [np.arange(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        positions = np.concatenate(spans)
+        idf = np.repeat(self.idf[term_ids], [len(span) for span in spans])
+        docs = self.doc_ids[positions]
+        tf = self.term_freqs[positions]
+        contributions = idf * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return np.bincount(docs, weights=contributions, minlength=len(self.skus))
+
+    def search(self, query: str, top_k: int = RECOMMENDATION_TOP_K, category: Optional[str] = None,
+               category_boost: float = CATALOG_SEARCH_CATEGORY_BOOST,
+               allowed_skus: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Find the best-matching products for a query.
+
+        Products of `category` get `category_boost` times the best score added,
+        so they rank well without excluding strong matches from other categories.
+
+        Parameters:
+            query (str): The query text (e.g. the conversation summary).
+            top_k (int): Maximum number of results.
+            category (Optional[str]): Category to boost.
+            category_boost (float): Boost as a fraction of the best score.
+            allowed_skus (Optional[List[str]]): Restrict results to these SKUs (e.g. attribute filter matches).
+        Returns:
+            List[Tuple[str, float]]: (SKU, score) pairs, best first (empty if no product matches a query term).
+        """
+        scores = self.scores(query)
+        if allowed_skus is not None:
+            mask = np.zeros(len(self.skus), dtype=bool)
+            mask[[self._row_by_sku[sku] for sku in allowed_skus if sku in self._row_by_sku]] = True
+            scores[~mask] = 0
+        best = float(scores.max()) if len(scores) else 0.0
+        if best <= 0:
+            return []
+        rows = self.category_rows.get(category) if category else None
+        if rows is not None and len(rows):
+            boost = category_boost * best
+            scores[rows] += boost if allowed_skus is None else boost * mask[rows]
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        # Ties keep catalog order.
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(self.skus[i], float(scores[i])) for i in ranked]
+
+    def product(self, sku: str) -> Dict[str, Any]:
+        """
+        Get an indexed product by SKU.
+
+        Parameters:
+            sku (str): The product SKU.
+        Returns:
+            Dict[str, Any]: The product.
+        """
+        return self.products[self._row_by_sku[sku]]
+
+
+_index: Optional[CatalogSearchIndex] = None
+
+
+def get_search_index() -> CatalogSearchIndex:
+    """
+    Get the search index, building it from the catalog on first use.
+
+    Returns:
+        CatalogSearchIndex: The search index.
+    """
+    global _index
+    if _index is None:
+        snapshot = get_catalog_snapshot()
+        _index = CatalogSearchIndex(snapshot.products, snapshot.category_map)
+    return _index
+
+
+def _rebuild_index(snapshot):
+    global _index
+    _index = CatalogSearchIndex(snapshot.products, snapshot.category_map)
+
+
+on_catalog_reload(_rebuild_index)
+
+
+def retrieve_products(summary: str, category: Optional[str] = None,
+                      top_k: int = RECOMMENDATION_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Select the recommendation candidates for the user's summary from the whole catalog.
+
+    Attribute constraints found in the summary (see `product_index.constraints_from_text`)
+    restrict the search; if nothing matches them, they are dropped. The category's
+    own list is used when the summary matches no catalog term.
+
+    Parameters:
+        summary (str): The summary of the user's needs.
+        category (Optional[str]): The selected category, boosted in the ranking.
+        top_k (int): Maximum number of products to return.
+    Returns:
+        List[Dict[str, Any]]: The selected products, best match first.
+    """
+    index = get_search_index()
+    product_index = get_product_index()
+    constraints = constraints_from_text(summary, product_index.vendors)
+    allowed = product_index.query(**constraints) if constraints else None
+    results = index.search(summary, top_k, category, allowed_skus=allowed)
+    if not results and constraints:
+        print("No products match constraints", constraints, "- searching without them")
+        results = index.search(summary, top_k, category)
+    if not results:
+        category_products = [index.products[row] for row in index.category_rows.get(category, [])]
+        return select_candidate_products(category_products, summary, top_k)
+    print(f"Retrieved {len(results)} of {len(index)} products for category {category}:",
+          [(sku, round(score, 2)) for sku, score in results])
+    return [index.product(sku) for sku, _ in results]
@@ -0,0 +1,183 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from data_handler import (get_catalog_snapshot, get_product_keys, get_products_by_category,
+                          on_catalog_reload)
+
+
+# Default format for product lists in the recommendation prompt:
+CATALOG_FORMAT = os.getenv("CATALOG_FORMAT", "table")
+
+
+class CatalogSerializer(ABC):
+    """
+    Base class for rendering products into prompt text.
+
+    A serializer renders an optional header once and then one row per product.
+
+    Attributes:
+        name (str): The format name used to select the serializer.
+    """
+    name = ""
+
+    def header(self, keys: List[str]) -> Optional[str]:
+        """
+        Render the header line.
+
+        Parameters:
+            keys (List[str]): The product keys, in column order.
+        Returns:
+            Optional[str]: The header, or None if the format has no header.
+        """
+        return None
+
+    @abstractmethod
+    def row(self, product: Dict, keys: List[str]) -> str:
+        """
+        Render one product.
+
+        Parameters:
+            product (Dict): The product.
+            keys (List[str]): The product keys, in column order.
+        Returns:
+            str: The rendered row.
+        """
+        raise NotImplementedError
+
+
+class ReprSerializer(CatalogSerializer):
+    """
+    The original format: one Python dict repr per product.
+    """
+    name = "repr"
+
+    def row(self, product: Dict, keys: List[str]) -> str:
+        return str(product)
+
+
+class TableSerializer(CatalogSerializer):
+    """
+    Compact tabular format: the key names once in a header, then one
+    pipe-separated row per product.
+    """
+    name = "table"
+
+    def header(self, keys: List[str]) -> Optional[str]:
+        return " | ".join(keys)
+
+    def row(self, product: Dict, keys: List[str]) -> str:
+        return " | ".join(str(product.get(key, "")).replace("|", "/") for key in keys)
+
+
+SERIALIZERS: Dict[str, CatalogSerializer] = {}
+
+
+def register_serializer(serializer: CatalogSerializer):
+    """
+    Register a serializer under its name.
+
+    Parameters:
+        serializer (CatalogSerializer): The serializer to register.
+    Returns:
+        None
+    """
+    SERIALIZERS[serializer.name] = serializer
+
+
+register_serializer(ReprSerializer())
+register_serializer(TableSerializer())
+
+# Rendered rows and category fragments, per (catalog version, format):
+_row_cache: Dict[tuple, str] = {}
+_fragment_cache: Dict[tuple, str] = {}
+_cache_lock = threading.Lock()
+
+
+def _get_serializer(fmt: Optional[str]) -> CatalogSerializer:
+    fmt = fmt or CATALOG_FORMAT
+    if fmt not in SERIALIZERS:
+        raise ValueError(f"Unknown catalog format '{fmt}', expected one of {list(SERIALIZERS)}")
+    return SERIALIZERS[fmt]
+
+
+def render_products(products: List[Dict], fmt: Optional[str] = None) -> str:
+    """
+    Render a list of products, reusing cached rows.
+
+    Parameters:
+        products (List[Dict]): The products to render.
+        fmt (Optional[str]): The format name (defaults to CATALOG_FORMAT).
+    Returns:
+        str: The rendered product block.
+    """
+    serializer = _get_serializer(fmt)
+    keys = get_product_keys()
+    version = get_catalog_snapshot().version
+    lines = []
+    header = serializer.header(keys)
+    if header is not None:
+        lines.append(header)
+    for product in products:
+        lines.append(_cached_row(serializer, product, keys, version))
+    return "\n".join(lines)
+
+
+def _cached_row(serializer: CatalogSerializer, product: Dict, keys: List[str], version: int) -> str:
+    cache_key = (version, serializer.name, product["SKU"])
+    row = _row_cache.get(cache_key)
+    if row is None:
+        row = serializer.row(product, keys)
+        with _cache_lock:
+            _row_cache[cache_key] = row
+    return row
+
+
+def render_category(category: str, fmt: Optional[str] = None) -> str:
+    """
+    Render all products of a category, using the precomputed fragment when available.
+
+    Parameters:
+        category (str): The category name.
+        fmt (Optional[str]): The format name (defaults to CATALOG_FORMAT).
+    Returns:
+        str: The rendered product block.
+    """
+    serializer = _get_serializer(fmt)
+    cache_key = (get_catalog_snapshot().version, serializer.name, category)
+    fragment = _fragment_cache.get(cache_key)
+    if fragment is None:
+        fragment = render_products(get_products_by_category(category), serializer.name)
+        with _cache_lock:
+            _fragment_cache[cache_key] = fragment
+    return fragment
+
+
+def precompute_fragments(snapshot=None):
+    """
+    Drop fragments of older catalog versions, then render every product and every category in every format.
+
+    The product rows serve prompts built from retrieved products (BM25, the
+    default, or a filtered category list); the category fragments serve a
+    category's whole list.
+
+    Parameters:
+        snapshot (Optional[CatalogSnapshot]): The new snapshot (defaults to the current one).
+    Returns:
+        None
+    """
+    snapshot = snapshot or get_catalog_snapshot()
+    with _cache_lock:
+        for cache in (_row_cache, _fragment_cache):
+            for key in [key for key in cache if key[0] != snapshot.version]:
+                del cache[key]
+    keys = get_product_keys()
+    for serializer in SERIALIZERS.values():
+        for product in snapshot.products:
+            _cached_row(serializer, product, keys, snapshot.version)
+    for category in snapshot.category_map:
+        for fmt in SERIALIZERS:
+            render_category(category, fmt)
+
+
+on_catalog_reload(precompute_fragments)
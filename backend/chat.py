@@ -1,6 +1,31 @@
-from typing import List, Dict
+import os
+import re
+from typing import Any, List, Dict, Optional, Tuple, Union
 from uuid import uuid4
 from datetime import datetime
+from monitoring_log import LogEntry, PromptRef, intern_text
+from prompt_template import PromptTemplate
+
+
+# Context window management:
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))  # 0 disables the budget
+CHAT_CONTEXT_KEEP_MESSAGES = int(os.getenv("CHAT_CONTEXT_KEEP_MESSAGES", "4"))  # latest messages never folded
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators added by the chat format
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text (words and punctuation marks).
+
+    Parameters:
+        text (str): The text.
+    Returns:
+        int: Approximate token count.
+    """
+    return len(_TOKEN_RE.findall(text or ""))
+
 
 class Chat:
     """
@@ -12,7 +37,13 @@ class Chat:
         feedback (str): User feedback for the session ('positive', 'negative', 'none').
         timestamp_start (str): ISO formatted timestamp when the chat started.
         chat (List[Dict[str, str]]): List of messages in the chat.
-        monitoring_log (List[Dict[str, str, float]]): List of monitoring log entries.
+        monitoring_log (List[LogEntry]): Monitoring log entries (prompts kept as references, see monitoring_log.py).
+        summary (Optional[str]): Incrementally maintained summary of the user's needs.
+        summary_upto (int): Number of chat messages (including the system prompt) covered by `summary`.
+        summary_task (Optional[asyncio.Task]): Pending background summary update, if any.
+        chat_tokens (List[int]): Estimated token count of each message in `chat`.
+        usage (Dict[str, Dict[str, float]]): Token usage, cost and model time per stage.
+        version (int): Version of the session in the shared session store (0 until first saved).
     """
 
     def __init__(self, initial_prompt):
@@ -30,9 +61,22 @@ class Chat:
 
         self.chat: List[Dict[str, str]] = [{"role": "system",
                                             "content": initial_prompt}]
-        self.monitoring_log: List[Dict[str, str, float]] = [{"role": "system",
-                                            "content": initial_prompt,
-                                            "latency_seconds": 0.0}]
+        self.monitoring_log: List[LogEntry] = [LogEntry("system", intern_text(initial_prompt))]
+        self.summary: Optional[str] = None
+        self.summary_upto = 1
+        self.summary_task = None
+        self.chat_tokens: List[int] = [self._message_tokens(self.chat[0])]
+        self.usage: Dict[str, Dict[str, float]] = {}
+        self.version = 0
+
+    @staticmethod
+    def _message_tokens(message: Dict[str, str]) -> int:
+        return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def _append(self, role: str, text: str):
+        message = {"role": role, "content": text}
+        self.chat.append(message)
+        self.chat_tokens.append(self._message_tokens(message))
 
     def add_user_message(self, text: str):
         """
@@ -43,7 +87,7 @@ class Chat:
         Returns:
             None
         """
-        self.chat.append({"role": "user", "content": text})
+        self._append("user", text)
 
     def add_model_response(self, text: str):
         """
@@ -55,20 +99,60 @@ class Chat:
         Returns:
             None
         """
-        self.chat.append({"role": "assistant", "content": text})
+        self._append("assistant", text)
 
-    def add_monitoring_log(self, role: str, text: str, latency_seconds: float = 0.0):
+    def add_monitoring_log(self, role: str, text: Union[str, PromptRef], latency_seconds: float = 0.0, **extra):
         """
         Add an entry to the monitoring log.
 
         Parameters:
             role (str): The role of the message sender ('user' or 'assistant').
-            text (str): The content of the message.
+            text (Union[str, PromptRef]): The content of the message.
             latency_seconds (float): The latency in seconds for the model response (default is 0.0).
+            **extra: Additional fields to record (e.g. time_to_first_token_seconds); None values are skipped.
+                An entry with both `stage` and `usage` is also added to the session's usage totals.
         Returns:
             None
         """
-        self.monitoring_log.append({"role": role, "content": text, "latency_seconds": latency_seconds})
+        fields = {key: value for key, value in extra.items() if value is not None}
+        self.monitoring_log.append(LogEntry(role, text, latency_seconds, fields))
+        if fields.get("stage") and fields.get("usage"):
+            self.record_usage(fields["stage"], fields["usage"], latency_seconds)
+
+    def add_monitoring_prompt(self, template: PromptTemplate, **params):
+        """
+        Add a system prompt to the monitoring log as its template and parameters.
+
+        The rendered prompt is not kept; it is rebuilt when the log is expanded.
+
+        Parameters:
+            template (PromptTemplate): The prompt template.
+            **params: The values the prompt was rendered with.
+        Returns:
+            None
+        """
+        self.monitoring_log.append(LogEntry("system", PromptRef.from_template(template, params)))
+
+    def record_usage(self, stage: str, usage: Dict[str, float], latency_seconds: float):
+        """
+        Add the usage of one model call to the session totals.
+
+        Parameters:
+            stage (str): The pipeline stage ('clarification', 'summary' or 'recommendation').
+            usage (Dict[str, float]): The call's usage (see `model.extract_usage`).
+            latency_seconds (float): The call's wall-clock latency.
+        Returns:
+            None
+        """
+        totals = self.usage.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                               "total_tokens": 0, "cost_usd": 0.0, "latency_seconds": 0.0,
+                                               "generation_seconds": 0.0})
+        totals["calls"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens", "cost_usd"):
+            totals[field] += usage.get(field, 0)
+        totals["latency_seconds"] += latency_seconds
+        # Provider-reported generation time when available, otherwise the call latency.
+        totals["generation_seconds"] += usage.get("completion_time", latency_seconds)
 
     def get_chat(self):
         """
@@ -79,14 +163,104 @@ class Chat:
         """
         return self.chat
 
-    def get_monitoring_log(self):
+    def get_context(self, token_budget: Optional[int] = None) -> Tuple[List[Dict[str, str]], int]:
         """
-        Get the current monitoring log.
+        Get the messages to send to the model, within a token budget.
 
+        While the history exceeds the budget, the oldest turns are left out. Once
+        the rolling `summary` exists, only turns it covers are left out, and they
+        are replaced by a single system message carrying the summary; before
+        that, the oldest turns are simply dropped. The system prompt and the
+        latest CHAT_CONTEXT_KEEP_MESSAGES messages are always sent.
+
+        Parameters:
+            token_budget (Optional[int]): Maximum estimated tokens (defaults to CHAT_CONTEXT_TOKEN_BUDGET, 0 disables).
         Returns:
-            List[Dict[str, str, float]]: The monitoring log.
+            Tuple[List[Dict[str, str]], int]: The messages and their estimated token count.
+        """
+        budget = CHAT_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+        total = sum(self.chat_tokens)
+        if not budget or total <= budget:
+            return self.chat, total
+
+        droppable_upto = len(self.chat) - CHAT_CONTEXT_KEEP_MESSAGES
+        head = [self.chat[0]]
+        tokens = total
+        if self.summary is not None:
+            droppable_upto = min(self.summary_upto, droppable_upto)
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+            head.append(summary_message)
+            tokens += self._message_tokens(summary_message)
+        start = 1
+        while start < droppable_upto and tokens > budget:
+            tokens -= self.chat_tokens[start]
+            start += 1
+        # Resume on a user turn so roles keep alternating after the system messages.
+        while start < droppable_upto and self.chat[start]["role"] == "assistant":
+            tokens -= self.chat_tokens[start]
+            start += 1
+        if start == 1:
+            return self.chat, total
+        return head + self.chat[start:], tokens
+
+    def get_monitoring_log(self) -> List[Dict[str, Any]]:
         """
-        return self.monitoring_log
+        Get the current monitoring log, expanded into plain entries.
+
+        Returns:
+            List[Dict[str, Any]]: The monitoring log.
+        """
+        return [entry.to_dict() for entry in self.monitoring_log]
+
+    def has_user_messages(self) -> bool:
+        """
+        Check whether the user has sent at least one message in this session.
+
+        Returns:
+            bool: True if the chat contains a user message.
+        """
+        return any(msg["role"] == "user" for msg in self.chat)
+
+    def user_messages_since_reply(self) -> List[str]:
+        """
+        Get the user's messages sent after the last assistant reply (clarification or recommendation).
+
+        Returns:
+            List[str]: The messages, oldest first.
+        """
+        messages = []
+        for message in reversed(self.chat):
+            if message["role"] == "assistant":
+                break
+            if message["role"] == "user":
+                messages.append(message["content"])
+        return messages[::-1]
+
+    def has_recommendation(self) -> bool:
+        """
+        Check whether a recommendation was already given in this session.
+
+        Returns:
+            bool: True if the monitoring log has a recommendation reply.
+        """
+        return any(entry.role == "assistant" and entry.get("stage") == "recommendation"
+                   for entry in self.monitoring_log)
+
+    def approx_size_bytes(self) -> int:
+        """
+        Estimate the memory held by this session.
+
+        The initial system prompt is shared between all sessions and is not counted.
+
+        Returns:
+            int: Approximate size in bytes.
+        """
+        size = 512  # object and bookkeeping overhead
+        for entry in self.chat[1:]:
+            size += 64 + len(entry["content"] or "")
+        for entry in self.monitoring_log[1:]:
+            size += entry.approx_size_bytes()
+        return size
 
     def new_chat(self):
         """
@@ -97,10 +271,16 @@ class Chat:
             None
         """
         self.chat = self.chat[:1]
+        self.chat_tokens = self.chat_tokens[:1]
         self.monitoring_log = self.monitoring_log[:1]
         self.session_id = str(uuid4())
         self.timestamp_start = datetime.now().isoformat()
         self.feedback = "none"
+        self.summary = None
+        self.summary_upto = 1
+        self.summary_task = None
+        self.usage = {}
+        self.version = 0
 
     def set_feedback(self, feedback: str):
         """
@@ -116,19 +296,40 @@ class Chat:
         else:
             raise ValueError("Feedback must be 'positive', 'negative', or 'none'")
     
+    def usage_totals(self) -> Dict[str, object]:
+        """
+        Roll up the session's token usage.
+
+        Returns:
+            Dict[str, object]: Session totals plus the per-stage breakdown under "by_stage".
+        """
+        totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0}
+        for stage_totals in self.usage.values():
+            for field in totals:
+                totals[field] += stage_totals[field]
+        totals["cost_usd"] = round(totals["cost_usd"], 8)
+        totals["by_stage"] = self.usage
+        return totals
+
     def log_conversation(self):
         """
         Create a log entry for the conversation.
 
+        The history is in the compact format: prompts refer to the texts under
+        "texts" by id, which the log writer stores once for all sessions
+        (see `monitoring_log.expand_log`).
+
         Returns:
             Dict[str, Any]: The log entry for the conversation.
         """
+        texts: Dict[str, str] = {}
         # add self.monitoring_log to conversations_log.jsonl
         total_messages = len(self.monitoring_log)
-        user_turns = sum(1 for entry in self.monitoring_log if entry['role'] == 'user')
-        agent_turns = sum(1 for entry in self.monitoring_log if entry['role'] == 'assistant')
+        user_turns = sum(1 for entry in self.monitoring_log if entry.role == 'user')
+        agent_turns = sum(1 for entry in self.monitoring_log if entry.role == 'assistant')
 
-        avg_latency = sum(item["latency_seconds"] for item in self.monitoring_log if "latency_seconds" in item) / agent_turns
+        total_latency = sum(entry.latency_seconds or 0.0 for entry in self.monitoring_log)
+        avg_latency = total_latency / agent_turns if agent_turns else 0.0
 
         log_entry = {
             "session_id": self.session_id,
@@ -139,7 +340,9 @@ class Chat:
             "agent_turns": agent_turns,
             "user_feedback":  self.feedback,
             "average_latency_seconds": avg_latency,
-            "conversation_history": self.monitoring_log,
+            "usage": self.usage_totals(),
+            "conversation_history": [entry.to_record(texts) for entry in self.monitoring_log],
+            "texts": texts,
         }
 
         return log_entry
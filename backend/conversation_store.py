@@ -0,0 +1,363 @@
+import argparse
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from log_stats import format_session, format_stage_usage, merge_stage_usage, parse_time
+from monitoring_log import TextStore, expand_log, referenced_text_ids, texts_path
+
+
+SESSION_COLUMNS = ["session_id", "timestamp_start", "timestamp_end", "total_messages", "user_turns",
+                   "agent_turns", "user_feedback", "average_latency_seconds"]
+MESSAGE_COLUMNS = ["role", "content", "latency_seconds"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    timestamp_start TEXT,
+    timestamp_end TEXT,
+    duration_seconds REAL,
+    total_messages INTEGER,
+    user_turns INTEGER,
+    agent_turns INTEGER,
+    user_feedback TEXT,
+    average_latency_seconds REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (timestamp_start);
+CREATE INDEX IF NOT EXISTS idx_sessions_feedback ON sessions (user_feedback, timestamp_start);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    content TEXT,
+    latency_seconds REAL,
+    extra TEXT,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS texts (
+    id TEXT PRIMARY KEY,
+    text TEXT
+) WITHOUT ROWID;
+"""
+
+
+def _filters(since: Optional[str], until: Optional[str], feedback: Optional[str]):
+    # Build a WHERE clause over the indexed session columns.
+    clauses, params = [], []
+    if since:
+        clauses.append("timestamp_start >= ?")
+        params.append(since)
+    if until:
+        clauses.append("timestamp_start < ?")
+        params.append(until)
+    if feedback:
+        clauses.append("user_feedback = ?")
+        params.append(feedback)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class SQLiteConversationStore:
+    """
+    Conversation log stored in SQLite.
+
+    Session metadata goes into an indexed `sessions` table and message
+    histories into a separate `messages` table, so listings and aggregates
+    never touch the message text. Prompts are stored by reference: the texts
+    they refer to (system prompt, templates, catalog dumps) are stored once in
+    a `texts` table. The database runs in WAL mode and batches are inserted in
+    a single transaction.
+
+    Attributes:
+        db_path (Path): The SQLite database file.
+    """
+
+    def __init__(self, db_path: Path):
+        """
+        Open (and create if needed) the database.
+
+        Parameters:
+            db_path (Path): The SQLite database file.
+        Returns:
+            None
+        """
+        self.db_path = Path(db_path)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Close the database connection.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._db.close()
+
+    def write_batch(self, logs: List[Dict[str, Any]]):
+        """
+        Insert a batch of conversation log entries in one transaction.
+
+        Parameters:
+            logs (List[Dict[str, Any]]): Log entries as produced by `Chat.log_conversation`.
+        Returns:
+            None
+        """
+        session_rows, message_rows, text_rows = [], [], {}
+        for log in logs:
+            text_rows.update(log.get("texts") or {})
+            try:
+                duration = (parse_time(log["timestamp_end"]) - parse_time(log["timestamp_start"])).total_seconds()
+            except (KeyError, ValueError, TypeError):
+                duration = None
+            extra = {k: v for k, v in log.items()
+                     if k not in SESSION_COLUMNS and k not in ("conversation_history", "texts")}
+            session_rows.append([log.get(column) for column in SESSION_COLUMNS[:3]] + [duration]
+                                + [log.get(column) for column in SESSION_COLUMNS[3:]]
+                                + [json.dumps(extra, ensure_ascii=False) if extra else None])
+            for seq, message in enumerate(log.get("conversation_history", [])):
+                message_extra = {k: v for k, v in message.items() if k not in MESSAGE_COLUMNS}
+                message_rows.append((log.get("session_id"), seq, message.get("role"), message.get("content"),
+                                     message.get("latency_seconds"),
+                                     json.dumps(message_extra, ensure_ascii=False) if message_extra else None))
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 session_rows)
+            self._db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)", message_rows)
+            self._db.executemany("INSERT OR IGNORE INTO texts VALUES (?, ?)", text_rows.items())
+
+    def list_sessions(self, limit: int = 20, offset: int = 0, since: Optional[str] = None,
+                      until: Optional[str] = None, feedback: Optional[str] = None) -> Dict[str, Any]:
+        """
+        List session metadata, newest first.
+
+        Parameters:
+            limit (int): Page size.
+            offset (int): Number of sessions to skip.
+            since (Optional[str]): Only sessions started at or after this ISO timestamp.
+            until (Optional[str]): Only sessions started before this ISO timestamp.
+            feedback (Optional[str]): Only sessions with this feedback value.
+        Returns:
+            Dict[str, Any]: {"items", "total", "limit", "offset"}.
+        """
+        where, params = _filters(since, until, feedback)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(SESSION_COLUMNS)}, duration_seconds FROM sessions{where} "
+                "ORDER BY timestamp_start DESC LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        return {"items": [dict(row) for row in rows], "total": total, "limit": limit, "offset": offset}
+
+    def get_session(self, session_id: str, expand: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get a full log entry, including its conversation history.
+
+        Parameters:
+            session_id (str): The session identifier.
+            expand (bool): Render the prompts stored by reference (otherwise the history keeps the compact records).
+        Returns:
+            Optional[Dict[str, Any]]: The log entry, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(SESSION_COLUMNS)}, extra FROM sessions "
+                                   "WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            messages = self._db.execute("SELECT role, content, latency_seconds, extra FROM messages "
+                                        "WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        log = self._to_log(row, messages)
+        if not expand:
+            return log
+        return expand_log(log, self.get_texts(referenced_text_ids(log["conversation_history"])))
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Get stored texts by id.
+
+        Parameters:
+            ids (List[str]): The text ids.
+        Returns:
+            Dict[str, str]: The texts found, by id.
+        """
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, text FROM texts WHERE id IN ({', '.join('?' * len(ids))})",
+                                    ids).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def aggregate(self, since: Optional[str] = None, until: Optional[str] = None,
+                  feedback: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compute `/logs`-style statistics over a filtered set of sessions.
+
+        Parameters:
+            since (Optional[str]): Only sessions started at or after this ISO timestamp.
+            until (Optional[str]): Only sessions started before this ISO timestamp.
+            feedback (Optional[str]): Only sessions with this feedback value.
+        Returns:
+            Dict[str, Any]: Aggregated statistics.
+        """
+        c = self.aggregate_counters(since, until, feedback)
+        total = c["total_chats"]
+        return {
+            "total_chats": total,
+            "chats_with_feedback": c["chats_with_feedback"],
+            "positive_feedback_percent": round(c["positive_feedback"] / c["chats_with_feedback"] * 100, 2)
+            if c["chats_with_feedback"] else 0,
+            "avg_conversation_duration_sec": round(c["duration_total"] / c["duration_count"], 2)
+            if c["duration_count"] else 0,
+            "avg_messages_per_chat": round(c["total_messages"] / total, 2) if total else 0,
+            "avg_latency_seconds": round(c["latency_total"] / total, 4) if total else 0,
+            "usage_by_stage": format_stage_usage(self.stage_usage(since, until, feedback)),
+        }
+
+    def aggregate_counters(self, since: Optional[str] = None, until: Optional[str] = None,
+                           feedback: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compute raw counters in the format used by `LogAggregator`.
+
+        Parameters:
+            since (Optional[str]): Only sessions started at or after this ISO timestamp.
+            until (Optional[str]): Only sessions started before this ISO timestamp.
+            feedback (Optional[str]): Only sessions with this feedback value.
+        Returns:
+            Dict[str, Any]: Aggregate counters.
+        """
+        where, params = _filters(since, until, feedback)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), "
+                "COALESCE(SUM(user_feedback != 'none'), 0), "
+                "COALESCE(SUM(user_feedback = 'positive'), 0), "
+                "COALESCE(SUM(duration_seconds), 0), COUNT(duration_seconds), "
+                "COALESCE(SUM(total_messages), 0), COALESCE(SUM(average_latency_seconds), 0) "
+                f"FROM sessions{where}", params).fetchone()
+        return {"total_chats": row[0], "chats_with_feedback": row[1], "positive_feedback": row[2],
+                "duration_total": row[3], "duration_count": row[4], "total_messages": row[5],
+                "latency_total": row[6]}
+
+    def stage_usage(self, since: Optional[str] = None, until: Optional[str] = None,
+                    feedback: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Sum the per-stage token usage of a filtered set of sessions.
+
+        Parameters:
+            since (Optional[str]): Only sessions started at or after this ISO timestamp.
+            until (Optional[str]): Only sessions started before this ISO timestamp.
+            feedback (Optional[str]): Only sessions with this feedback value.
+        Returns:
+            Dict[str, Dict[str, float]]: Usage totals per stage.
+        """
+        where, params = _filters(since, until, feedback)
+        with self._lock:
+            rows = self._db.execute(f"SELECT json_extract(extra, '$.usage.by_stage') FROM sessions{where}",
+                                    params).fetchall()
+        stages: Dict[str, Dict[str, float]] = {}
+        for (by_stage,) in rows:
+            if by_stage:
+                merge_stage_usage(stages, json.loads(by_stage))
+        return stages
+
+    def recent_sessions(self, count: int = 5) -> List[Dict[str, Any]]:
+        """
+        Get the most recent sessions in the `/logs` recent_sessions format (oldest first).
+
+        Parameters:
+            count (int): Number of sessions.
+        Returns:
+            List[Dict[str, Any]]: Formatted sessions.
+        """
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions "
+                                    "ORDER BY timestamp_start DESC LIMIT ?", (count,)).fetchall()
+        return [format_session(dict(row)) for row in reversed(rows)]
+
+    def iter_logs(self, expand: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over all full log entries in start-time order.
+
+        Parameters:
+            expand (bool): Render the prompts stored by reference.
+        Returns:
+            Iterator[Dict[str, Any]]: Log entries.
+        """
+        with self._lock:
+            session_ids = [row[0] for row in self._db.execute(
+                "SELECT session_id FROM sessions ORDER BY timestamp_start")]
+        for session_id in session_ids:
+            log = self.get_session(session_id, expand)
+            if log is not None:
+                yield log
+
+    def import_jsonl(self, path: Path, batch_size: int = 500) -> int:
+        """
+        Import an existing JSONL conversation log (and the texts file its prompts refer to).
+
+        Parameters:
+            path (Path): The JSONL file.
+            batch_size (int): Entries per transaction.
+        Returns:
+            int: Number of imported sessions.
+        """
+        texts = TextStore(texts_path(path)).load()
+        if texts:
+            with self._lock, self._db:
+                self._db.executemany("INSERT OR IGNORE INTO texts VALUES (?, ?)", texts.items())
+        count = 0
+        batch = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    self.write_batch(batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self.write_batch(batch)
+            count += len(batch)
+        return count
+
+    @staticmethod
+    def _to_log(row: sqlite3.Row, messages: Iterable[sqlite3.Row]) -> Dict[str, Any]:
+        log = {column: row[column] for column in SESSION_COLUMNS}
+        if row["extra"]:
+            log.update(json.loads(row["extra"]))
+        history = []
+        for message in messages:
+            entry = {"role": message["role"], "content": message["content"],
+                     "latency_seconds": message["latency_seconds"]}
+            if message["extra"]:
+                entry.update(json.loads(message["extra"]))
+            history.append(entry)
+        log["conversation_history"] = history
+        return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation store utilities.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import a JSONL conversation log into SQLite.")
+    import_parser.add_argument("jsonl", type=Path, help="The JSONL log file.")
+    import_parser.add_argument("--db", type=Path, default=Path(__file__).parent / "db" / "conversations.db",
+                               help="The SQLite database file.")
+    args = parser.parse_args()
+
+    store = SQLiteConversationStore(args.db)
+    count = store.import_jsonl(args.jsonl)
+    store.close()
+    print(f"Imported {count} sessions from {args.jsonl} into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
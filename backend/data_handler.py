@@ -1,21 +1,142 @@
 import json
+import os
+import runpy
+import threading
 from pathlib import Path
-from db.categories_map import category_map
+from typing import Callable, Dict, List, Optional, Tuple
+from metrics import CATALOG_LOOKUPS
 CATALOG_PATH = Path(__file__).parent / 'db' / 'products.json'
+CATEGORY_MAP_PATH = Path(__file__).parent / 'db' / 'categories_map.py'
 
-# Load product catalog once at module load time
-with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
-    PRODUCT_CATALOG = json.load(f)
+# How often the catalog files are checked for changes (0 disables hot reload):
+CATALOG_RELOAD_INTERVAL_SECONDS = float(os.getenv("CATALOG_RELOAD_INTERVAL_SECONDS", "5"))
+
+
+class CatalogSnapshot:
+    """
+    An immutable view of the product catalog with its lookup indexes.
+
+    A new snapshot is built on every reload and swapped in with a single
+    assignment, so readers always see a consistent catalog.
+
+    Attributes:
+        version (int): Increases by one on every reload.
+        products (List[Dict]): The product catalog.
+        category_map (Dict[str, List[str]]): Category name to SKU list.
+        sku_index (Dict[str, Dict]): SKU to product.
+        category_index (Dict[str, List[Dict]]): Category name to products.
+        missing_skus (Dict[str, List[str]]): SKUs listed in category_map but absent from the catalog.
+        mtimes (Tuple[float, float]): Modification times of the source files.
+    """
+
+    def __init__(self, version: int, products: List[Dict], category_map: Dict[str, List[str]],
+                 mtimes: Tuple[float, float]):
+        """
+        Build the indexes for a catalog.
+
+        Parameters:
+            version (int): Snapshot version.
+            products (List[Dict]): The product catalog.
+            category_map (Dict[str, List[str]]): Category name to SKU list.
+            mtimes (Tuple[float, float]): Modification times of the source files.
+        Returns:
+            None
+        """
+        self.version = version
+        self.products = products
+        self.category_map = category_map
+        self.mtimes = mtimes
+        self.sku_index = {p["SKU"]: p for p in products}
+        self.category_index = {
+            category: [self.sku_index[sku] for sku in skus if sku in self.sku_index]
+            for category, skus in category_map.items()
+        }
+        self.missing_skus = {
+            category: missing
+            for category, skus in category_map.items()
+            if (missing := [sku for sku in skus if sku not in self.sku_index])
+        }
+
+
+def _source_mtimes() -> Tuple[float, float]:
+    return (os.path.getmtime(CATALOG_PATH), os.path.getmtime(CATEGORY_MAP_PATH))
+
+
+def load_catalog_snapshot(version: int) -> CatalogSnapshot:
+    """
+    Read the catalog files and build a new snapshot.
+
+    Parameters:
+        version (int): Version number for the snapshot.
+    Returns:
+        CatalogSnapshot: The loaded snapshot.
+    """
+    mtimes = _source_mtimes()
+    with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
+        products = json.load(f)
+    category_map = runpy.run_path(str(CATEGORY_MAP_PATH))["category_map"]
+    snapshot = CatalogSnapshot(version, products, category_map, mtimes)
+
+    if len(snapshot.sku_index) != len(products):
+        print(f"WARNING: {len(products) - len(snapshot.sku_index)} duplicate SKUs in {CATALOG_PATH.name}")
+    for category, missing in snapshot.missing_skus.items():
+        print(f"WARNING: Category '{category}' lists SKUs missing from the catalog: {missing}")
+    return snapshot
+
+
+# The catalog is loaded on first use (or by the startup warm-up), not at import time
+_snapshot: Optional[CatalogSnapshot] = None
+_reload_listeners: List[Callable[[CatalogSnapshot], None]] = []
+_reload_lock = threading.Lock()
+
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """
+    Get the current catalog snapshot, loading the catalog on first use.
+
+    Returns:
+        CatalogSnapshot: The current snapshot.
+    """
+    global _snapshot
+    if _snapshot is None:
+        with _reload_lock:
+            if _snapshot is None:
+                _snapshot = load_catalog_snapshot(version=1)
+    return _snapshot
+
+
+def get_catalog_version() -> int:
+    """
+    Get the version of the current catalog snapshot.
+
+    Returns:
+        int: The catalog version.
+    """
+    return get_catalog_snapshot().version
 
 
 def get_product_catalog():
     """
     Get the full product catalog.
-    
+
     Returns:
         List[Dict]: The product catalog.
     """
-    return PRODUCT_CATALOG
+    return get_catalog_snapshot().products
+
+
+def get_product_by_sku(sku: str) -> Optional[Dict]:
+    """
+    Get a product by SKU.
+
+    Parameters:
+        sku (str): The product SKU.
+    Returns:
+        Optional[Dict]: The product, or None if it is not in the catalog.
+    """
+    product = get_catalog_snapshot().sku_index.get(sku)
+    CATALOG_LOOKUPS.inc(kind="sku", result="hit" if product is not None else "miss")
+    return product
 
 
 def get_product_keys():
@@ -25,9 +146,10 @@ def get_product_keys():
     Returns:
         List[str]: The keys of the product items.
     """
-    if not PRODUCT_CATALOG:
+    products = get_catalog_snapshot().products
+    if not products:
         return []
-    return list(PRODUCT_CATALOG[0].keys())
+    return list(products[0].keys())
 
 
 def get_categories():
@@ -37,17 +159,84 @@ def get_categories():
     Returns:
         List[str]: The list of product categories.
     """
-    return list(category_map.keys())
+    return list(get_catalog_snapshot().category_map.keys())
 
 
 def get_products_by_category(category_name: str):
     """
     Get products by category name.
-    
+
     Parameters:
         category_name (str): The name of the category.
     Returns:
         List[Dict]: The list of products in the specified category.
     """
-    skus = category_map.get(category_name, [])
-    return [p for p in PRODUCT_CATALOG if p["SKU"] in skus]
\ No newline at end of file
+    products = get_catalog_snapshot().category_index.get(category_name)
+    CATALOG_LOOKUPS.inc(kind="category", result="hit" if products else "miss")
+    return list(products or [])
+
+
+def on_catalog_reload(callback: Callable[[CatalogSnapshot], None]):
+    """
+    Register a callback that runs after a new catalog snapshot is swapped in.
+
+    Callbacks run on the reloading thread, off the request path.
+
+    Parameters:
+        callback (Callable[[CatalogSnapshot], None]): Receives the new snapshot.
+    Returns:
+        None
+    """
+    _reload_listeners.append(callback)
+
+
+def reload_catalog(force: bool = False) -> bool:
+    """
+    Rebuild the catalog indexes if the source files changed, and swap them in.
+
+    Parameters:
+        force (bool): Reload even if the files did not change.
+    Returns:
+        bool: True if a new snapshot was installed.
+    """
+    global _snapshot
+    get_catalog_snapshot()  # make sure the first snapshot is loaded
+    with _reload_lock:
+        current = _snapshot
+        try:
+            if not force and _source_mtimes() == current.mtimes:
+                return False
+            snapshot = load_catalog_snapshot(current.version + 1)
+        except Exception as e:
+            # Keep serving the previous snapshot if the new files are invalid.
+            print(f"ERROR: Could not reload product catalog. Error: {e}")
+            return False
+        _snapshot = snapshot
+        print(f"Product catalog reloaded (version {snapshot.version}, {len(snapshot.products)} products)")
+        for callback in _reload_listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"ERROR: Catalog reload listener failed. Error: {e}")
+        return True
+
+
+def start_catalog_watcher(interval_seconds: float = CATALOG_RELOAD_INTERVAL_SECONDS) -> Optional[threading.Event]:
+    """
+    Start a daemon thread that polls the catalog files and reloads them on change.
+
+    Parameters:
+        interval_seconds (float): Polling interval (0 disables the watcher).
+    Returns:
+        Optional[threading.Event]: Set the event to stop the watcher, or None if disabled.
+    """
+    if interval_seconds <= 0:
+        return None
+    stop = threading.Event()
+
+    def watch():
+        while not stop.wait(interval_seconds):
+            reload_catalog()
+
+    threading.Thread(target=watch, name="catalog-watcher", daemon=True).start()
+    return stop
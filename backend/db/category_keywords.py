@@ -0,0 +1,42 @@
+category_keywords = {
+    "Business & Travel": [
+        "business", "travel", "traveling", "commute", "office", "meetings", "email", "spreadsheets",
+        "productivity", "lightweight", "portable", "ultraportable", "battery", "thin", "light",
+        "everyday", "work", "excel", "zoom",
+    ],
+
+    "Hybrid & 2-in-1": [
+        "2-in-1", "convertible", "tablet", "touchscreen", "touch", "stylus", "pen", "sketching",
+        "drawing", "note-taking", "notes", "flip", "hybrid", "student",
+    ],
+
+    "Creator Laptops": [
+        "creator", "photo", "photography", "lightroom", "photoshop", "premiere", "youtube",
+        "editing", "content", "design", "oled", "color", "laptop",
+    ],
+
+    "Creative Powerhouse": [
+        "4k", "8k", "video", "filmmaking", "rendering", "3d", "blender", "davinci", "resolve",
+        "after", "effects", "animation", "color-accurate", "professional", "heavy",
+    ],
+
+    "Gaming & High Performance": [
+        "gaming", "game", "games", "gamer", "esports", "fps", "steam", "rtx", "240hz", "144hz",
+        "refresh", "fortnite", "cyberpunk", "high-performance", "streaming",
+    ],
+
+    "Mobile Workstations": [
+        "mobile", "workstation", "cad", "solidworks", "revit", "autocad", "bim", "isv",
+        "certified", "architecture", "on-site", "portable", "engineering", "ml",
+    ],
+
+    "Desktop Workstations": [
+        "desktop", "tower", "workstation", "studio", "expandable", "pcie", "slots", "multi-gpu",
+        "desk", "stationary", "upgradeable", "editors",
+    ],
+
+    "Heavy Engineering & Simulation": [
+        "simulation", "cfd", "fea", "ansys", "matlab", "scientific", "research", "engineering",
+        "cae", "vfx", "training", "ai", "deep", "learning", "cores", "compute",
+    ],
+}
@@ -0,0 +1,327 @@
+import argparse
+import json
+import math
+import os
+import re
+import runpy
+import numpy as np
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from data_handler import get_catalog_snapshot, on_catalog_reload
+from metrics import registry
+KEYWORDS_PATH = Path(__file__).parent / 'db' / 'category_keywords.py'
+
+# Local category classifier (0 disables it):
+INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "1") == "1"
+# Minimum cosine score and lead over the runner-up for skipping the clarification call (a threshold above 1 only logs):
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.3"))
+INTENT_FAST_PATH_MIN_MARGIN = float(os.getenv("INTENT_FAST_PATH_MIN_MARGIN", "0.1"))
+
+# Curated keywords count as this many mentions in a category's document:
+KEYWORD_WEIGHT = 3
+PRODUCT_TEXT_FIELDS = ["Family", "Name", "Description"]
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i i'm im in is it its looking me my need of on or so that the
+this to use want was what will with would you your also just like some get good great something
+""".split())
+
+INTENT_DECISIONS = registry.counter("intent_decisions_total",
+                                    "Clarification turns by local classifier decision (fast_path or model).",
+                                    ["decision"])
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into normalized terms.
+
+    Hyphenated words are kept whole and also split into their parts, single
+    characters are dropped, and a plural 's' is dropped so "games" and "game"
+    share a term.
+
+    Parameters:
+        text (str): The text.
+    Returns:
+        List[str]: The terms, stopwords removed.
+    """
+    terms = []
+    for word in TOKEN_RE.findall((text or "").lower()):
+        parts = [word] + (word.split("-") if "-" in word else [])
+        for part in parts:
+            if len(part) < 2 or part in STOPWORDS:
+                continue
+            if len(part) > 4 and part.endswith("s") and not part.endswith("ss"):
+                part = part[:-1]
+            terms.append(part)
+    return terms
+
+
+class IntentClassifier:
+    """
+    TF-IDF classifier that maps user text onto the catalog categories.
+
+    Each category is one document made of its products' names and descriptions
+    plus curated keywords. The documents are stored as an L2-normalized matrix,
+    so scoring a query against every category is one matrix-vector product.
+
+    Attributes:
+        categories (List[str]): Category names, one per matrix row.
+        vocabulary (Dict[str, int]): Term to column index.
+        idf (np.ndarray): Inverse document frequency per term.
+        matrix (np.ndarray): Normalized category vectors (categories x terms).
+    """
+
+    def __init__(self, documents: Dict[str, List[str]]):
+        """
+        Build the category vectors.
+
+        Parameters:
+            documents (Dict[str, List[str]]): Category name to its terms.
+        Returns:
+            None
+        """
+        self.categories = list(documents)
+        self.vocabulary = {term: i for i, term in enumerate(sorted({t for terms in documents.values()
+                                                                     for t in terms}))}
+        counts = np.zeros((len(self.categories), len(self.vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents.values()):
+            for term, count in Counter(terms).items():
+                counts[row, self.vocabulary[term]] = count
+
+        doc_freq = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(self.categories)) / (1 + doc_freq)) + 1).astype(np.float32)
+        # Sublinear term frequency keeps long product lists from dominating a category.
+        weights = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0) * self.idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        self.matrix = weights / np.maximum(norms, 1e-12)
+
+    def scores(self, text: str) -> np.ndarray:
+        """
+        Score text against every category.
+
+        Parameters:
+            text (str): The user's text.
+        Returns:
+            np.ndarray: Cosine similarity per category (all zeros if no term is known).
+        """
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in Counter(tokenize(text)).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] = 1 + math.log(count)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return np.zeros(len(self.categories), dtype=np.float32)
+        return self.matrix @ (vector / norm)
+
+    def classify(self, text: str, threshold: float = INTENT_FAST_PATH_THRESHOLD,
+                 min_margin: float = INTENT_FAST_PATH_MIN_MARGIN) -> Dict[str, Any]:
+        """
+        Pick the best category for the text and decide whether it is confident enough.
+
+        Parameters:
+            text (str): The user's text.
+            threshold (float): Minimum score of the best category.
+            min_margin (float): Minimum lead of the best category over the runner-up.
+        Returns:
+            Dict[str, Any]: {"category", "confidence", "margin", "fast_path"}.
+        """
+        scores = self.scores(text)
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else 0.0
+        return {"category": self.categories[order[0]] if best > 0 else None,
+                "confidence": round(best, 4),
+                "margin": round(best - runner_up, 4),
+                "fast_path": best > 0 and best >= threshold and best - runner_up >= min_margin}
+
+
+def build_documents(products: List[Dict[str, Any]], category_map: Dict[str, List[str]],
+                    keywords: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Build the term list of every category.
+
+    Parameters:
+        products (List[Dict[str, Any]]): The product catalog.
+        category_map (Dict[str, List[str]]): Category name to SKU list.
+        keywords (Dict[str, List[str]]): Category name to curated keywords.
+    Returns:
+        Dict[str, List[str]]: Category name to terms.
+    """
+    by_sku = {p["SKU"]: p for p in products}
+    documents = {}
+    for category, skus in category_map.items():
+        text = " ".join(str(by_sku[sku].get(field, "")) for sku in skus if sku in by_sku
+                        for field in PRODUCT_TEXT_FIELDS)
+        terms = tokenize(category) + tokenize(text)
+        for keyword in keywords.get(category, []):
+            terms.extend(tokenize(keyword) * KEYWORD_WEIGHT)
+        documents[category] = terms
+    return documents
+
+
+def load_keywords() -> Dict[str, List[str]]:
+    """
+    Read the curated category keywords.
+
+    Returns:
+        Dict[str, List[str]]: Category name to keywords (empty if the file cannot be read).
+    """
+    try:
+        return runpy.run_path(str(KEYWORDS_PATH))["category_keywords"]
+    except Exception as e:
+        print(f"WARNING: Could not load {KEYWORDS_PATH.name}, classifying on product text only. Error: {e}")
+        return {}
+
+
+_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """
+    Get the intent classifier, building it from the catalog on first use.
+
+    Returns:
+        IntentClassifier: The classifier.
+    """
+    global _classifier
+    if _classifier is None:
+        _rebuild_classifier(get_catalog_snapshot())
+    return _classifier
+
+
+def _rebuild_classifier(snapshot):
+    global _classifier
+    _classifier = IntentClassifier(build_documents(snapshot.products, snapshot.category_map, load_keywords()))
+
+
+on_catalog_reload(_rebuild_classifier)
+
+
+def classify_user_messages(messages: List[str], allow_fast_path: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Classify the user's latest messages and count the decision.
+
+    Only the messages sent since the last assistant reply should be passed: once
+    a message clears the threshold, classifying the whole history would let every
+    later turn (e.g. a follow-up question) clear it too.
+
+    Parameters:
+        messages (List[str]): The user's messages since the last assistant reply.
+        allow_fast_path (bool): False once the session already has a recommendation (the decision is only logged).
+    Returns:
+        Optional[Dict[str, Any]]: The decision (see `IntentClassifier.classify`), or None if the classifier is disabled.
+    """
+    if not INTENT_CLASSIFIER_ENABLED:
+        return None
+    decision = get_intent_classifier().classify("\n".join(messages))
+    if not allow_fast_path:
+        decision["fast_path"] = False
+    INTENT_DECISIONS.inc(decision="fast_path" if decision["fast_path"] else "model")
+    return decision
+
+
+def parse_envelope(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a clarification reply's JSON envelope, if it has one.
+
+    Parameters:
+        text (str): The assistant message.
+    Returns:
+        Optional[Dict[str, Any]]: The envelope, or None.
+    """
+    start, end = (text or "").find("{"), (text or "").rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        envelope = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return envelope if isinstance(envelope, dict) and "ready_to_filter" in envelope else None
+
+
+def evaluate_log(log_path: str, thresholds: List[float], min_margin: float) -> List[Dict[str, Any]]:
+    """
+    Replay the classifier over a conversation log and compare it with the model's category choices.
+
+    Every user turn that the model answered before the first recommendation is a
+    sample, scored on the messages sent since the previous reply. A turn where
+    the model selected a category is a positive; the classifier is correct on it
+    when it fires with the same category. A fast path on a turn where the model still
+    asked a question is counted as premature.
+
+    Parameters:
+        log_path (str): Path of a conversations_log.jsonl file.
+        thresholds (List[float]): Confidence thresholds to evaluate.
+        min_margin (float): Margin requirement.
+    Returns:
+        List[Dict[str, Any]]: Per threshold: fired, correct, premature, coverage and precision.
+    """
+    classifier = get_intent_classifier()
+    samples = []  # (scores of the user text so far, model category or None)
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            session = json.loads(line)
+            # As at runtime: the messages since the last reply, and no fast path after a recommendation.
+            user_messages = []
+            recommended = False
+            for entry in session.get("conversation_history", []):
+                if entry.get("role") == "user":
+                    user_messages.append(entry.get("content", ""))
+                elif entry.get("role") == "assistant" and user_messages:
+                    envelope = parse_envelope(entry.get("content", ""))
+                    if envelope is not None and not recommended:
+                        category = envelope.get("selected_category") if envelope.get("ready_to_filter") else None
+                        samples.append(("\n".join(user_messages), category))
+                        recommended = category is not None
+                    user_messages = []
+
+    positives = sum(1 for _, category in samples if category)
+    results = []
+    for threshold in thresholds:
+        fired = correct = premature = 0
+        for text, category in samples:
+            decision = classifier.classify(text, threshold, min_margin)
+            if not decision["fast_path"]:
+                continue
+            fired += 1
+            if category is None:
+                premature += 1
+            elif decision["category"] == category:
+                correct += 1
+        results.append({"threshold": threshold, "samples": len(samples), "positives": positives,
+                        "fired": fired, "correct": correct, "premature": premature,
+                        "coverage": round(correct / positives, 3) if positives else 0.0,
+                        "precision": round(correct / fired, 3) if fired else 0.0})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local intent classifier tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    classify_parser = subparsers.add_parser("classify", help="Classify a message.")
+    classify_parser.add_argument("text")
+    evaluate_parser = subparsers.add_parser("evaluate", help="Compare the classifier with logged model decisions.")
+    evaluate_parser.add_argument("log_path")
+    evaluate_parser.add_argument("--thresholds", default="0.2,0.25,0.3,0.35,0.4,0.5")
+    evaluate_parser.add_argument("--min-margin", type=float, default=INTENT_FAST_PATH_MIN_MARGIN)
+    args = parser.parse_args()
+
+    if args.command == "classify":
+        classifier = get_intent_classifier()
+        print(json.dumps(classifier.classify(args.text)))
+        for category, score in sorted(zip(classifier.categories, classifier.scores(args.text)),
+                                      key=lambda item: -item[1]):
+            print(f"{score:.3f}  {category}")
+    else:
+        thresholds = [float(value) for value in args.thresholds.split(",")]
+        for row in evaluate_log(args.log_path, thresholds, args.min_margin):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+def parse_time(timestamp_str: str) -> datetime:
+    """
+    Parse ISO format timestamp string to datetime object
+
+    Parameters:
+        timestamp_str (str): ISO formatted timestamp string.
+    Returns:
+        datetime: Parsed datetime object.
+    """
+
+    return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+
+
+def format_session(log: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format a log entry for the recent sessions list.
+
+    Parameters:
+        log (Dict[str, Any]): The log entry.
+    Returns:
+        Dict[str, Any]: The formatted session.
+    """
+    return {
+        "session_id": log.get("session_id", "unknown"),
+        "feedback": log.get("user_feedback"),
+        "total_messages": log.get("total_messages", 0),
+        "average_latency_seconds": log.get("average_latency_seconds"),
+    }
+
+
+def merge_stage_usage(stages: Dict[str, Dict[str, float]], by_stage: Dict[str, Dict[str, float]]):
+    """
+    Add a session's per-stage usage (see `Chat.usage_totals`) to running totals.
+
+    Parameters:
+        stages (Dict[str, Dict[str, float]]): The running totals, updated in place.
+        by_stage (Dict[str, Dict[str, float]]): The session's usage per stage.
+    Returns:
+        None
+    """
+    for stage, usage in (by_stage or {}).items():
+        totals = stages.setdefault(stage, {})
+        for field, value in usage.items():
+            totals[field] = totals.get(field, 0) + value
+
+
+def format_stage_usage(stages: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """
+    Format per-stage usage totals for the `/logs` response.
+
+    Parameters:
+        stages (Dict[str, Dict[str, float]]): Usage totals per stage.
+    Returns:
+        Dict[str, Dict[str, float]]: Calls, token totals and averages, cost, latency and tokens/second per stage.
+    """
+    result = {}
+    for stage, t in stages.items():
+        calls = t.get("calls", 0)
+        generation_seconds = t.get("generation_seconds", 0)
+        result[stage] = {
+            "calls": calls,
+            "prompt_tokens": t.get("prompt_tokens", 0),
+            "completion_tokens": t.get("completion_tokens", 0),
+            "avg_prompt_tokens": round(t.get("prompt_tokens", 0) / calls, 1) if calls else 0,
+            "avg_completion_tokens": round(t.get("completion_tokens", 0) / calls, 1) if calls else 0,
+            "avg_latency_seconds": round(t.get("latency_seconds", 0) / calls, 4) if calls else 0,
+            "completion_tokens_per_second": round(t.get("completion_tokens", 0) / generation_seconds, 1)
+            if generation_seconds else 0,
+            "cost_usd": round(t.get("cost_usd", 0), 6),
+        }
+    return result
+
+
+class LogAggregator:
+    """
+    Running aggregate of the conversation log.
+
+    Counters are updated as entries are appended, so `/logs` is served without
+    re-reading the file. The aggregate is persisted to a checkpoint together
+    with the byte offset of the log it covers; on startup only the lines
+    appended after that offset are read.
+
+    Attributes:
+        log_path (Path): The JSONL conversation log.
+        checkpoint_path (Path): Where the aggregate is persisted.
+        recent_count (int): Number of recent sessions to keep.
+        version (int): Increases on every update.
+    """
+
+    def __init__(self, log_path: Path, checkpoint_path: Optional[Path], recent_count: int = 5):
+        """
+        Initialize the aggregator from its checkpoint, if any.
+
+        Parameters:
+            log_path (Path): The JSONL conversation log.
+            checkpoint_path (Optional[Path]): Where the aggregate is persisted (None disables checkpoints).
+            recent_count (int): Number of recent sessions to keep.
+        Returns:
+            None
+        """
+        self.log_path = Path(log_path)
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.recent_count = recent_count
+        self.version = 0
+        self._lock = threading.Lock()
+        self._reset()
+        self._load_checkpoint()
+
+    def _reset(self):
+        self.offset = 0
+        self.counters = {"total_chats": 0, "chats_with_feedback": 0, "positive_feedback": 0,
+                         "duration_total": 0.0, "duration_count": 0, "total_messages": 0}
+        self.recent = deque(maxlen=self.recent_count)
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.offset = data["offset"]
+            self.counters.update(data["counters"])
+            self.recent.extend(data["recent"])
+            self.stages = data.get("stages", {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            print(f"WARNING: Ignoring invalid log checkpoint {self.checkpoint_path}. Error: {e}")
+            self._reset()
+
+    def save_checkpoint(self):
+        """
+        Persist the aggregate and log offset atomically.
+
+        Returns:
+            None
+        """
+        if self.checkpoint_path is None:
+            return
+        with self._lock:
+            data = {"offset": self.offset, "counters": self.counters, "recent": list(self.recent),
+                    "stages": self.stages}
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError as e:
+            print(f"ERROR: Could not write log checkpoint {self.checkpoint_path}. Error: {e}")
+
+    def record(self, log: Dict[str, Any], end_offset: int = None):
+        """
+        Add one conversation log entry to the aggregate.
+
+        Parameters:
+            log (Dict[str, Any]): The log entry.
+            end_offset (int): Byte offset of the log file after the entry was written.
+        Returns:
+            None
+        """
+        with self._lock:
+            counters = self.counters
+            counters["total_chats"] += 1
+            counters["total_messages"] += log.get("total_messages", 0)
+            feedback = log.get("user_feedback", "none")
+            if feedback != "none":
+                counters["chats_with_feedback"] += 1
+                if feedback == "positive":
+                    counters["positive_feedback"] += 1
+            try:
+                duration = parse_time(log["timestamp_end"]) - parse_time(log["timestamp_start"])
+                counters["duration_total"] += duration.total_seconds()
+                counters["duration_count"] += 1
+            except (KeyError, ValueError, TypeError):
+                pass
+            merge_stage_usage(self.stages, (log.get("usage") or {}).get("by_stage"))
+            self.recent.append(format_session(log))
+            if end_offset is not None:
+                self.offset = end_offset
+            self.version += 1
+
+    def record_batch(self, logs: List[Dict[str, Any]], end_offset: int):
+        """
+        Add a batch of written log entries and checkpoint the aggregate.
+
+        Parameters:
+            logs (List[Dict[str, Any]]): The log entries, in file order.
+            end_offset (int): Byte offset of the log file after the batch was written (None if not file-backed).
+        Returns:
+            None
+        """
+        for log in logs:
+            self.record(log)
+        if end_offset is not None:
+            with self._lock:
+                self.offset = end_offset
+        self.save_checkpoint()
+
+    def seed(self, counters: Dict[str, Any], recent: List[Dict[str, Any]],
+             stages: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        Replace the aggregate with counters computed elsewhere (e.g. by a database).
+
+        Parameters:
+            counters (Dict[str, Any]): Counters in the aggregator's format (extra keys are ignored).
+            recent (List[Dict[str, Any]]): Recent sessions, oldest first.
+            stages (Optional[Dict[str, Dict[str, float]]]): Usage totals per stage.
+        Returns:
+            None
+        """
+        with self._lock:
+            self._reset()
+            self.counters.update({k: v for k, v in counters.items() if k in self.counters})
+            self.recent.extend(recent)
+            self.stages = stages or {}
+            self.version += 1
+
+    def reset_offset(self, *_):
+        """
+        Restart tailing at the beginning of a new (rotated) log file, keeping the counters.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.offset = 0
+        self.save_checkpoint()
+
+    def catch_up(self) -> int:
+        """
+        Read the log entries appended after the checkpoint offset.
+
+        If the log is shorter than the offset (it was truncated or replaced),
+        the aggregate is rebuilt from the start of the file.
+
+        Returns:
+            int: Number of entries read.
+        """
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+        if size < self.offset:
+            print(f"Log file {self.log_path} shrank, rebuilding statistics")
+            with self._lock:
+                self._reset()
+
+        count = 0
+        offset = self.offset
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    break  # partially written line, picked up on the next catch-up
+                line_start = offset
+                offset += len(raw_line)
+                line = raw_line.strip()
+                try:
+                    if line:
+                        self.record(json.loads(line), end_offset=offset)
+                        count += 1
+                        continue
+                except ValueError as e:
+                    print(f"WARNING: Skipping invalid log line at offset {line_start}. Error: {e}")
+                with self._lock:
+                    self.offset = offset
+        if count:
+            self.save_checkpoint()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the aggregated statistics in the `/logs` response format.
+
+        Returns:
+            Dict[str, Any]: Aggregated statistics.
+        """
+        with self._lock:
+            c = self.counters
+            total = c["total_chats"]
+            return {
+                "total_chats": total,
+                "chats_with_feedback": c["chats_with_feedback"],
+                "positive_feedback_percent": round(c["positive_feedback"] / c["chats_with_feedback"] * 100, 2)
+                if c["chats_with_feedback"] else 0,
+                "avg_conversation_duration_sec": round(c["duration_total"] / c["duration_count"], 2)
+                if c["duration_count"] else 0,
+                "avg_messages_per_chat": round(c["total_messages"] / total, 2) if total else 0,
+                "usage_by_stage": format_stage_usage(self.stages),
+                "recent_sessions": list(self.recent),
+            }
@@ -0,0 +1,319 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from metrics import LOG_WRITES, LOG_WRITE_SECONDS
+from monitoring_log import TextStore
+
+
+# Log writer configuration:
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "100"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "1"))
+LOG_FSYNC = os.getenv("LOG_FSYNC", "interval")  # 'always', 'interval' or 'never'
+LOG_FSYNC_INTERVAL_SECONDS = float(os.getenv("LOG_FSYNC_INTERVAL_SECONDS", "5"))
+LOG_ROTATE_MAX_MB = float(os.getenv("LOG_ROTATE_MAX_MB", "0"))  # 0 disables size rotation
+LOG_ROTATE_INTERVAL_HOURS = float(os.getenv("LOG_ROTATE_INTERVAL_HOURS", "0"))  # 0 disables time rotation
+LOG_ROTATE_GZIP = os.getenv("LOG_ROTATE_GZIP", "0") == "1"
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Background writer that appends JSON lines to a log file in batches.
+
+    Entries are put on a bounded queue and written by a single task, so disk
+    I/O is not part of request latency. Batches are flushed when they reach
+    `batch_size` entries or after `flush_interval` seconds.
+
+    Attributes:
+        path (Path): The live log file.
+        queue_size (int): Maximum number of queued entries.
+        batch_size (int): Maximum entries per write.
+        flush_interval (float): Maximum seconds an entry waits before being written.
+        fsync_policy (str): 'always' (every batch), 'interval' (at most every fsync_interval) or 'never'.
+        fsync_interval (float): Seconds between fsyncs with the 'interval' policy.
+        rotate_max_bytes (int): Rotate when the file reaches this size (0 disables).
+        rotate_interval (float): Rotate after this many seconds (0 disables).
+        gzip_rotated (bool): Compress rotated files.
+        on_flush (Callable[[List[Dict], int], None]): Called with (entries, end_offset) after each batch.
+        on_rotate (Callable[[Path], None]): Called with the rotated file path.
+        sink (Callable[[List[Dict]], None]): Writes batches somewhere else instead of the file
+            (e.g. a database); on_flush then receives None as the offset and rotation does not apply.
+        text_store (TextStore): Receives the entries' "texts" (prompt texts shared between sessions), which
+            are then left out of the log lines; without it they stay in each line.
+    """
+
+    def __init__(self, path: Path,
+                 queue_size: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL_SECONDS,
+                 fsync_policy: str = LOG_FSYNC,
+                 fsync_interval: float = LOG_FSYNC_INTERVAL_SECONDS,
+                 rotate_max_bytes: int = int(LOG_ROTATE_MAX_MB * 1024 * 1024),
+                 rotate_interval: float = LOG_ROTATE_INTERVAL_HOURS * 3600,
+                 gzip_rotated: bool = LOG_ROTATE_GZIP,
+                 on_flush: Optional[Callable[[List[Dict], int], None]] = None,
+                 on_rotate: Optional[Callable[[Path], None]] = None,
+                 sink: Optional[Callable[[List[Dict]], None]] = None,
+                 text_store: Optional[TextStore] = None):
+        """
+        Initialize the writer (call `start` from the event loop to begin writing in the background).
+
+        Returns:
+            None
+        """
+        if fsync_policy not in ("always", "interval", "never"):
+            raise ValueError("fsync_policy must be 'always', 'interval' or 'never'")
+        self.path = Path(path)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.rotate_max_bytes = rotate_max_bytes
+        self.rotate_interval = rotate_interval
+        self.gzip_rotated = gzip_rotated
+        self.on_flush = on_flush
+        self.on_rotate = on_rotate
+        self.sink = sink
+        self.text_store = text_store
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._file = None
+        self._file_lock = threading.Lock()
+        self._opened_at = time.time()
+        self._last_fsync = time.monotonic()
+        self._counters = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0,
+                          "write_errors": 0, "failed_batches": 0}
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_max = 0.0
+        self._last_flush_seconds = 0.0
+
+    async def start(self):
+        """
+        Start the background writer task on the running event loop.
+
+        Returns:
+            None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Write every queued entry, then stop the background task and close the file.
+
+        Returns:
+            None
+        """
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+            self._queue = None
+        with self._file_lock:
+            if self._file is not None:
+                self._sync(force=True)
+                self._file.close()
+                self._file = None
+
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        """
+        Queue an entry for writing without blocking.
+
+        If the writer is not running, the entry is written synchronously.
+        If the queue is full, the entry is dropped and counted.
+
+        Parameters:
+            entry (Dict[str, Any]): The JSON-serializable log entry.
+        Returns:
+            bool: False if the entry was dropped.
+        """
+        if self._task is None:
+            self._write_batch_safely([entry])
+            return True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self._loop:
+            # Called from another thread: hand the entry over to the writer's loop.
+            self._loop.call_soon_threadsafe(self.submit, entry)
+            return True
+        try:
+            self._queue.put_nowait(entry)
+            self._counters["enqueued"] += 1
+            return True
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            LOG_WRITES.inc(outcome="dropped")
+            print(f"ERROR: Log queue full, dropping entry for session {entry.get('session_id')}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth, flush latency and write counters.
+
+        Returns:
+            Dict[str, Any]: Writer statistics.
+        """
+        batches = self._counters["batches"]
+        return {
+            **self._counters,
+            "running": self._task is not None,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "last_flush_ms": round(self._last_flush_seconds * 1000, 3),
+            "avg_flush_ms": round(self._flush_seconds_total / batches * 1000, 3) if batches else 0,
+            "max_flush_ms": round(self._flush_seconds_max * 1000, 3),
+            "fsync_policy": self.fsync_policy,
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await asyncio.to_thread(self._write_batch_safely, batch)
+
+    def _write_batch_safely(self, batch: List[Dict[str, Any]]):
+        # Any error (e.g. an entry json.dumps cannot serialize) loses this batch, never the writer task.
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            with self._file_lock:
+                self._counters["write_errors"] += 1
+                self._counters["failed_batches"] += 1
+            LOG_WRITES.inc(len(batch), outcome="error")
+            print(f"ERROR: Could not write a batch of {len(batch)} conversation logs. Error: {type(e).__name__}: {e}")
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        if self.sink is not None:
+            self._write_batch_to_sink(batch)
+            return
+        texts: Dict[str, str] = {}
+        lines = []
+        for entry in batch:
+            if self.text_store is not None and "texts" in entry:
+                texts.update(entry["texts"])
+                entry = {key: value for key, value in entry.items() if key != "texts"}
+            lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        data = "".join(lines).encode("utf-8")
+        start = time.perf_counter()
+        with self._file_lock:
+            try:
+                if texts:
+                    self.text_store.write(texts)  # before the lines that refer to them
+                if self._file is None:
+                    self._file = open(self.path, "ab")
+                    self._opened_at = time.time()
+                self._file.write(data)
+                self._file.flush()
+                self._sync(force=self.fsync_policy == "always")
+                end_offset = self._file.tell()
+            except OSError as e:
+                self._counters["write_errors"] += 1
+                LOG_WRITES.inc(len(batch), outcome="error")
+                print(f"ERROR: Could not write to log file {self.path}. Error: {e}")
+                return
+            self._after_write(batch, end_offset, time.perf_counter() - start)
+            if self._should_rotate(end_offset):
+                self._rotate()
+
+    def _write_batch_to_sink(self, batch: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        with self._file_lock:
+            try:
+                self.sink(batch)
+            except Exception as e:
+                self._counters["write_errors"] += 1
+                LOG_WRITES.inc(len(batch), outcome="error")
+                print(f"ERROR: Could not write conversation logs to the log sink. Error: {e}")
+                return
+            self._after_write(batch, None, time.perf_counter() - start)
+
+    def _after_write(self, batch: List[Dict[str, Any]], end_offset: Optional[int], elapsed: float):
+        # Caller must hold the file lock.
+        self._counters["batches"] += 1
+        self._counters["written"] += len(batch)
+        self._last_flush_seconds = elapsed
+        self._flush_seconds_total += elapsed
+        self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
+        LOG_WRITE_SECONDS.observe(elapsed)
+        LOG_WRITES.inc(len(batch), outcome="written")
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch, end_offset)
+            except Exception as e:
+                print(f"ERROR: Log flush callback failed. Error: {e}")
+        print(f"SUCCESS: {len(batch)} conversation logs written in {elapsed * 1000:.1f} ms")
+
+    def _sync(self, force: bool = False):
+        # Caller must hold the file lock.
+        if self._file is None or self.fsync_policy == "never":
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def _should_rotate(self, size: int) -> bool:
+        if self.rotate_max_bytes and size >= self.rotate_max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotated_path(self) -> Path:
+        # Timestamped name, with a counter when a file of the same second (or its .gz) already exists.
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while rotated.exists() or Path(f"{rotated}.gz").exists():
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}-{n}{self.path.suffix}")
+            n += 1
+        return rotated
+
+    def _rotate(self):
+        # Caller must hold the file lock.
+        self._sync(force=True)
+        self._file.close()
+        self._file = None
+        rotated = self._rotated_path()
+        os.replace(self.path, rotated)
+        if self.gzip_rotated:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+            rotated = Path(f"{rotated}.gz")
+        self._counters["rotations"] += 1
+        print(f"Rotated conversation log to {rotated}")
+        if self.on_rotate is not None:
+            try:
+                self.on_rotate(rotated)
+            except Exception as e:
+                print(f"ERROR: Log rotate callback failed. Error: {e}")
@@ -1,21 +1,224 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
 from chat import Chat
-from model import send_to_model
+from sessions import SessionRegistry, SharedSessionRegistry
+from session_store import SessionConflictError, create_session_store
+from log_stats import LogAggregator
+from log_writer import LogWriter
+from conversation_store import SQLiteConversationStore
+from monitoring_log import TextStore, texts_path
+from metrics import registry, EVENT_LOOP_LAG, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, PARSE_FAILURES, PARSE_OUTCOMES
+from streaming import AnswerStreamExtractor, format_ndjson, format_sse
+from answer_parser import AnswerParseError, parse_answer
+from model import complete, stream_from_model, stage_payload, close_client, get_client
+from resilience import ModelResponseError, ModelUnavailableError
+from response_cache import response_cache, payload_key, send_to_model_cached
 from fastapi.middleware.cors import CORSMiddleware
-from prompts import INITIAL_PROMPT, recommendation_prompt, conversation_summary_prompt
-from data_handler import get_products_by_category
+from prompts import get_initial_prompt, conversation_summary_prompt, recommendation_prompt, summary_update_prompt
+from data_handler import get_catalog_snapshot, get_categories, start_catalog_watcher
+from warmup import Warmup
+import asyncio
+import hashlib
+import importlib
 import json
-import re
+import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
-app = FastAPI()
+LOG_FILE_PATH = Path(os.getenv("CONVERSATION_LOG_PATH", str(Path(__file__).parent / 'db' / 'conversations_log.jsonl')))
+LOG_CHECKPOINT_PATH = LOG_FILE_PATH.with_name(LOG_FILE_PATH.stem + '.checkpoint.json')
 
-chat_instance = Chat(INITIAL_PROMPT)
-LOG_FILE_PATH = Path(__file__).parent / 'db' / 'conversations_log.jsonl'
+# Conversation log backend: 'jsonl' (append-only file) or 'sqlite' (indexed, queryable):
+LOG_BACKEND = os.getenv("LOG_BACKEND", "jsonl")
+CONVERSATION_DB_PATH = Path(os.getenv("CONVERSATION_DB_PATH", str(Path(__file__).parent / 'db' / 'conversations.db')))
+
+# Session registry configuration:
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+SESSION_MAX_MEMORY_MB = float(os.getenv("SESSION_MAX_MEMORY_MB", "256"))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+
+# Session backend: 'memory' (this process only) or 'sqlite' / 'redis' (shared by every worker, see session_store.py):
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = Path(os.getenv("SESSION_DB_PATH", str(Path(__file__).parent / 'db' / 'sessions.db')))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "session:")
+
+# Keep the conversation summary up to date in the background after each user turn:
+BACKGROUND_SUMMARY_ENABLED = os.getenv("BACKGROUND_SUMMARY_ENABLED", "1") == "1"
+
+# How often the event loop lag is probed for /metrics:
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+# Reply used when the model's clarification answer cannot be parsed, so the turn still gets a response:
+CLARIFICATION_FALLBACK_MESSAGE = "Sorry, I didn't quite catch that. Could you tell me a bit more about what you need?"
+
+# Reply when another request saved the same session first (shared session backends):
+SESSION_CONFLICT_MESSAGE = "This conversation was updated by another request, please send your message again"
+
+
+if LOG_BACKEND == "sqlite":
+    conversation_store = SQLiteConversationStore(CONVERSATION_DB_PATH)
+    log_aggregator = LogAggregator(LOG_FILE_PATH, None)
+    log_writer = LogWriter(LOG_FILE_PATH, on_flush=log_aggregator.record_batch, sink=conversation_store.write_batch)
+elif LOG_BACKEND == "jsonl":
+    conversation_store = None
+    log_aggregator = LogAggregator(LOG_FILE_PATH, LOG_CHECKPOINT_PATH)
+    log_writer = LogWriter(LOG_FILE_PATH, on_flush=log_aggregator.record_batch,
+                           on_rotate=log_aggregator.reset_offset, text_store=TextStore(texts_path(LOG_FILE_PATH)))
+else:
+    raise ValueError(f"LOG_BACKEND must be 'jsonl' or 'sqlite', got '{LOG_BACKEND}'")
+
+
+def flush_evicted_session(chat: Chat, reason: str):
+    """
+    Queue a session that left the registry for logging.
+
+    Parameters:
+        chat (Chat): The evicted chat session.
+        reason (str): Why the session was evicted ('lru', 'memory' or 'expired').
+    Returns:
+        None
+    """
+    if not chat.has_user_messages():
+        return
+    print(f"Session {chat.session_id} evicted ({reason}), flushing to log")
+    log_conversation(chat)
+
+
+if SESSION_BACKEND == "memory":
+    sessions = SessionRegistry(
+        factory=lambda: Chat(get_initial_prompt()),
+        max_sessions=SESSION_MAX_COUNT,
+        idle_ttl_seconds=SESSION_IDLE_TTL_SECONDS,
+        max_bytes=int(SESSION_MAX_MEMORY_MB * 1024 * 1024),
+        on_evict=flush_evicted_session,
+    )
+else:
+    sessions = SharedSessionRegistry(
+        create_session_store(SESSION_BACKEND, SESSION_DB_PATH, SESSION_REDIS_URL, SESSION_REDIS_PREFIX),
+        initial_prompt=get_initial_prompt,
+        idle_ttl_seconds=SESSION_IDLE_TTL_SECONDS,
+        on_evict=flush_evicted_session,
+    )
+
+
+registry.gauge("sessions_live", "Live chat sessions (shared backends: stored sessions as of the last sweep).",
+               function=lambda: len(sessions))
+registry.gauge("log_queue_depth", "Conversation log entries waiting to be written.",
+               function=lambda: log_writer.stats()["queue_depth"])
+
+
+async def monitor_event_loop_lag():
+    """
+    Background task that measures how late the event loop wakes up from a fixed sleep.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+        EVENT_LOOP_LAG.set(max(loop.time() - start - EVENT_LOOP_LAG_INTERVAL_SECONDS, 0.0))
+
+
+async def sweep_sessions_periodically():
+    """
+    Background task that expires idle sessions at a fixed interval.
+    """
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            expired = await sessions.sweep()
+        except Exception as e:
+            print(f"ERROR: Session sweep failed. Error: {e}")
+            continue
+        if expired:
+            print(f"Expired {expired} idle sessions")
+
+
+async def seed_log_statistics():
+    """
+    Load the /logs statistics from the conversation store, or catch up with the log file.
+
+    Returns:
+        None
+    """
+    if conversation_store is not None:
+        counters = await asyncio.to_thread(conversation_store.aggregate_counters)
+        recent = await asyncio.to_thread(conversation_store.recent_sessions, log_aggregator.recent_count)
+        stages = await asyncio.to_thread(conversation_store.stage_usage)
+        log_aggregator.seed(counters, recent, stages)
+        print(f"Log statistics loaded from {CONVERSATION_DB_PATH} ({counters['total_chats']} sessions)")
+    else:
+        caught_up = await asyncio.to_thread(log_aggregator.catch_up)
+        print(f"Log statistics caught up with {caught_up} new entries")
+
+
+def deferred(module: str, function: str) -> Callable[[], Any]:
+    """
+    Get a warm-up step that imports a module and calls one of its functions.
+
+    The NumPy-backed index modules are imported by their warm-up step (or the
+    first request that needs them) rather than when the app is loaded.
+
+    Parameters:
+        module (str): The module name.
+        function (str): The function to call.
+    Returns:
+        Callable[[], Any]: The step.
+    """
+    def step():
+        return getattr(importlib.import_module(module), function)()
+    return step
+
+
+# Start-up steps, reported by /ready. Log statistics are loaded before serving; the rest
+# fill caches in the background that the first requests would otherwise build.
+warmup = Warmup()
+warmup.add("log_statistics", seed_log_statistics)
+warmup.add("catalog", get_catalog_snapshot)
+warmup.add("initial_prompt", get_initial_prompt)
+warmup.add("catalog_fragments", deferred("catalog_serializer", "precompute_fragments"))
+warmup.add("product_index", deferred("product_index", "get_product_index"))
+warmup.add("intent_classifier", deferred("intent_classifier", "get_intent_classifier"))
+warmup.add("catalog_search", deferred("catalog_search", "get_search_index"))
+warmup.add("model_client", get_client, in_thread=False)  # the client belongs to the event loop
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load log statistics and start background tasks (warm-up, session sweeper, catalog watcher) on startup,
+    and flush live sessions on shutdown.
+    """
+    await warmup.run_step("log_statistics")
+    await log_writer.start()
+    warmup_task = asyncio.create_task(warmup.run())
+    sweeper = asyncio.create_task(sweep_sessions_periodically())
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    catalog_watcher = start_catalog_watcher()
+    yield
+    warmup_task.cancel()
+    sweeper.cancel()
+    lag_monitor.cancel()
+    if catalog_watcher is not None:
+        catalog_watcher.set()
+    await close_client()
+    for chat in await sessions.drain():
+        if chat.has_user_messages():
+            log_conversation(chat)
+    sessions.close()
+    await log_writer.stop()
+    if conversation_store is not None:
+        conversation_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend calls
 app.add_middleware(
@@ -27,14 +230,34 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Count requests and time them per route (streamed responses are timed until their headers are sent).
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path)
+        HTTP_REQUESTS.inc(method=request.method, path=path, status=status)
+
+
 class Message(BaseModel):
     """
     Data model for a chat message.
 
     Attributes:
         text (str): The content of the message.
+        session_id (Optional[str]): The chat session id (a new session is created if missing or unknown).
     """
     text: str
+    session_id: Optional[str] = None
 
 
 class FeedbackData(BaseModel):
@@ -43,8 +266,20 @@ class FeedbackData(BaseModel):
 
     Attributes:
         feedback (str): The user feedback ('positive', 'negative', or 'none').
+        session_id (Optional[str]): The chat session id the feedback refers to.
     """
     feedback: str  # 'positive' / 'negative' / 'none'
+    session_id: Optional[str] = None
+
+
+class SessionData(BaseModel):
+    """
+    Data model identifying a chat session.
+
+    Attributes:
+        session_id (Optional[str]): The chat session id.
+    """
+    session_id: Optional[str] = None
 
 
 @app.post("/chat")
@@ -55,27 +290,72 @@ async def chat(msg: Message):
     Parameters:
         msg (Message): The user's message.
     Returns:
-        Dict[str, Any]: The model's response and recommendation flag.
+        Dict[str, Any]: The model's response, recommendation flag and session id.
     """
+    chat_instance = await sessions.get_or_create(msg.session_id)
     chat_instance.add_user_message(msg.text)
     chat_instance.add_monitoring_log(role="user", text=msg.text)
-    answer, is_rec = call_model()
+    schedule_summary_update(chat_instance)
+    try:
+        answer, is_rec = await call_model(chat_instance)
+    except ModelUnavailableError as e:
+        print("Model unavailable:", e)
+        raise HTTPException(status_code=503, detail="The assistant is temporarily unavailable, please try again")
+    except ModelResponseError as e:
+        print("ERROR: Bad model response:", e)
+        raise HTTPException(status_code=502, detail="The assistant could not answer, please try again")
     chat_instance.add_model_response(answer)
+    try:
+        await sessions.refresh(chat_instance)
+    except SessionConflictError as e:
+        print("Session conflict:", e)
+        raise HTTPException(status_code=409, detail=SESSION_CONFLICT_MESSAGE)
     return {"response": answer,
-            "is_recommendation": is_rec}
+            "is_recommendation": is_rec,
+            "session_id": chat_instance.session_id}
+
+
+@app.post("/chat/stream")
+async def chat_stream(msg: Message):
+    """
+    Handle a chat message and stream the response as server-sent events.
+
+    Events:
+        session: {"session_id"} - sent first.
+        answer: {"text"} - incremental text of the model's "Answer" field.
+        recommendation: {"text"} - incremental recommendation text; replaces any answer text.
+        done: {"response", "is_recommendation", "session_id"} - the final turn result.
+        error: {"detail"} - the model output could not be processed.
+
+    Parameters:
+        msg (Message): The user's message.
+    Returns:
+        StreamingResponse: The event stream.
+    """
+    chat_instance = await sessions.get_or_create(msg.session_id)
+    chat_instance.add_user_message(msg.text)
+    chat_instance.add_monitoring_log(role="user", text=msg.text)
+    schedule_summary_update(chat_instance)
+    return StreamingResponse(stream_chat_turn(chat_instance), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.post("/new_chat")
-async def new_chat():
+async def new_chat(data: Optional[SessionData] = None):
     """
     Start a new chat session, logging the previous one.
-    
+
+    Parameters:
+        data (Optional[SessionData]): The session to close.
     Returns:
-        Dict[str, str]: Status message.
+        Dict[str, str]: Status message and the new session id.
     """
-    log_conversation()
-    chat_instance.new_chat()
-    return {"status": "chat reset"}
+    previous = await sessions.pop(data.session_id if data else None)
+    if previous is not None and previous.has_user_messages():
+        log_conversation(previous)
+    chat_instance = await sessions.create()
+    return {"status": "chat reset",
+            "session_id": chat_instance.session_id}
 
 
 @app.post("/feedback")
@@ -88,288 +368,623 @@ async def feedback(data: FeedbackData):
     Returns:
         Dict[str, str]: Status
     """
-    chat_instance.set_feedback(data.feedback)
+    # Feedback is cheap to re-apply, so a conflicting save is retried on the latest version.
+    for attempt in range(3):
+        chat_instance = await sessions.get(data.session_id)
+        if chat_instance is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired session")
+        chat_instance.set_feedback(data.feedback)
+        try:
+            await sessions.refresh(chat_instance)
+            break
+        except SessionConflictError:
+            if attempt == 2:
+                raise HTTPException(status_code=409, detail=SESSION_CONFLICT_MESSAGE)
     print(f"Feedback received: {data.feedback}")
     return {"status": "feedback received"}
 
 
+class BatchItem(BaseModel):
+    """
+    Data model for one batch recommendation item.
+
+    Attributes:
+        summary (str): Summary of the shopper's needs.
+        category (str): The product category.
+        id (Optional[str]): Caller's identifier, echoed in the result.
+    """
+    summary: str
+    category: str
+    id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    """
+    Data model for a batch recommendation request sent as one JSON document.
+
+    Attributes:
+        items (List[BatchItem]): The items (at most BATCH_MAX_ITEMS; send larger batches as NDJSON).
+        concurrency (Optional[int]): Model calls in flight (capped at BATCH_MAX_CONCURRENCY).
+        progress_every (Optional[int]): Completed items between progress records (0 disables).
+    """
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+    progress_every: Optional[int] = None
+
+
+@app.post("/recommend/batch")
+async def recommend_batch(request: Request, concurrency: Optional[int] = None, progress_every: Optional[int] = None):
+    """
+    Compute recommendations for a batch of {summary, category} items, streamed as NDJSON.
+
+    The body is either a `BatchRequest` JSON document, or (with Content-Type
+    application/x-ndjson) one item per line, spooled to a temporary file as it
+    arrives and read back as the workers free up, so a large batch is not held
+    in memory. For NDJSON bodies `concurrency` and `progress_every` come from
+    the query string.
+
+    Records (one JSON object per line, results in completion order):
+        result: {"index", "id", "category", "recommendation", "cached", "latency_seconds", "usage"},
+            or {"index", "id", "category", "error"} for an item that failed.
+        progress: {"completed", "total", "errors", "elapsed_seconds"}.
+        summary: totals, sent last.
+
+    Parameters:
+        request (Request): The request with the batch body.
+        concurrency (Optional[int]): Model calls in flight, for NDJSON bodies.
+        progress_every (Optional[int]): Completed items between progress records, for NDJSON bodies.
+    Returns:
+        StreamingResponse: The NDJSON stream.
+    """
+    from recommendations import (BATCH_MAX_CONCURRENCY, BATCH_MAX_ITEMS, BATCH_PROGRESS_EVERY, iter_spooled, run_batch,
+                                 spool_ndjson)
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        try:
+            spool, total = await spool_ndjson(request.stream())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        items = iter_spooled(spool)
+    else:
+        try:
+            body = BatchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        if len(body.items) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch, "
+                                                        "send larger batches as application/x-ndjson")
+        items, total = (item.model_dump() for item in body.items), len(body.items)
+        concurrency, progress_every = body.concurrency, body.progress_every
+    print(f"Batch of {total} recommendations started")
+    records = run_batch(items, concurrency=concurrency or BATCH_MAX_CONCURRENCY,
+                        progress_every=BATCH_PROGRESS_EVERY if progress_every is None else progress_every,
+                        total=total)
+    return StreamingResponse((format_ndjson(record) async for record in records), media_type="application/x-ndjson")
+
+
 @app.get("/logs")
-async def get_logs():
+async def get_logs(request: Request):
     """
     Get aggregated logs statistics.
 
+    The statistics are maintained incrementally as conversations are logged.
+    Responses carry an ETag; a matching If-None-Match returns 304.
+
+    Parameters:
+        request (Request): The incoming request.
     Returns:
         Dict[str, Any]: Aggregated statistics from the logs.
     """
-    logs = read_logs_from_file(LOG_FILE_PATH)
-    
-    # If no logs, return empty stats
-    if not logs:
-        return get_empty_stats()
-    
-    # Calculate statistics
-    feedback_count, positive_percent = calculate_feedback_stats(logs)
-    
-    # Compile final stats
     stats = {
-        "total_chats": len(logs),
-        "chats_with_feedback": feedback_count,
-        "positive_feedback_percent": positive_percent,
-        "avg_conversation_duration_sec": calculate_avg_duration(logs),
-        "avg_messages_per_chat": calculate_avg_messages(logs),
-        "recent_sessions": format_recent_sessions(logs)
+        **log_aggregator.stats(),
+        "response_cache": response_cache.stats()
     }
-    
-    return stats
+
+    etag = '"' + hashlib.sha1(json.dumps(stats, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(stats, headers={"ETag": etag})
 
 
-def read_logs_from_file(file_path: str) -> List[Dict[str, Any]]:
+@app.get("/sessions/stats")
+async def get_session_stats():
     """
-    Read and parse log entries from file.
+    Get session registry counters (hits, misses, evictions) and occupancy.
 
-    Parameters:
-        file_path (str): Path to the log file.
     Returns:
-        List[Dict[str, Any]]: List of log entries.
+        Dict[str, Any]: Session registry statistics.
     """
-
-    logs = []
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    logs.append(json.loads(line))
-    except FileNotFoundError:
-        return []
-    return logs
+    return sessions.stats()
 
 
-def get_empty_stats() -> Dict[str, Any]:
+@app.get("/ready")
+async def get_readiness():
     """
-    Return empty statistics structure.
-    
+    Report start-up warm-up progress (503 until every step has finished).
+
     Returns:
-        Dict[str, Any]: Empty statistics.
+        JSONResponse: ready, completed/total steps, elapsed seconds and per-step status and duration.
     """
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
-    return {
-        "total_chats": 0,
-        "chats_with_feedback": 0,
-        "positive_feedback_percent": 0,
-        "avg_conversation_duration_sec": 0,
-        "avg_messages_per_chat": 0,
-        "recent_sessions": []
-    }
 
-
-def calculate_feedback_stats(logs: List[Dict[str, Any]]) -> tuple[int, float]:
+@app.get("/metrics")
+async def get_metrics():
     """
-    Calculate feedback statistics.
-    
+    Expose the metrics registry in the Prometheus text format.
+
     Returns:
-        tuple: (chats_with_feedback_count, positive_feedback_percent)
+        PlainTextResponse: The metrics exposition.
     """
-    chats_with_feedback = [log for log in logs if log["user_feedback"] != "none"]
-    positive_feedback = [log for log in chats_with_feedback if log["user_feedback"] == "positive"]
-    
-    feedback_count = len(chats_with_feedback)
-    positive_percent = round((len(positive_feedback) / feedback_count) * 100, 2) if feedback_count > 0 else 0
-    
-    return feedback_count, positive_percent
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
-def calculate_avg_duration(logs: List[Dict[str, Any]]) -> float:
+@app.get("/logs/writer")
+async def get_log_writer_stats():
     """
-    Calculate average conversation duration in seconds.
-    
+    Get the background log writer's queue depth, flush latency and counters.
+
     Returns:
-        float: Average duration in seconds.
+        Dict[str, Any]: Log writer statistics.
     """
-    total_duration = 0
-    valid_durations = 0
-    
-    for log in logs:
-        try:
-            start = parse_time(log["timestamp_start"])
-            end = parse_time(log["timestamp_end"])
-            total_duration += (end - start).total_seconds()
-            valid_durations += 1
-        except (KeyError, ValueError, TypeError):
-            continue
-    
-    return round(total_duration / valid_durations, 2) if valid_durations > 0 else 0
+    return log_writer.stats()
 
 
-def calculate_avg_messages(logs: List[Dict[str, Any]]) -> float:
+def require_conversation_store() -> SQLiteConversationStore:
     """
-    Calculate average messages per chat.
+    Get the conversation store, failing the request if the SQLite backend is not enabled.
 
-    Parameters:
-        logs (List[Dict[str, Any]]): List of log entries.
+    Returns:
+        SQLiteConversationStore: The conversation store.
     """
-
-    if not logs:
-        return 0
-    total_messages = sum(log.get("total_messages", 0) for log in logs)
-    return round(total_messages / len(logs), 2)
+    if conversation_store is None:
+        raise HTTPException(status_code=501, detail="Conversation queries require LOG_BACKEND=sqlite")
+    return conversation_store
 
 
-def format_recent_sessions(logs: List[Dict[str, Any]], count: int = 5) -> List[Dict[str, Any]]:
+@app.get("/conversations")
+async def list_conversations(limit: int = 20, offset: int = 0, since: Optional[str] = None,
+                             until: Optional[str] = None, feedback: Optional[str] = None):
     """
-    Format recent sessions for response.
+    List logged sessions (metadata only), newest first.
 
     Parameters:
-        logs (List[Dict[str, Any]]): List of log entries.
-        count (int): Number of recent sessions to return.
+        limit (int): Page size (1-500).
+        offset (int): Number of sessions to skip.
+        since (Optional[str]): Only sessions started at or after this ISO timestamp.
+        until (Optional[str]): Only sessions started before this ISO timestamp.
+        feedback (Optional[str]): Only sessions with this feedback ('positive', 'negative' or 'none').
     Returns:
-        List[Dict[str, Any]]: Formatted recent sessions.
+        Dict[str, Any]: {"items", "total", "limit", "offset"}.
     """
+    store = require_conversation_store()
+    if not 1 <= limit <= 500 or offset < 0:
+        raise HTTPException(status_code=422, detail="limit must be 1-500 and offset must not be negative")
+    return await asyncio.to_thread(store.list_sessions, limit, offset, since, until, feedback)
 
-    return [
-        {
-            "session_id": log.get("session_id", "unknown"),
-            "feedback": log.get("user_feedback"),
-            "total_messages": log.get("total_messages", 0),
-            "average_latency_seconds": log.get("average_latency_seconds"),
-        }
-        for log in logs[-count:]
-    ]
 
-
-def parse_time(timestamp_str: str) -> datetime:
+@app.get("/conversations/stats")
+async def get_conversation_stats(since: Optional[str] = None, until: Optional[str] = None,
+                                 feedback: Optional[str] = None):
     """
-    Parse ISO format timestamp string to datetime object
-    
+    Get aggregated statistics over logged sessions, filtered by time range or feedback.
+
     Parameters:
-        timestamp_str (str): ISO formatted timestamp string.
+        since (Optional[str]): Only sessions started at or after this ISO timestamp.
+        until (Optional[str]): Only sessions started before this ISO timestamp.
+        feedback (Optional[str]): Only sessions with this feedback ('positive', 'negative' or 'none').
     Returns:
-        datetime: Parsed datetime object.
+        Dict[str, Any]: Aggregated statistics.
     """
-
-    return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    store = require_conversation_store()
+    return await asyncio.to_thread(store.aggregate, since, until, feedback)
 
 
-def parse_json_answer(answer: str):
+@app.get("/conversations/{session_id}")
+async def get_conversation(session_id: str, expand: bool = True):
     """
-    Extract and safely parse JSON from the model's output.
-    
-    Parameters:    
-        answer (str): The model's output containing JSON.
+    Get a logged session with its full conversation history.
+
+    Parameters:
+        session_id (str): The session identifier.
+        expand (bool): Render prompts stored by reference (false returns the compact records).
     Returns:
-        dict: Parsed JSON data.
+        Dict[str, Any]: The log entry.
     """
+    store = require_conversation_store()
+    log = await asyncio.to_thread(store.get_session, session_id, expand)
+    if log is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return log
 
-    # Try to extract valid JSON block from the text
-    match = re.search(r"\{.*\}", answer, re.DOTALL)
-    if not match:
-        raise ValueError(f"No JSON found in model output: {answer}")
-    json_text = match.group(0)
 
+def parse_model_answer(answer: str, stage: str = "clarification") -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Parse the model's JSON envelope with the tolerant parser and count the outcome.
+
+    Parameters:
+        answer (str): The model's output.
+        stage (str): The pipeline stage, used to label metrics.
+    Returns:
+        tuple: (envelope (Optional[Dict]) - None if the reply could not be used,
+        outcome (str) - 'ok', 'repaired', 'plain_text' or 'failed')
+    """
     try:
-        return json.loads(json_text)
-    except json.JSONDecodeError as e:
-        print("JSON decode error:", e)
-        print("Offending text:", json_text)
-        raise
+        parsed, outcome = parse_answer(answer, get_categories())
+    except AnswerParseError as e:
+        print("Error parsing model response:", e)
+        PARSE_FAILURES.inc(stage=stage)
+        parsed, outcome = None, "failed"
+    PARSE_OUTCOMES.inc(stage=stage, outcome=outcome)
+    return parsed, outcome
 
 
-def call_model():
+async def call_model(chat_instance: Chat):
     """
     Call the language model with the current chat context and process the response.
-    
+
+    If the local intent classifier is confident about the category, the
+    clarification call is skipped and the recommendation is requested directly.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
     Returns:
         tuple: (model_answer (str), is_recommendation (bool))
     """
+    intent = classify_intent(chat_instance)
+    if intent and intent["fast_path"]:
+        print("Intent classifier selected category:", intent["category"])
+        return await get_product_recommendations(chat_instance, intent["category"])
+
+    messages, context_tokens = chat_instance.get_context()
     start_time = datetime.now()
-    answer = send_to_model(chat_instance.get_chat())
+    result = await complete(messages, "clarification")
+    answer = result["content"]
     end_time = datetime.now()
     latency_seconds = (end_time - start_time).total_seconds()
-    chat_instance.add_monitoring_log(role="assistant", text=answer, latency_seconds=latency_seconds)
+    parsed, parse_outcome = parse_model_answer(answer)
+    chat_instance.add_monitoring_log(role="assistant", text=answer, latency_seconds=latency_seconds,
+                                     context_tokens=context_tokens, context_messages=len(messages),
+                                     stage="clarification", intent=intent, parse_outcome=parse_outcome,
+                                     **model_call_fields(result))
     print("Model answer:", answer)
 
     # analyze response:
+    if parsed is None:
+        return CLARIFICATION_FALLBACK_MESSAGE, False
+    text_to_user = parsed["Answer"]
+    ready = parsed["ready_to_filter"]
+    category = parsed["selected_category"]
+
+    if ready:
+        print("Getting product recommendations for category:", category)
+        return await get_product_recommendations(chat_instance, category)
+    else:  # don't have enough info yet, ask for clarification
+        return text_to_user, False
+
+
+def classify_intent(chat_instance: Chat) -> Optional[Dict[str, Any]]:
+    """
+    Run the local intent classifier over the user's messages since the last reply.
+
+    The fast path is not taken once the session has a recommendation, so follow-up
+    questions go to the model. A fast-path decision is recorded in the monitoring log here; other decisions
+    are attached to the clarification entry by the caller.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
+    Returns:
+        Optional[Dict[str, Any]]: The decision (see `IntentClassifier.classify`), or None if the classifier is disabled.
+    """
+    from intent_classifier import classify_user_messages
+    intent = classify_user_messages(chat_instance.user_messages_since_reply(),
+                                    allow_fast_path=not chat_instance.has_recommendation())
+    if intent and intent["fast_path"]:
+        chat_instance.add_monitoring_log(role="system", text=f"Intent classifier selected '{intent['category']}'",
+                                         stage="intent", intent=intent)
+    return intent
+
+
+def model_call_fields(call_info: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Get the monitoring log fields of a model call (usage, plus retries, hedges and coalesced when set).
+
+    Parameters:
+        call_info (Optional[Dict[str, Any]]): {"usage", "retries", "hedges", "coalesced"}, or None for a cache hit.
+    Returns:
+        Dict[str, Any]: Keyword arguments for `Chat.add_monitoring_log`.
+    """
+    if not call_info:
+        return {}
+    return {"usage": call_info.get("usage"), "retries": call_info.get("retries") or None,
+            "hedges": call_info.get("hedges") or None, "coalesced": call_info.get("coalesced") or None}
+
+
+def format_chat_history(messages: List[Dict[str, str]]) -> str:
+    """
+    Render chat messages as "role: content" lines for summary prompts.
+
+    Parameters:
+        messages (List[Dict[str, str]]): The chat messages.
+    Returns:
+        str: The rendered messages.
+    """
+    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+
+
+def schedule_summary_update(chat_instance: Chat):
+    """
+    Start a background update of the chat summary covering the latest user message.
+
+    Updates are chained, so they apply in order even if a previous one is still running.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
+    Returns:
+        None
+    """
+    if not BACKGROUND_SUMMARY_ENABLED:
+        return
+    upto = len(chat_instance.get_chat())
+    chat_instance.summary_task = asyncio.create_task(
+        update_chat_summary(chat_instance, chat_instance.summary_task, upto))
+
+
+async def update_chat_summary(chat_instance: Chat, previous_task, upto: int):
+    """
+    Fold the messages not yet covered by the chat summary into it.
+
+    Only the new messages are sent to the model, together with the previous summary.
+    With a shared session backend the summary is stored with the turn if it is ready
+    by then; otherwise it is lost and the next update covers the messages again.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
+        previous_task (Optional[asyncio.Task]): The previous update, awaited first.
+        upto (int): Number of chat messages the updated summary should cover.
+    Returns:
+        Optional[float]: Seconds spent in the model call, or None if the update failed.
+    """
+    if previous_task is not None:
+        await previous_task
+    if chat_instance.summary_upto >= upto:
+        return 0.0
+
+    new_messages = format_chat_history(chat_instance.get_chat()[chat_instance.summary_upto:upto])
+    if chat_instance.summary is None:
+        prompt_text = conversation_summary_prompt.format(chat_history=new_messages)
+    else:
+        prompt_text = summary_update_prompt.format(previous_summary=chat_instance.summary,
+                                                   new_messages=new_messages)
+    start_time = datetime.now()
     try:
-        parsed = parse_json_answer(answer)
-
-        text_to_user = parsed["Answer"]
-        ready = parsed["ready_to_filter"]
-        category = parsed["selected_category"]
-
-        if ready:
-            print("Getting product recommendations for category:", category)
-            return get_product_recommendations(category)
-        else:  # don't have enough info yet, ask for clarification
-            return text_to_user, False
-        
+        summary, _, call_info = await send_to_model_cached(prompt_text, "summary")
     except Exception as e:
-        print("Error parsing model response:", e)
+        print("Background summary update failed:", e)
+        return None
+    model_seconds = (datetime.now() - start_time).total_seconds()
+    if call_info and call_info["usage"]:
+        chat_instance.record_usage("summary", call_info["usage"], model_seconds)
+    chat_instance.summary = summary
+    chat_instance.summary_upto = upto
+    return model_seconds
 
 
-def get_chat_summary():
+async def resolve_chat_summary(chat_instance: Chat) -> str:
+    """
+    Get a summary covering the whole chat, preferring the background one.
+
+    Falls back to the synchronous `get_chat_summary` if the background summary
+    failed or does not cover the latest user message.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
+    Returns:
+        str: The chat summary.
+    """
+    task = chat_instance.summary_task
+    if task is not None:
+        start_time = datetime.now()
+        model_seconds = await task
+        waited_seconds = (datetime.now() - start_time).total_seconds()
+        if model_seconds is not None and chat_instance.summary_upto >= len(chat_instance.get_chat()):
+            saved_seconds = max(model_seconds - waited_seconds, 0.0)
+            chat_instance.add_monitoring_log(role="assistant", text=chat_instance.summary,
+                                             latency_seconds=waited_seconds, stage="summary",
+                                             summary_source="background",
+                                             latency_saved_seconds=round(saved_seconds, 4))
+            print(f"Using background summary (saved {saved_seconds:.3f}s):", chat_instance.summary)
+            return chat_instance.summary
+        print("Background summary is stale or failed, falling back to synchronous summary")
+    return await get_chat_summary(chat_instance)
+
+
+async def get_chat_summary(chat_instance: Chat):
     """
     Generate a summary of the chat conversation so far use the model.
 
+    Parameters:
+        chat_instance (Chat): The chat session.
     Returns:
         str: The chat summary.
     """
 
     print("Generating chat summary...")
     chat_history = chat_instance.get_chat()[1:]  # exclude system prompt
-    chat_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in chat_history])
+    chat_text = format_chat_history(chat_history)
     prompt_text = conversation_summary_prompt.format(chat_history=chat_text)
-    chat_instance.add_monitoring_log(role="system", text=prompt_text)
+    chat_instance.add_monitoring_prompt(conversation_summary_prompt, chat_history=chat_text)
 
     # call model:
     start_time = datetime.now()
-    summary = send_to_model(prompt_text)
+    summary, cached, call_info = await send_to_model_cached(prompt_text, "summary")
     end_time = datetime.now()
     latency_seconds = (end_time - start_time).total_seconds()
-    chat_instance.add_monitoring_log(role="assistant", text=summary, latency_seconds=latency_seconds)
+    chat_instance.add_monitoring_log(role="assistant", text=summary, latency_seconds=latency_seconds, cached=cached,
+                                     summary_source="sync", stage="summary", **model_call_fields(call_info))
     print("Chat summary:", summary)
     return summary
 
 
-def get_product_recommendations(category):
+async def build_recommendation_prompt(chat_instance: Chat, category) -> str:
+    """
+    Summarize the chat and render the recommendation prompt for a category.
+
+    The candidates are selected by `recommendations.render_candidate_products`. The monitoring
+    log keeps the prompt as its template and parameters.
+
+    Parameters:
+        chat_instance (Chat): The chat session.
+        category (str): The product category for recommendations.
+    Returns:
+        str: The rendered recommendation prompt.
+    """
+    from recommendations import recommendation_params
+    # First, get chat summary, then create recommendation prompt
+    chat_summary = await resolve_chat_summary(chat_instance)
+    params = recommendation_params(chat_summary, category)
+    prompt_text = recommendation_prompt.format(**params)
+    chat_instance.add_monitoring_prompt(recommendation_prompt, **params)
+    print("Recommendation prompt text:", prompt_text)
+    return prompt_text
+
+
+async def get_product_recommendations(chat_instance: Chat, category):
     """
     Get product recommendations based on the chat summary and category.
 
     Parameters:
+        chat_instance (Chat): The chat session.
         category (str): The product category for recommendations.
     Returns:
         tuple: (recommendation (str), True)
     """
-    # First, get chat summary and extract products
-    chat_summary = get_chat_summary()
-    products = get_products_by_category(category)
-    products = "\n".join([str(p) for p in products])
-
-    # Now, create recommendation prompt
-    prompt_text = recommendation_prompt.format(chat_summary=chat_summary, products_str=products)
-    chat_instance.add_monitoring_log(role="system", text=prompt_text)
-    print("Recommendation prompt text:", prompt_text)
+    prompt_text = await build_recommendation_prompt(chat_instance, category)
 
     # Call model for recommendation
     start_time = datetime.now()
-    recommendation = send_to_model(prompt_text)
+    recommendation, cached, call_info = await send_to_model_cached(prompt_text, "recommendation")
     end_time = datetime.now()
     latency_seconds = (end_time - start_time).total_seconds()
-    chat_instance.add_monitoring_log(role="assistant", text=recommendation, latency_seconds=latency_seconds)
+    chat_instance.add_monitoring_log(role="assistant", text=recommendation, latency_seconds=latency_seconds, cached=cached,
+                                     stage="recommendation", **model_call_fields(call_info))
     print("Product recommendation:", recommendation)
     return recommendation, True
 
 
-def log_conversation():
-    """
-    Log the current conversation to the log file.
+async def stream_chat_turn(chat_instance: Chat):
     """
-    log_entry = chat_instance.log_conversation()
+    Run one chat turn in streaming mode, yielding server-sent events.
+
+    The "Answer" field is forwarded while the JSON envelope is still being
+    generated; `ready_to_filter` and `selected_category` are resolved from the
+    complete envelope once the stream ends. When the local intent classifier is
+    confident, the clarification call is skipped and the recommendation streams directly.
 
+    Parameters:
+        chat_instance (Chat): The chat session.
+    Returns:
+        AsyncIterator[str]: Encoded server-sent events.
+    """
+    yield format_sse("session", {"session_id": chat_instance.session_id})
+
+    intent = classify_intent(chat_instance)
+    if intent and intent["fast_path"]:
+        ready, category = True, intent["category"]
+    else:
+        extractor = AnswerStreamExtractor()
+        streamed_answer = False
+        parts = []
+        first_token_seconds = None
+        messages, context_tokens = chat_instance.get_context()
+        usage, call_stats = {}, {}
+        start_time = datetime.now()
+        try:
+            async for delta in stream_from_model(messages, usage, "clarification", call_stats):
+                if first_token_seconds is None:
+                    first_token_seconds = (datetime.now() - start_time).total_seconds()
+                parts.append(delta)
+                text = extractor.feed(delta)
+                if text:
+                    streamed_answer = True
+                    yield format_sse("answer", {"text": text})
+        except Exception as e:
+            print("Error streaming model response:", e)
+            yield format_sse("error", {"detail": "model request failed"})
+            return
+        answer = "".join(parts)
+        latency_seconds = (datetime.now() - start_time).total_seconds()
+        parsed, parse_outcome = parse_model_answer(answer)
+        chat_instance.add_monitoring_log(role="assistant", text=answer, latency_seconds=latency_seconds,
+                                         time_to_first_token_seconds=first_token_seconds,
+                                         context_tokens=context_tokens, context_messages=len(messages),
+                                         stage="clarification", intent=intent, parse_outcome=parse_outcome,
+                                         usage=usage or None, retries=call_stats.get("retries"))
+        print("Model answer:", answer)
+
+        if parsed is None:
+            response_text, ready, category = CLARIFICATION_FALLBACK_MESSAGE, False, None
+        else:
+            response_text = parsed["Answer"]
+            ready = parsed["ready_to_filter"]
+            category = parsed["selected_category"]
+        if not streamed_answer and not ready:
+            # Nothing was forwarded while streaming (plain-text or unusable reply).
+            yield format_sse("answer", {"text": response_text})
+
+    if ready:
+        print("Getting product recommendations for category:", category)
+        prompt_text = await build_recommendation_prompt(chat_instance, category)
+        cache_key = payload_key(stage_payload(prompt_text, "recommendation"))
+        start_time = datetime.now()
+        cached_text = await response_cache.get(cache_key)
+        if cached_text is not None:
+            response_text = cached_text
+            yield format_sse("recommendation", {"text": response_text})
+            latency_seconds = (datetime.now() - start_time).total_seconds()
+            chat_instance.add_monitoring_log(role="assistant", text=response_text, latency_seconds=latency_seconds,
+                                             cached=True, stage="recommendation")
+        else:
+            parts = []
+            first_token_seconds = None
+            usage, call_stats = {}, {}
+            try:
+                async for delta in stream_from_model(prompt_text, usage, "recommendation", call_stats):
+                    if first_token_seconds is None:
+                        first_token_seconds = (datetime.now() - start_time).total_seconds()
+                    parts.append(delta)
+                    yield format_sse("recommendation", {"text": delta})
+            except Exception as e:
+                print("Error streaming recommendation:", e)
+                yield format_sse("error", {"detail": "model request failed"})
+                return
+            response_text = "".join(parts)
+            latency_seconds = (datetime.now() - start_time).total_seconds()
+            await response_cache.put(cache_key, response_text, "recommendation")
+            chat_instance.add_monitoring_log(role="assistant", text=response_text, latency_seconds=latency_seconds,
+                                             time_to_first_token_seconds=first_token_seconds, cached=False,
+                                             stage="recommendation", usage=usage or None,
+                                             retries=call_stats.get("retries"))
+        print("Product recommendation:", response_text)
+
+    chat_instance.add_model_response(response_text)
     try:
-        with open(LOG_FILE_PATH, 'a', encoding='utf-8') as f:
-            json_line = json.dumps(log_entry, ensure_ascii=False)
-            f.write(json_line + '\n')
-        print(f"SUCCESS: Conversation log saved for session {log_entry['session_id']}")
-    except IOError as e:
-        print(f"ERROR: Could not write to log file {LOG_FILE_PATH}. Error: {e}")
-    
+        await sessions.refresh(chat_instance)
+    except SessionConflictError as e:
+        print("Session conflict:", e)
+        yield format_sse("error", {"detail": SESSION_CONFLICT_MESSAGE})
+        return
+    yield format_sse("done", {"response": response_text,
+                              "is_recommendation": bool(ready),
+                              "session_id": chat_instance.session_id})
+
+
+def log_conversation(chat_instance: Chat):
+    """
+    Queue a conversation for the background log writer.
+
+    Parameters:
+        chat_instance (Chat): The chat session to log.
+    """
+    log_entry = chat_instance.log_conversation()
+    log_writer.submit(log_entry)
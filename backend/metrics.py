@@ -0,0 +1,329 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Default histogram buckets (seconds), from fast in-process work up to slow model calls:
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric(ABC):
+    """
+    Base class for a metric family with a fixed set of label names.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): One-line description.
+        label_names (Tuple[str, ...]): Label names, in exposition order.
+    """
+    type = ""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        """
+        Render the family in the Prometheus text format.
+
+        Returns:
+            List[str]: Exposition lines.
+        """
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        Increase the counter.
+
+        Parameters:
+            amount (float): The increment.
+            **labels: Label values.
+        Returns:
+            None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        Get the current value.
+
+        Parameters:
+            **labels: Label values.
+        Returns:
+            float: The value (0 if never incremented).
+        """
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, set directly or read from a callback at scrape time.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        """
+        Set the gauge.
+
+        Parameters:
+            value (float): The new value.
+            **labels: Label values.
+        Returns:
+            None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the (unlabelled) value from a callback when the metrics are rendered.
+
+        Parameters:
+            function (Callable[[], float]): Returns the current value.
+        Returns:
+            None
+        """
+        self._function = function
+
+    def value(self, **labels) -> float:
+        """
+        Get the current value.
+
+        Parameters:
+            **labels: Label values.
+        Returns:
+            float: The value (0 if never set).
+        """
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception as e:
+                print(f"ERROR: Could not read gauge {self.name}. Error: {e}")
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observations over fixed buckets, so quantiles (p95, p99) can be computed by the scraper.
+
+    Attributes:
+        buckets (List[float]): Upper bounds, ascending (+Inf is implicit).
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = sorted(buckets)
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observation.
+
+        Parameters:
+            value (float): The observed value.
+            **labels: Label values.
+        Returns:
+            None
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a block in seconds.
+
+        Parameters:
+            **labels: Label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """
+        Get the number of observations.
+
+        Parameters:
+            **labels: Label values.
+        Returns:
+            int: The observation count.
+        """
+        series = self._values.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families rendered together at `/metrics`.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric family, or return the existing one with the same name.
+
+        Parameters:
+            metric (Metric): The metric family.
+        Returns:
+            Metric: The registered metric family.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        """
+        Create and register a counter (or return the existing one with the same name).
+        """
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        """
+        Create and register a gauge (or return the existing one with the same name).
+        """
+        return self.register(Gauge(name, help, label_names, function))
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Create and register a histogram (or return the existing one with the same name).
+        """
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Render every metric family in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry and the application's metrics:
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests by route, method and status.",
+                                 ["method", "path", "status"])
+HTTP_REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "HTTP request handling time.",
+                                          ["method", "path"])
+LLM_REQUESTS = registry.counter("llm_requests_total", "Model calls by pipeline stage and outcome.",
+                                ["stage", "outcome"])
+LLM_REQUEST_SECONDS = registry.histogram("llm_request_duration_seconds", "Model call latency by pipeline stage.",
+                                         ["stage"])
+LLM_TOKENS = registry.counter("llm_tokens_total", "Tokens reported by the provider, by stage and kind.",
+                              ["stage", "kind"])
+PARSE_FAILURES = registry.counter("model_answer_parse_failures_total",
+                                  "Model replies that could not be parsed as the JSON envelope.", ["stage"])
+PARSE_OUTCOMES = registry.counter("model_answer_parses_total",
+                                  "Parsed model replies by outcome (ok, repaired, plain_text or failed).",
+                                  ["stage", "outcome"])
+CATALOG_LOOKUPS = registry.counter("catalog_lookups_total", "Catalog lookups by kind and result.",
+                                   ["kind", "result"])
+LOG_WRITE_SECONDS = registry.histogram("log_write_duration_seconds", "Conversation log batch write time.",
+                                       buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1])
+LOG_WRITES = registry.counter("log_write_entries_total", "Conversation log entries by outcome.", ["outcome"])
+EVENT_LOOP_LAG = registry.gauge("event_loop_lag_seconds", "Delay of the last event loop lag probe.")
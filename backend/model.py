@@ -1,6 +1,14 @@
+import asyncio
+import hashlib
+import json
 import os
-import requests
+import time
+import httpx
+from typing import Any, AsyncIterator, Dict, Optional
 from dotenv import load_dotenv
+from metrics import LLM_REQUESTS, LLM_REQUEST_SECONDS, LLM_TOKENS, registry
+from resilience import LLM_UNAVAILABLE, ModelUnavailableError, model_caller
+from single_flight import SingleFlight
 
 
 load_dotenv()
@@ -9,7 +17,7 @@ load_dotenv()
 API_KEY = os.getenv("GROQ_API_KEY")
 if not API_KEY:
     raise ValueError("Missing GROQ_API_KEY in .env file")
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
+API_URL = os.getenv("LLM_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 
 # Model configuration:
 MODEL_NAME = "llama-3.3-70b-versatile"
@@ -18,35 +26,378 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+# HTTP client configuration:
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
 
-def send_to_model(input_data):
+# Price per million tokens, used for cost accounting:
+LLM_PRICE_PROMPT_PER_MTOK = float(os.getenv("LLM_PRICE_PROMPT_PER_MTOK", "0.59"))
+LLM_PRICE_COMPLETION_PER_MTOK = float(os.getenv("LLM_PRICE_COMPLETION_PER_MTOK", "0.79"))
+
+# Usage fields kept from the provider's response (token counts and Groq-style timings in seconds):
+USAGE_FIELDS = ["prompt_tokens", "completion_tokens", "total_tokens",
+                "queue_time", "prompt_time", "completion_time", "total_time"]
+
+# Stages that request the provider's JSON response mode (comma-separated, empty disables):
+LLM_JSON_MODE_STAGES = {stage.strip() for stage in os.getenv("LLM_JSON_MODE_STAGES", "clarification").split(",")
+                        if stage.strip()}
+
+# Coalescing of identical concurrent requests (0 disables):
+LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "1") == "1"
+LLM_SINGLE_FLIGHT_MAX_WAITERS = int(os.getenv("LLM_SINGLE_FLIGHT_MAX_WAITERS", "64"))
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None  # set by `use_transport` (replays); None uses the network
+single_flight = SingleFlight(LLM_SINGLE_FLIGHT_MAX_WAITERS)
+
+LLM_SINGLE_FLIGHT = registry.counter("llm_single_flight_total",
+                                     "Model calls by single-flight role (leader, coalesced or overflow).",
+                                     ["stage", "role"])
+registry.gauge("llm_single_flight_in_flight", "Distinct model payloads currently in flight.",
+               function=single_flight.in_flight)
+
+
+def get_client() -> httpx.AsyncClient:
     """
-    Send input data to the Groq model and get the response.
+    Get the shared async HTTP client, creating it on first use.
+
+    The client keeps up to LLM_POOL_SIZE keep-alive connections to the provider,
+    so consecutive calls reuse an open TLS connection instead of a new handshake.
+
+    Returns:
+        httpx.AsyncClient: The pooled client.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            limits=httpx.Limits(max_connections=LLM_POOL_SIZE,
+                                max_keepalive_connections=LLM_POOL_SIZE),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            transport=_transport,
+        )
+    return _client
+
+
+async def use_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """
+    Send model calls through a custom transport (e.g. an `httpx.MockTransport` answering
+    from recorded conversations) instead of the network.
+
+    Parameters:
+        transport (Optional[httpx.AsyncBaseTransport]): The transport, or None to use the network again.
+    Returns:
+        None
+    """
+    global _transport
+    await close_client()
+    _transport = transport
+
+
+async def close_client():
+    """
+    Close the shared HTTP client and its pooled connections.
+
+    Returns:
+        None
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def build_messages(input_data):
+    """
+    Normalize model input to the chat messages format.
 
     Parameters:
         input_data (str or List[Dict]): The input prompt as a string or list of messages.
     Returns:
-        str: The model's response content.
+        List[Dict]: The messages list.
     """
     # if input is a string, convert to messages format
     if isinstance(input_data, str):
-        messages = [{"role": "system", "content": input_data}]
+        return [{"role": "system", "content": input_data}]
     elif isinstance(input_data, list):
-        messages = input_data
+        return input_data
     else:
         raise ValueError("input_data must be string or list of messages")
 
+
+def build_payload(input_data, stream: bool = False, json_mode: bool = False):
+    """
+    Build the chat completions request payload.
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        stream (bool): Whether to request a streamed response.
+        json_mode (bool): Whether to request a JSON object response (`response_format`).
+    Returns:
+        Dict: The request payload.
+    """
     data = {
         "model": MODEL_NAME,
-        "messages": messages,
+        "messages": build_messages(input_data),
         "temperature": 0.7
     }
+    if stream:
+        data["stream"] = True
+    if json_mode:
+        data["response_format"] = {"type": "json_object"}
+    return data
+
+
+def stage_payload(input_data, stage: str, stream: bool = False):
+    """
+    Build the request payload a pipeline stage sends (JSON mode for stages in LLM_JSON_MODE_STAGES).
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        stage (str): The pipeline stage.
+        stream (bool): Whether to request a streamed response.
+    Returns:
+        Dict: The request payload.
+    """
+    return build_payload(input_data, stream=stream, json_mode=stage in LLM_JSON_MODE_STAGES)
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """
+    Compute a content-addressed key for a model request payload.
+
+    Parameters:
+        payload (Dict[str, Any]): The request payload (model, messages, temperature, response format).
+    Returns:
+        str: Hex SHA-256 digest of the canonical payload.
+    """
+    canonical = json.dumps({"model": payload["model"],
+                            "messages": payload["messages"],
+                            "temperature": payload.get("temperature"),
+                            "response_format": payload.get("response_format")},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def extract_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Normalize a provider usage block and add its cost.
+
+    Parameters:
+        usage (Optional[Dict[str, Any]]): The `usage` object of a chat completions response.
+    Returns:
+        Optional[Dict[str, Any]]: Token counts, timings (when provided) and cost_usd, or None if there is no usage.
+    """
+    if not usage:
+        return None
+    result = {field: usage[field] for field in USAGE_FIELDS if usage.get(field) is not None}
+    result["cost_usd"] = round((result.get("prompt_tokens", 0) * LLM_PRICE_PROMPT_PER_MTOK
+                                + result.get("completion_tokens", 0) * LLM_PRICE_COMPLETION_PER_MTOK) / 1e6, 8)
+    return result
+
+
+def record_call_metrics(stage: str, start: float, outcome: str, usage: Optional[Dict[str, Any]] = None):
+    """
+    Record latency, outcome and token metrics for one model call.
+
+    Parameters:
+        stage (str): The pipeline stage.
+        start (float): `time.perf_counter()` when the call started.
+        outcome (str): 'ok' or 'error'.
+        usage (Optional[Dict[str, Any]]): The call's usage, if known.
+    Returns:
+        None
+    """
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, stage=stage)
+    LLM_REQUESTS.inc(stage=stage, outcome=outcome)
+    if usage:
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), stage=stage, kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), stage=stage, kind="completion")
+
+
+async def complete(input_data, stage: str = "default") -> Dict[str, Any]:
+    """
+    Send input data to the model and return the content together with its usage.
+
+    The call runs within the stage's deadline, with retries, optional hedging and
+    the circuit breaker (see `resilience.py`). Stages in LLM_JSON_MODE_STAGES
+    request the provider's JSON response mode. Concurrent calls with the same
+    payload share one upstream request; the callers that joined it get the
+    content with usage None and coalesced True, so the spend is counted once.
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        stage (str): The pipeline stage, used to label metrics and pick the deadline.
+    Returns:
+        Dict[str, Any]: {"content": str, "usage": Optional[Dict], "retries": int, "hedges": int,
+        "coalesced": bool}.
+    Raises:
+        ModelUnavailableError: If the model could not answer in time.
+        ModelResponseError: If the provider rejected the request or its response could not be read.
+    """
+    data = stage_payload(input_data, stage)
+
+    async def call():
+        stats = {"retries": 0, "hedges": 0}
+        answer, usage = await model_caller.call(stage, lambda: _post_completion(data, stage), stats)
+        return {"content": answer, "usage": usage, **stats, "coalesced": False}
+
+    if not LLM_SINGLE_FLIGHT_ENABLED:
+        result = await call()
+    else:
+        result, role = await single_flight.do(payload_key(data), call)
+        LLM_SINGLE_FLIGHT.inc(stage=stage, role=role)
+        if role == "coalesced":
+            result = {**result, "usage": None, "coalesced": True}
+
+    print("RAW MODEL ANSWER >>>", result["content"])
+    return result
+
+
+async def _post_completion(data: Dict[str, Any], stage: str):
+    # One request to the provider.
+    start = time.perf_counter()
+    try:
+        response = await get_client().post(API_URL, json=data)
+        failed_generation = _failed_json_generation(response) if "response_format" in data else None
+        if failed_generation is not None:
+            # JSON mode rejected the output; the local parser can usually repair it.
+            print("WARNING: Provider rejected the JSON output, using the failed generation")
+            record_call_metrics(stage, start, "ok")
+            return failed_generation, None
+        response.raise_for_status()
+        result = response.json()
+        answer = result["choices"][0]["message"]["content"]
+    except Exception:
+        record_call_metrics(stage, start, "error")
+        raise
+    usage = extract_usage(result.get("usage"))
+    record_call_metrics(stage, start, "ok", usage)
+    return answer, usage
+
+
+def _failed_json_generation(response: httpx.Response) -> Optional[str]:
+    # Groq answers 400 json_validate_failed with the model's output in error.failed_generation.
+    if response.status_code != 400:
+        return None
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        return None
+    if error.get("code") != "json_validate_failed":
+        return None
+    return error.get("failed_generation") or None
+
+
+async def send_to_model(input_data, stage: str = "default"):
+    """
+    Send input data to the Groq model and get the response.
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        stage (str): The pipeline stage, used to label metrics.
+    Returns:
+        str: The model's response content.
+    """
+    return (await complete(input_data, stage))["content"]
+
+
+async def stream_from_model(input_data, usage: Optional[Dict[str, Any]] = None,
+                            stage: str = "default", stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Stream the model's response using the OpenAI-compatible `stream=true` mode.
+
+    The circuit breaker applies, and failed requests are retried as long as no
+    content has been yielded yet. The whole stream, retries included, must end
+    within the stage's deadline; stalls are also bounded by LLM_READ_TIMEOUT.
+    Stages in LLM_JSON_MODE_STAGES request JSON mode, as in `complete`.
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        usage (Optional[Dict[str, Any]]): Filled with the usage reported at the end of the stream, if any.
+        stage (str): The pipeline stage, used to label metrics and pick the deadline.
+        stats (Optional[Dict[str, Any]]): Receives the "retries" count.
+    Returns:
+        AsyncIterator[str]: The content deltas as they arrive.
+    Raises:
+        ModelUnavailableError: If the circuit is open, retries are exhausted or the deadline passed.
+        ModelResponseError: If the provider rejected the request or its response could not be read.
+    """
+    usage = {} if usage is None else usage
+    stats = {} if stats is None else stats
+    probe = model_caller.check_circuit(stage)
+    loop = asyncio.get_running_loop()
+    deadline = model_caller.deadline_for(stage)
+    deadline_at = loop.time() + deadline
+    attempt_index = 0
+    try:
+        while True:
+            started = False
+            start = time.perf_counter()
+            deltas = _stream_deltas(input_data, usage, stage in LLM_JSON_MODE_STAGES)
+            try:
+                while True:
+                    # The deadline is absolute, so time spent by the consumer between deltas counts too.
+                    try:
+                        async with asyncio.timeout_at(deadline_at):
+                            delta = await deltas.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield delta
+            except asyncio.TimeoutError:
+                record_call_metrics(stage, start, "error")
+                model_caller.breaker.record_failure()
+                LLM_UNAVAILABLE.inc(stage=stage, reason="deadline")
+                raise ModelUnavailableError(f"Model stream for stage '{stage}' exceeded its {deadline}s deadline")
+            except Exception as e:
+                record_call_metrics(stage, start, "error")
+                if started:
+                    model_caller.breaker.record_failure()
+                    raise
+                delay = model_caller.on_failure(stage, e, attempt_index, stats)
+                await asyncio.sleep(max(0.0, min(delay, deadline_at - loop.time())))
+                attempt_index += 1
+                continue
+            finally:
+                await deltas.aclose()
+            model_caller.breaker.record_success()
+            record_call_metrics(stage, start, "ok", usage)
+            return
+    finally:
+        if probe:
+            # A client disconnect closes the generator (GeneratorExit/CancelledError) without an outcome.
+            model_caller.breaker.release_probe()
 
-    response = requests.post(API_URL, json=data, headers=HEADERS)
-    response.raise_for_status()
-    result = response.json()
 
-    answer = result["choices"][0]["message"]["content"]
-    print("RAW MODEL ANSWER >>>", answer)
-    return answer
+async def _stream_deltas(input_data, usage: Dict[str, Any], json_mode: bool = False) -> AsyncIterator[str]:
+    data = build_payload(input_data, stream=True, json_mode=json_mode)
+    data["stream_options"] = {"include_usage": True}
 
+    async with get_client().stream("POST", API_URL, json=data) as response:
+        if json_mode and response.status_code == 400:
+            await response.aread()
+            failed_generation = _failed_json_generation(response)
+            if failed_generation is not None:
+                # JSON mode rejected the output before streaming it; the local parser can usually repair it.
+                print("WARNING: Provider rejected the streamed JSON output, using the failed generation")
+                yield failed_generation
+                return
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            # OpenAI sends usage on the final chunk, Groq under x_groq.
+            chunk_usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage")
+            if chunk_usage:
+                usage.update(extract_usage(chunk_usage))
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
@@ -0,0 +1,452 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Union
+from prompt_template import PromptTemplate
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the per-process one still applies
+    fcntl = None
+
+
+# Prompt parameters at least this long are interned (shared between sessions, written once to the texts file):
+MONITORING_INTERN_MIN_CHARS = int(os.getenv("MONITORING_INTERN_MIN_CHARS", "256"))
+
+ENTRY_OVERHEAD_BYTES = 96  # LogEntry object, slots and list slot
+
+
+class InternedText:
+    """
+    A text shared by every monitoring entry that uses it (system prompts, templates, catalog dumps).
+
+    Interned texts live as long as an entry refers to them, and are identified
+    by a hash of their content, so logs can refer to them by id.
+
+    Attributes:
+        id (str): Content hash.
+        text (str): The text.
+    """
+    __slots__ = ("id", "text", "__weakref__")
+
+    def __init__(self, text_id: str, text: str):
+        self.id = text_id
+        self.text = text
+
+
+_interned: "weakref.WeakValueDictionary[str, InternedText]" = weakref.WeakValueDictionary()
+_interned_lock = threading.Lock()
+
+
+def text_id(text: str) -> str:
+    """
+    Compute the content id of a text.
+
+    Parameters:
+        text (str): The text.
+    Returns:
+        str: 20 hex characters of its BLAKE2b hash.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=10).hexdigest()
+
+
+def intern_text(text: str, known_id: Optional[str] = None) -> InternedText:
+    """
+    Get the shared instance of a text.
+
+    Parameters:
+        text (str): The text.
+        known_id (Optional[str]): Its id, if already known (e.g. read from a log).
+    Returns:
+        InternedText: The shared instance.
+    """
+    key = known_id or text_id(text)
+    with _interned_lock:
+        interned = _interned.get(key)
+        if interned is None:
+            interned = InternedText(key, text)
+            _interned[key] = interned
+    return interned
+
+
+def interned_count() -> int:
+    """
+    Count the interned texts currently alive.
+
+    Returns:
+        int: Number of texts.
+    """
+    return len(_interned)
+
+
+@lru_cache(maxsize=32)
+def _template_text(template: PromptTemplate) -> InternedText:
+    # Templates are module-level objects, so each is hashed once.
+    return intern_text(template.template)
+
+
+@lru_cache(maxsize=64)
+def _parsed_template(text: str) -> PromptTemplate:
+    return PromptTemplate(text)
+
+
+class PromptRef:
+    """
+    A prompt kept as its template and parameters instead of the rendered text.
+
+    Attributes:
+        template (InternedText): The template text.
+        params (Dict[str, Union[str, InternedText]]): Parameter values; long ones are interned.
+    """
+    __slots__ = ("template", "params")
+
+    def __init__(self, template: InternedText, params: Dict[str, Union[str, InternedText]]):
+        self.template = template
+        self.params = params
+
+    @classmethod
+    def from_template(cls, template: PromptTemplate, params: Dict[str, str]) -> "PromptRef":
+        """
+        Build a reference to `template.format(**params)`.
+
+        Parameters:
+            template (PromptTemplate): The prompt template.
+            params (Dict[str, str]): The parameter values.
+        Returns:
+            PromptRef: The reference.
+        """
+        return cls(_template_text(template),
+                   {name: intern_text(value) if len(value) >= MONITORING_INTERN_MIN_CHARS else value
+                    for name, value in ((name, str(value)) for name, value in params.items())})
+
+    def render(self) -> str:
+        """
+        Render the prompt.
+
+        Returns:
+            str: The prompt text.
+        """
+        return _parsed_template(self.template.text).format(
+            **{name: value.text if isinstance(value, InternedText) else value for name, value in self.params.items()})
+
+
+class LogEntry:
+    """
+    One monitoring log entry.
+
+    The content is a plain string (user messages, model replies), an interned
+    text (the initial system prompt) or a prompt reference (summary and
+    recommendation prompts); it is rendered only when the entry is expanded.
+
+    Attributes:
+        role (str): 'system', 'user' or 'assistant'.
+        content (Union[str, InternedText, PromptRef]): The content.
+        latency_seconds (float): Model latency for the entry.
+        extra (Optional[Dict[str, Any]]): Other fields (stage, usage, cached, ...).
+    """
+    __slots__ = ("role", "content", "latency_seconds", "extra")
+
+    def __init__(self, role: str, content: Union[str, InternedText, PromptRef, None], latency_seconds: float = 0.0,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.role = role
+        self.content = content
+        self.latency_seconds = latency_seconds
+        self.extra = extra or None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Read a field like a dict entry (content is rendered).
+
+        Parameters:
+            key (str): The field name.
+            default (Any): Value if the field is not set.
+        Returns:
+            Any: The value.
+        """
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.text()
+        if key == "latency_seconds":
+            return self.latency_seconds
+        return self.extra.get(key, default) if self.extra else default
+
+    def text(self) -> Optional[str]:
+        """
+        Get the content as text.
+
+        Returns:
+            Optional[str]: The rendered content.
+        """
+        if isinstance(self.content, InternedText):
+            return self.content.text
+        if isinstance(self.content, PromptRef):
+            return self.content.render()
+        return self.content
+
+    def approx_size_bytes(self) -> int:
+        """
+        Estimate the memory held by this entry.
+
+        Interned parameters are counted in full, although sessions may share them;
+        templates and interned whole texts are not counted.
+
+        Returns:
+            int: Approximate size in bytes.
+        """
+        size = ENTRY_OVERHEAD_BYTES + (len(self.extra) * 48 if self.extra else 0)
+        if isinstance(self.content, PromptRef):
+            size += 64 + sum(len(value.text if isinstance(value, InternedText) else value)
+                             for value in self.content.params.values())
+        elif isinstance(self.content, str):
+            size += len(self.content)
+        return size
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Expand the entry into the plain log format.
+
+        Returns:
+            Dict[str, Any]: {"role", "content", "latency_seconds", ...extra}.
+        """
+        entry = {"role": self.role, "content": self.text(), "latency_seconds": self.latency_seconds}
+        if self.extra:
+            entry.update(self.extra)
+        return entry
+
+    def to_record(self, texts: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Serialize the entry compactly: interned texts are replaced by their ids.
+
+        Parameters:
+            texts (Dict[str, str]): Receives the interned texts the record refers to.
+        Returns:
+            Dict[str, Any]: The record: "content" for plain text, "text_ref" for an interned
+            text, or "prompt" ({"template", "params", "refs"}) for a prompt reference.
+        """
+        record: Dict[str, Any] = {"role": self.role}
+        if isinstance(self.content, InternedText):
+            texts[self.content.id] = self.content.text
+            record["text_ref"] = self.content.id
+        elif isinstance(self.content, PromptRef):
+            texts[self.content.template.id] = self.content.template.text
+            params, refs = {}, {}
+            for name, value in self.content.params.items():
+                if isinstance(value, InternedText):
+                    texts[value.id] = value.text
+                    refs[name] = value.id
+                else:
+                    params[name] = value
+            record["prompt"] = {"template": self.content.template.id, "params": params, "refs": refs}
+        else:
+            record["content"] = self.content
+        record["latency_seconds"] = self.latency_seconds
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], texts: Mapping[str, str]) -> "LogEntry":
+        """
+        Rebuild an entry from `to_record` output (or a plain, expanded entry).
+
+        Parameters:
+            record (Dict[str, Any]): The record.
+            texts (Mapping[str, str]): Texts by id, for the references in the record.
+        Returns:
+            LogEntry: The entry, with its texts interned again.
+        Raises:
+            KeyError: If a referenced text is missing.
+        """
+        extra = {key: value for key, value in record.items()
+                 if key not in ("role", "content", "latency_seconds", "text_ref", "prompt")}
+        if "text_ref" in record:
+            content = intern_text(texts[record["text_ref"]], record["text_ref"])
+        elif "prompt" in record:
+            prompt = record["prompt"]
+            params: Dict[str, Union[str, InternedText]] = dict(prompt["params"])
+            params.update((name, intern_text(texts[ref], ref)) for name, ref in prompt["refs"].items())
+            content = PromptRef(intern_text(texts[prompt["template"]], prompt["template"]), params)
+        else:
+            content = record.get("content")
+        return cls(record.get("role"), content, record.get("latency_seconds", 0.0), extra)
+
+
+def expand_record(record: Dict[str, Any], texts: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Expand a persisted record into the plain format (plain entries are returned as they are).
+
+    A reference to a missing text leaves the content None.
+
+    Parameters:
+        record (Dict[str, Any]): The record.
+        texts (Mapping[str, str]): Texts by id.
+    Returns:
+        Dict[str, Any]: {"role", "content", "latency_seconds", ...}.
+    """
+    if "text_ref" not in record and "prompt" not in record:
+        return record
+    try:
+        return LogEntry.from_record(record, texts).to_dict()
+    except KeyError as e:
+        print(f"WARNING: Monitoring log text {e} is missing, leaving the content empty")
+        entry = {key: value for key, value in record.items() if key not in ("text_ref", "prompt")}
+        return {"role": entry.pop("role", None), "content": None, **entry}
+
+
+def expand_log(log: Dict[str, Any], texts: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """
+    Expand a conversation log entry's history into the plain format.
+
+    Parameters:
+        log (Dict[str, Any]): The log entry.
+        texts (Optional[Mapping[str, str]]): Texts by id (the log's own "texts" are used as well).
+    Returns:
+        Dict[str, Any]: A copy of the entry with the history expanded and without "texts".
+    """
+    own = log.get("texts")
+    lookup = {**(texts or {}), **own} if own else (texts or {})
+    expanded = {key: value for key, value in log.items() if key != "texts"}
+    expanded["conversation_history"] = [expand_record(record, lookup)
+                                        for record in log.get("conversation_history", [])]
+    return expanded
+
+
+def referenced_text_ids(history: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    List the text ids a persisted history refers to.
+
+    Parameters:
+        history (Iterable[Dict[str, Any]]): The records.
+    Returns:
+        List[str]: The ids (without duplicates).
+    """
+    ids = {}
+    for record in history:
+        if "text_ref" in record:
+            ids[record["text_ref"]] = None
+        elif "prompt" in record:
+            ids[record["prompt"]["template"]] = None
+            ids.update(dict.fromkeys(record["prompt"]["refs"].values()))
+    return list(ids)
+
+
+def texts_path(log_path: Path) -> Path:
+    """
+    Get the texts file that belongs to a conversation log file.
+
+    Parameters:
+        log_path (Path): The conversation log (e.g. conversations_log.jsonl).
+    Returns:
+        Path: The texts file (e.g. conversations_log.texts.jsonl).
+    """
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + ".texts.jsonl")
+
+
+class TextStore:
+    """
+    Append-only JSON Lines file of the interned texts a conversation log refers to.
+
+    Each line is {"id", "text"}. A text is written the first time a log entry
+    refers to it. The ids already in the file are read before each write (the
+    whole file on the first write, then only the lines appended since), under
+    an exclusive file lock where the platform has one, so a restarted process
+    or another worker sharing the file does not write a text again. The file
+    is shared by the live log and its rotated files.
+
+    Attributes:
+        path (Path): The texts file.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize the store (the file is created on the first write).
+
+        Returns:
+            None
+        """
+        self.path = Path(path)
+        self._known: Set[str] = set()
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _scan(self, f) -> None:
+        # Remember the ids appended since the last scan (by this or another process).
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # a line still being written by a writer without the lock
+            self._offset += len(line)
+            if line.strip():
+                try:
+                    self._known.add(json.loads(line)["id"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def write(self, texts: Mapping[str, str]) -> int:
+        """
+        Append the texts not written yet.
+
+        Parameters:
+            texts (Mapping[str, str]): Texts by id.
+        Returns:
+            int: Bytes written.
+        Raises:
+            OSError: If the file cannot be written.
+        """
+        with self._lock:
+            if all(key in self._known for key in texts):
+                return 0
+            with open(self.path, "a+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    self._scan(f)
+                    new = [(key, text) for key, text in texts.items() if key not in self._known]
+                    if not new:
+                        return 0
+                    data = "".join(json.dumps({"id": key, "text": text}, ensure_ascii=False) + "\n"
+                                   for key, text in new).encode("utf-8")
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() != self._offset:
+                        f.write(b"\n")  # end the partial line a crashed writer left
+                        self._offset = f.tell()
+                    f.write(data)
+                    f.flush()
+                    self._offset += len(data)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            self._known.update(key for key, _ in new)
+            return len(data)
+
+    def load(self, ids: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """
+        Read texts from the file.
+
+        Parameters:
+            ids (Optional[Iterable[str]]): Only these ids (all if None).
+        Returns:
+            Dict[str, str]: Texts by id.
+        """
+        wanted = set(ids) if ids is not None else None
+        texts = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        if wanted is None or record["id"] in wanted:
+                            texts[record["id"]] = record["text"]
+                    except (ValueError, KeyError, TypeError):
+                        continue  # a line cut short by a crashed writer
+        except FileNotFoundError:
+            return {}
+        return texts
@@ -0,0 +1,301 @@
+import os
+import re
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from data_handler import get_product_catalog, on_catalog_reload
+
+
+# Maximum number of products sent to the recommendation prompt:
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "8"))
+
+# Ordered (pattern, tier) rules; the first match wins. Tiers run from 1 (entry) to 5 (top end).
+CPU_TIER_RULES: List[Tuple[str, int]] = [
+    (r"threadripper|xeon w9|xeon w7|m2 ultra|m3 ultra", 5),
+    (r"xeon w5|m3 max|m2 max", 4),
+    (r"i9-|ultra 9|ryzen 9", 4),
+    (r"xeon w3|m3 pro|m2 pro", 3),
+    (r"i7-\d+u|i7-\d+p", 2),
+    (r"i7-|ultra 7|ryzen 7", 3),
+    (r"i5-|ultra 5|ryzen 5|apple m\d", 2),
+]
+GPU_TIER_RULES: List[Tuple[str, int]] = [
+    (r"rtx 6000|rtx 5000|rtx 4090", 5),
+    (r"rtx 4500|rtx 4000 ada|rtx 4080|m2 ultra", 4),
+    (r"rtx 3000 ada|rtx 4070|m3 max|m2 max", 3),
+    (r"rtx 4060|rtx 4050|m3 pro|m2 pro", 2),
+    (r"rtx|radeon rx|apple m\d", 1),
+]
+DISCRETE_GPU_RE = re.compile(r"nvidia|geforce|rtx|radeon rx", re.IGNORECASE)
+CAPACITY_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(TB|GB)", re.IGNORECASE)
+
+
+def parse_price(value: str) -> float:
+    """
+    Parse a price string such as "$1699" or "$1,699.00".
+
+    Parameters:
+        value (str): The price string.
+    Returns:
+        float: The price, or NaN if it cannot be parsed.
+    """
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", value or "")
+    return float(match.group(0).replace(",", "")) if match else float("nan")
+
+
+def parse_capacity_gb(value: str) -> float:
+    """
+    Parse a memory or storage description into total gigabytes.
+
+    Multiple drives ("2TB NVMe + 4TB HDD") are added up.
+
+    Parameters:
+        value (str): The capacity string.
+    Returns:
+        float: Total capacity in GB (0 if none found).
+    """
+    total = 0.0
+    for amount, unit in CAPACITY_RE.findall(value or ""):
+        total += float(amount) * (1024 if unit.upper() == "TB" else 1)
+    return total
+
+
+def parse_tier(value: str, rules: List[Tuple[str, int]]) -> int:
+    """
+    Map a CPU or GPU name to a performance tier.
+
+    Parameters:
+        value (str): The component name.
+        rules (List[Tuple[str, int]]): Ordered (pattern, tier) rules.
+    Returns:
+        int: The tier of the first matching rule, or 0 if none matches.
+    """
+    text = (value or "").lower()
+    for pattern, tier in rules:
+        if re.search(pattern, text):
+            return tier
+    return 0
+
+
+class ProductIndex:
+    """
+    Typed columnar index over the product catalog.
+
+    Each attribute is parsed once into a NumPy column so queries are evaluated
+    as vectorized masks instead of per-product string handling.
+
+    Attributes:
+        skus (np.ndarray): SKU per row.
+        price (np.ndarray): Price in dollars.
+        ram_gb (np.ndarray): RAM in GB.
+        storage_gb (np.ndarray): Total storage in GB.
+        cpu_tier (np.ndarray): CPU performance tier (0-5).
+        gpu_tier (np.ndarray): GPU performance tier (0-5).
+        discrete_gpu (np.ndarray): Whether the product has a discrete GPU.
+        vendor_code (np.ndarray): Index into `vendors`.
+        vendors (List[str]): Vendor names.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        """
+        Parse the products into columns.
+
+        Parameters:
+            products (List[Dict[str, Any]]): The product catalog.
+        Returns:
+            None
+        """
+        self.vendors = sorted({p.get("Vendor", "") for p in products})
+        vendor_lookup = {vendor.lower(): i for i, vendor in enumerate(self.vendors)}
+        self._row_by_sku = {p["SKU"]: i for i, p in enumerate(products)}
+
+        self.skus = np.array([p["SKU"] for p in products], dtype=object)
+        self.price = np.array([parse_price(p.get("Price")) for p in products], dtype=np.float64)
+        self.ram_gb = np.array([parse_capacity_gb(p.get("RAM")) for p in products], dtype=np.float32)
+        self.storage_gb = np.array([parse_capacity_gb(p.get("Storage")) for p in products], dtype=np.float32)
+        self.cpu_tier = np.array([parse_tier(p.get("CPU"), CPU_TIER_RULES) for p in products], dtype=np.int8)
+        self.gpu_tier = np.array([parse_tier(p.get("GPU"), GPU_TIER_RULES) for p in products], dtype=np.int8)
+        self.discrete_gpu = np.array([bool(DISCRETE_GPU_RE.search(p.get("GPU") or "")) for p in products],
+                                     dtype=bool)
+        self.vendor_code = np.array([vendor_lookup[p.get("Vendor", "").lower()] for p in products],
+                                    dtype=np.int16)
+        self._vendor_lookup = vendor_lookup
+
+        # Static ranking score: component tiers plus a small bonus for memory.
+        self.score = (self.cpu_tier.astype(np.float32) + self.gpu_tier
+                      + np.log2(np.maximum(self.ram_gb, 1)) / 2)
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def query(self,
+              max_price: Optional[float] = None,
+              min_ram_gb: Optional[float] = None,
+              min_storage_gb: Optional[float] = None,
+              require_discrete_gpu: bool = False,
+              vendor: Optional[str] = None,
+              skus: Optional[List[str]] = None,
+              top_k: Optional[int] = None) -> List[str]:
+        """
+        Filter and rank products.
+
+        Matches are ranked by performance score (highest first), then by price (lowest first).
+
+        Parameters:
+            max_price (Optional[float]): Price ceiling in dollars.
+            min_ram_gb (Optional[float]): Minimum RAM in GB.
+            min_storage_gb (Optional[float]): Minimum total storage in GB.
+            require_discrete_gpu (bool): Only products with a discrete GPU.
+            vendor (Optional[str]): Only products from this vendor.
+            skus (Optional[List[str]]): Restrict the search to these SKUs (e.g. a category).
+            top_k (Optional[int]): Maximum number of results.
+        Returns:
+            List[str]: Matching SKUs in ranked order.
+        """
+        mask = np.ones(len(self.skus), dtype=bool)
+        if skus is not None:
+            rows = [self._row_by_sku[sku] for sku in skus if sku in self._row_by_sku]
+            mask[:] = False
+            mask[rows] = True
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if min_ram_gb is not None:
+            mask &= self.ram_gb >= min_ram_gb
+        if min_storage_gb is not None:
+            mask &= self.storage_gb >= min_storage_gb
+        if require_discrete_gpu:
+            mask &= self.discrete_gpu
+        if vendor is not None:
+            code = self._vendor_lookup.get(vendor.lower())
+            if code is None:
+                return []
+            mask &= self.vendor_code == code
+
+        rows = np.flatnonzero(mask)
+        # lexsort uses the last key as the primary one.
+        order = np.lexsort((self.price[rows], -self.score[rows]))
+        ranked = rows[order]
+        if top_k is not None:
+            ranked = ranked[:top_k]
+        return [self.skus[i] for i in ranked]
+
+
+# A number right after "budget"/"price" is a price; after "under", "up to", ... only with a currency marker.
+_BUDGET_RE = re.compile(r"\b(?:budget|price)\b[^$\d\n]{0,15}(\$|usd\s*)?(\d[\d,]*(?:\.\d+)?)\s*(k\b|usd\b|dollars?\b)?")
+_BOUND_RE = re.compile(r"\b(?:under|below|less than|max(?:imum)?|up to|at most)\s*(\$|usd\s*)?(\d[\d,]*(?:\.\d+)?)"
+                       r"\s*(k\b|usd\b|dollars?\b)?")
+# Units that make a number something other than a price (memory, weight, screen size, refresh rate, ...):
+_NON_PRICE_UNIT_RE = re.compile(r"\s*(?:gb|tb|mb|kg|g\b|lbs?\b|pounds?\b|inch|in\b|\"|''|hz|ghz|mhz"
+                                r"|hours?\b|hrs?\b|mm\b|cm\b|w\b|cores?\b)")
+
+
+def parse_max_price(lowered: str) -> Optional[float]:
+    """
+    Find the user's maximum price in a lower-cased text.
+
+    An amount after "budget"/"price" wins over one after "under", "up to", etc.,
+    which needs a currency marker ($, USD, dollars or k). Numbers followed by
+    another unit (GB, kg, inches, Hz, ...) are never prices.
+
+    Parameters:
+        lowered (str): The lower-cased text.
+    Returns:
+        Optional[float]: The price, or None.
+    """
+    for pattern, needs_currency in ((_BUDGET_RE, False), (_BOUND_RE, True)):
+        for match in pattern.finditer(lowered):
+            currency, number, suffix = match.groups()
+            if not suffix and _NON_PRICE_UNIT_RE.match(lowered, match.end(2)):
+                continue
+            if needs_currency and not (currency or suffix):
+                continue
+            amount = float(number.replace(",", ""))
+            return amount * 1000 if suffix == "k" else amount
+    return None
+
+
+def constraints_from_text(text: str, vendors: List[str]) -> Dict[str, Any]:
+    """
+    Extract numeric query constraints from a conversation summary.
+
+    Parameters:
+        text (str): The summary of the user's needs.
+        vendors (List[str]): Known vendor names.
+    Returns:
+        Dict[str, Any]: Keyword arguments for `ProductIndex.query`.
+    """
+    constraints: Dict[str, Any] = {}
+    lowered = (text or "").lower()
+
+    max_price = parse_max_price(lowered)
+    if max_price is not None:
+        constraints["max_price"] = max_price
+
+    ram = re.search(r"(\d+)\s*gb\s*(?:of\s*)?(?:ram|memory)", lowered)
+    if ram:
+        constraints["min_ram_gb"] = float(ram.group(1))
+
+    storage = re.search(r"(\d+(?:\.\d+)?)\s*(tb|gb)\s*(?:of\s*)?(?:storage|ssd|disk|drive)", lowered)
+    if storage:
+        constraints["min_storage_gb"] = parse_capacity_gb(storage.group(1) + storage.group(2))
+
+    if re.search(r"(?:dedicated|discrete)\s+(?:gpu|graphics)|nvidia|geforce|\brtx\b", lowered):
+        constraints["require_discrete_gpu"] = True
+
+    for vendor in vendors:
+        if re.search(rf"\b{re.escape(vendor.lower())}\b", lowered):
+            constraints["vendor"] = vendor
+            break
+    else:
+        if re.search(r"\bmac(?:book)?\b", lowered) and "Apple" in vendors:
+            constraints["vendor"] = "Apple"
+    return constraints
+
+
+_index: Optional[ProductIndex] = None
+
+
+def get_product_index() -> ProductIndex:
+    """
+    Get the product index, building it from the catalog on first use.
+
+    Returns:
+        ProductIndex: The product index.
+    """
+    global _index
+    if _index is None:
+        _index = ProductIndex(get_product_catalog())
+    return _index
+
+
+def _rebuild_index(snapshot):
+    global _index
+    _index = ProductIndex(snapshot.products)
+
+
+on_catalog_reload(_rebuild_index)
+
+
+def select_candidate_products(products: List[Dict[str, Any]], summary: str,
+                              top_k: int = RECOMMENDATION_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Narrow a list of products to the top-k matches for the user's summary.
+
+    If the constraints found in the summary match nothing, the original list
+    is kept (truncated to top_k by rank) so the model can still explain the trade-off.
+
+    Parameters:
+        products (List[Dict[str, Any]]): Candidate products (e.g. one category).
+        summary (str): The summary of the user's needs.
+        top_k (int): Maximum number of products to return.
+    Returns:
+        List[Dict[str, Any]]: The selected products in ranked order.
+    """
+    index = get_product_index()
+    by_sku = {p["SKU"]: p for p in products}
+    constraints = constraints_from_text(summary, index.vendors)
+    skus = index.query(skus=list(by_sku), top_k=top_k, **constraints)
+    if not skus and constraints:
+        print("No products match constraints", constraints, "- keeping the full candidate list")
+        skus = index.query(skus=list(by_sku), top_k=top_k)
+    print(f"Selected {len(skus)} of {len(products)} products with constraints {constraints}")
+    return [by_sku[sku] for sku in skus]
@@ -0,0 +1,66 @@
+from string import Formatter
+from typing import List, Tuple
+
+
+class PromptTemplate:
+    """
+    Minimal f-string style prompt template, parsed once when it is created.
+
+    Drop-in for the subset of `langchain_core.prompts.PromptTemplate` the
+    prompts use: `{name}` placeholders, `{{`/`}}` escapes and `format(**kwargs)`.
+    The template is split into literal text and placeholder names up front,
+    so formatting is a single join.
+
+    Attributes:
+        template (str): The template text.
+        input_variables (List[str]): Placeholder names, in order of first use.
+    """
+
+    def __init__(self, template: str, input_variables: List[str] = None):
+        """
+        Parse the template.
+
+        Parameters:
+            template (str): The template text.
+            input_variables (List[str]): Expected placeholder names (checked against the template if given).
+        Returns:
+            None
+        Raises:
+            ValueError: If the template uses format specs, conversions or attribute access,
+                or its placeholders differ from input_variables.
+        """
+        self.template = template
+        parts: List[Tuple[str, str]] = []
+        names: List[str] = []
+        for literal, name, spec, conversion in Formatter().parse(template):
+            if name is not None:
+                if spec or conversion or not name.isidentifier():
+                    raise ValueError(f"Unsupported placeholder '{{{name}}}' in prompt template")
+                if name not in names:
+                    names.append(name)
+            parts.append((literal, name))
+        if input_variables is not None and sorted(input_variables) != sorted(names):
+            raise ValueError(f"Prompt template placeholders {names} do not match input_variables {input_variables}")
+        self.input_variables = names
+        self._parts = parts
+
+    def format(self, **kwargs) -> str:
+        """
+        Fill in the placeholders.
+
+        Parameters:
+            **kwargs: A value for every input variable (converted with str()).
+        Returns:
+            str: The rendered prompt.
+        Raises:
+            KeyError: If a placeholder has no value.
+        """
+        missing = [name for name in self.input_variables if name not in kwargs]
+        if missing:
+            raise KeyError(f"Missing prompt variables: {missing}")
+        out = []
+        for literal, name in self._parts:
+            out.append(literal)
+            if name is not None:
+                out.append(str(kwargs[name]))
+        return "".join(out)
@@ -1,8 +1,16 @@
-from data_handler import get_categories, get_product_keys
-from langchain_core.prompts import PromptTemplate
+from typing import Optional
+from data_handler import get_categories, get_product_keys, on_catalog_reload
+from prompt_template import PromptTemplate
 
-# The initial prompt given to the chat model:
-INITIAL_PROMPT = f"""
+
+def build_initial_prompt() -> str:
+    """
+    Render the initial system prompt from the current categories and product keys.
+
+    Returns:
+        str: The initial prompt.
+    """
+    return f"""
 You are a friendly and helpful shopping assistant.
 
 GOAL:
@@ -37,6 +45,31 @@ RULES:
 5. Never output anything outside the JSON.
 """
 
+
+# The initial prompt given to the chat model (built on first use, so importing this module does not load the catalog):
+INITIAL_PROMPT: Optional[str] = None
+
+
+def get_initial_prompt() -> str:
+    """
+    Get the initial prompt for new chat sessions (rebuilt when the catalog reloads).
+
+    Returns:
+        str: The initial prompt.
+    """
+    global INITIAL_PROMPT
+    if INITIAL_PROMPT is None:
+        INITIAL_PROMPT = build_initial_prompt()
+    return INITIAL_PROMPT
+
+
+def _rebuild_initial_prompt(snapshot):
+    global INITIAL_PROMPT
+    INITIAL_PROMPT = build_initial_prompt()
+
+
+on_catalog_reload(_rebuild_initial_prompt)
+
 # Prompt template for product recommendation based on chat summary and product list:
 recommendation_prompt = PromptTemplate(
     input_variables=["chat_summary", "products_str"],
@@ -48,7 +81,7 @@ recommendation_prompt = PromptTemplate(
     User's requirements / conversation summary:
     {chat_summary}
 
-    The available products in the selected category are:
+    The available products for these needs are:
     {products_str}
 
     Your task:
@@ -83,4 +116,26 @@ Instructions:
 - Do not add explanations, greetings, or extra text.
 - Output plain text, nothing else.
 """
-)
\ No newline at end of file
+)
+
+# Prompt template for updating an existing summary with the latest messages:
+summary_update_prompt = PromptTemplate(
+    input_variables=["previous_summary", "new_messages"],
+    template="""
+You are an assistant that maintains a running list of the user's needs, preferences, and requirements in a chat conversation.
+You may use both the user's messages and the assistant's messages to understand the user's requirements.
+Do not include anything else.
+
+Current list of the user's needs:
+{previous_summary}
+
+New messages since the list was written:
+{new_messages}
+
+Instructions:
+- Return the updated list: keep the points that still apply, add new ones, and change points the user corrected.
+- Use short phrases, one per line.
+- Do not add explanations, greetings, or extra text.
+- Output plain text, nothing else.
+"""
+)
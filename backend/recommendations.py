@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from catalog_search import RECOMMENDATION_RETRIEVAL, retrieve_products
+from catalog_serializer import render_category, render_products
+from data_handler import get_categories, get_products_by_category
+from metrics import registry
+from product_index import select_candidate_products
+from prompts import recommendation_prompt
+from response_cache import send_to_model_cached
+
+
+# Batch recommendations (POST /recommend/batch and the CLI):
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # model calls in flight per batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))           # items per JSON request (NDJSON is streamed)
+BATCH_PROGRESS_EVERY = int(os.getenv("BATCH_PROGRESS_EVERY", "100"))  # completed items between progress lines
+BATCH_SPOOL_MEMORY_MB = float(os.getenv("BATCH_SPOOL_MEMORY_MB", "1"))  # NDJSON body kept in memory, the rest on disk
+BATCH_MAX_LINE_KB = int(os.getenv("BATCH_MAX_LINE_KB", "64"))           # longest NDJSON line (item) accepted
+
+BATCH_ITEMS = registry.counter("batch_recommendations_total", "Batch recommendation items by outcome.", ["outcome"])
+_running_batches = 0
+registry.gauge("batch_jobs_running", "Batch recommendation jobs in progress.", function=lambda: _running_batches)
+
+
+def render_candidate_products(summary: str, category: str) -> str:
+    """
+    Render the recommendation candidates for a summary of the user's needs.
+
+    With RECOMMENDATION_RETRIEVAL=bm25 the candidates are retrieved from the whole
+    catalog with the category boosted; otherwise they come from the category's list.
+
+    Parameters:
+        summary (str): The summary of the user's needs.
+        category (str): The product category.
+    Returns:
+        str: The rendered products.
+    """
+    if RECOMMENDATION_RETRIEVAL == "bm25":
+        return render_products(retrieve_products(summary, category))
+    category_products = get_products_by_category(category)
+    products = select_candidate_products(category_products, summary)
+    if len(products) == len(category_products):
+        return render_category(category)  # precomputed fragment
+    return render_products(products)
+
+
+def recommendation_params(summary: str, category: str) -> Dict[str, str]:
+    """
+    Get the values the recommendation prompt is rendered with.
+
+    Parameters:
+        summary (str): The summary of the user's needs.
+        category (str): The product category.
+    Returns:
+        Dict[str, str]: {"chat_summary", "products_str"}.
+    """
+    return {"chat_summary": summary, "products_str": render_candidate_products(summary, category)}
+
+
+def build_recommendation_text(summary: str, category: str) -> str:
+    """
+    Render the recommendation prompt for a summary and category.
+
+    Parameters:
+        summary (str): The summary of the user's needs.
+        category (str): The product category.
+    Returns:
+        str: The rendered recommendation prompt.
+    """
+    return recommendation_prompt.format(**recommendation_params(summary, category))
+
+
+async def recommend_item(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Produce the recommendation for one batch item.
+
+    A bad item or a failed model call yields an error record; it never fails the batch.
+
+    Parameters:
+        index (int): Position of the item in the batch.
+        item (Dict[str, Any]): {"summary", "category", optional "id"}.
+    Returns:
+        Dict[str, Any]: A "result" record with the recommendation, or with "error".
+    """
+    record = {"type": "result", "index": index, "id": item.get("id") if isinstance(item, dict) else None}
+    if not isinstance(item, dict) or not isinstance(item.get("summary"), str) or not item["summary"].strip():
+        BATCH_ITEMS.inc(outcome="invalid")
+        return {**record, "error": "item needs a non-empty 'summary'"}
+    category = item.get("category")
+    record["category"] = category
+    if category not in get_categories():
+        BATCH_ITEMS.inc(outcome="invalid")
+        return {**record, "error": f"unknown category '{category}'"}
+
+    start = time.perf_counter()
+    try:
+        prompt_text = build_recommendation_text(item["summary"], category)
+        recommendation, cached, call_info = await send_to_model_cached(prompt_text, "recommendation")
+    except Exception as e:
+        print(f"ERROR: Batch item {index} failed. Error: {e}")
+        BATCH_ITEMS.inc(outcome="error")
+        return {**record, "error": str(e) or type(e).__name__}
+    BATCH_ITEMS.inc(outcome="cached" if cached else "ok")
+    return {**record, "recommendation": recommendation, "cached": cached,
+            "latency_seconds": round(time.perf_counter() - start, 4),
+            "usage": call_info["usage"] if call_info else None}
+
+
+async def run_batch(items: Iterable[Dict[str, Any]],
+                    concurrency: int = BATCH_MAX_CONCURRENCY,
+                    progress_every: int = BATCH_PROGRESS_EVERY,
+                    total: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run recommendations for a batch through a bounded pool of workers.
+
+    Items are pulled from the iterable only as workers free up, and finished
+    records wait in a bounded queue until the consumer takes them, so neither
+    the input nor the results are held in memory as a whole. Records come in
+    completion order (each carries its item's index). Stopping the iteration
+    (e.g. a client disconnect) cancels the workers.
+
+    Parameters:
+        items (Iterable[Dict[str, Any]]): The items ({"summary", "category", optional "id"}).
+        concurrency (int): Number of workers (capped at BATCH_MAX_CONCURRENCY).
+        progress_every (int): Emit a progress record after this many completed items (0 disables).
+        total (Optional[int]): Number of items, if known, for the progress records.
+    Returns:
+        AsyncIterator[Dict[str, Any]]: "result" records, "progress" records
+        ({completed, total, errors, elapsed_seconds}), then one "summary" record.
+    """
+    global _running_batches
+    workers = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    pending: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    finished: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    feed_errors = []
+
+    async def feed():
+        try:
+            for job in enumerate(items):
+                await pending.put(job)
+        except Exception as e:
+            print(f"ERROR: Reading batch items failed. Error: {e}")
+            feed_errors.append(str(e))
+        finally:
+            for _ in range(workers):
+                await pending.put(None)
+
+    async def work():
+        while True:
+            job = await pending.get()
+            if job is None:
+                break
+            await finished.put(await recommend_item(*job))
+        await finished.put(None)
+
+    start = time.perf_counter()
+    counts = {"completed": 0, "errors": 0, "cached": 0, "total_tokens": 0, "cost_usd": 0.0}
+    tasks = [asyncio.create_task(feed())] + [asyncio.create_task(work()) for _ in range(workers)]
+    _running_batches += 1
+    try:
+        running = workers
+        while running:
+            record = await finished.get()
+            if record is None:
+                running -= 1
+                continue
+            counts["completed"] += 1
+            if "error" in record:
+                counts["errors"] += 1
+            elif record["cached"]:
+                counts["cached"] += 1
+            if record.get("usage"):
+                counts["total_tokens"] += record["usage"].get("total_tokens", 0)
+                counts["cost_usd"] += record["usage"].get("cost_usd", 0.0)
+            yield record
+            if progress_every and counts["completed"] % progress_every == 0:
+                yield {"type": "progress", "completed": counts["completed"], "total": total,
+                       "errors": counts["errors"], "elapsed_seconds": round(time.perf_counter() - start, 3)}
+        elapsed = time.perf_counter() - start
+        yield {"type": "summary", **counts, "cost_usd": round(counts["cost_usd"], 8), "concurrency": workers,
+               "elapsed_seconds": round(elapsed, 3),
+               "items_per_second": round(counts["completed"] / elapsed, 2) if elapsed else 0,
+               "input_error": feed_errors[0] if feed_errors else None}
+    finally:
+        _running_batches -= 1
+        for task in tasks:
+            task.cancel()
+
+
+def read_items(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Read batch items from a JSON Lines file (one item per line) or a JSON array file (.json).
+
+    Parameters:
+        path (Path): The input file.
+    Returns:
+        Iterator[Dict[str, Any]]: The items, read lazily for JSON Lines.
+    """
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def spool_ndjson(chunks: AsyncIterable[bytes]) -> Tuple[IO[bytes], int]:
+    """
+    Copy a JSON Lines byte stream (e.g. a request body) into a temporary file as the chunks arrive.
+
+    The file stays in memory up to BATCH_SPOOL_MEMORY_MB and moves to disk beyond that.
+    Only the new chunk is searched for line breaks; the pieces of an unfinished
+    line are kept in a list, and a line longer than BATCH_MAX_LINE_KB is rejected.
+
+    Parameters:
+        chunks (AsyncIterable[bytes]): The stream.
+    Returns:
+        Tuple[IO[bytes], int]: The file, positioned at its start, and the number of items.
+    Raises:
+        ValueError: If a line is not valid JSON or is too long.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=int(BATCH_SPOOL_MEMORY_MB * 1024 * 1024))
+    pending: List[bytes] = []  # pieces of the unfinished line
+    pending_bytes = 0
+    count = 0
+    try:
+        async for chunk in chunks:
+            start = 0
+            end = chunk.find(b"\n")
+            while end >= 0:
+                pending.append(chunk[start:end])
+                count += _spool_line(spool, b"".join(pending), count)
+                pending, pending_bytes = [], 0
+                start = end + 1
+                end = chunk.find(b"\n", start)
+            if start < len(chunk):
+                pending.append(chunk[start:])
+                pending_bytes += len(chunk) - start
+                _check_line_size(pending_bytes, count)
+        count += _spool_line(spool, b"".join(pending), count)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, count
+
+
+def _check_line_size(size: int, count: int):
+    if size > BATCH_MAX_LINE_KB * 1024:
+        raise ValueError(f"item {count + 1} is longer than {BATCH_MAX_LINE_KB} KB")
+
+
+def _spool_line(spool: IO[bytes], line: bytes, count: int) -> int:
+    if not line.strip():
+        return 0
+    _check_line_size(len(line), count)
+    try:
+        json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"item {count + 1} is not valid JSON: {e}")
+    spool.write(line + b"\n")
+    return 1
+
+
+def iter_spooled(spool: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Read the items of a file filled by `spool_ndjson`, one line at a time, and close it at the end.
+
+    Parameters:
+        spool (IO[bytes]): The file.
+    Returns:
+        Iterator[Dict[str, Any]]: The items.
+    """
+    try:
+        for line in spool:
+            yield json.loads(line)
+    finally:
+        spool.close()
+
+
+async def encode_ndjson(items: Iterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """
+    Encode items as JSON Lines, one at a time (an upload body for `httpx.AsyncClient`).
+
+    Parameters:
+        items (Iterable[Dict[str, Any]]): The items.
+    Returns:
+        AsyncIterator[bytes]: One encoded line per item.
+    """
+    for item in items:
+        yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def run_local(items: Iterable[Dict[str, Any]], out, concurrency: int, progress_every: int):
+    """
+    Run a batch in this process and write its records as NDJSON.
+
+    Parameters:
+        items (Iterable[Dict[str, Any]]): The items.
+        out: Text stream for the result records.
+        concurrency (int): Number of workers.
+        progress_every (int): Completed items between progress lines.
+    Returns:
+        None
+    """
+    from model import close_client
+    try:
+        async for record in run_batch(items, concurrency, progress_every):
+            report_record(record, out)
+    finally:
+        await close_client()
+
+
+async def run_remote(url: str, items: Iterable[Dict[str, Any]], out, concurrency: int, progress_every: int):
+    """
+    Send a batch to a running server's /recommend/batch and write the streamed records as NDJSON.
+
+    The items are uploaded as an NDJSON body, read from `items` as the upload proceeds,
+    so the batch is not held in memory on either side.
+
+    Parameters:
+        url (str): The server's base URL.
+        items (Iterable[Dict[str, Any]]): The items.
+        out: Text stream for the result records.
+        concurrency (int): Number of workers.
+        progress_every (int): Completed items between progress lines.
+    Returns:
+        None
+    """
+    import httpx
+    params = {"concurrency": concurrency, "progress_every": progress_every}
+    headers = {"Content-Type": "application/x-ndjson"}
+    async with httpx.AsyncClient(base_url=url, timeout=httpx.Timeout(30, read=None)) as client:
+        async with client.stream("POST", "/recommend/batch", params=params, headers=headers,
+                                 content=encode_ndjson(items)) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise SystemExit(f"Batch request failed ({response.status_code}): {response.text}")
+            async for line in response.aiter_lines():
+                if line:
+                    report_record(json.loads(line), out)
+
+
+def report_record(record: Dict[str, Any], out):
+    """
+    Write a result record to the output and progress and summary records to stderr.
+
+    Parameters:
+        record (Dict[str, Any]): A record from `run_batch`.
+        out: Text stream for the result records.
+    Returns:
+        None
+    """
+    if record["type"] == "result":
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        print(json.dumps(record), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute recommendations for a batch of {summary, category} items.")
+    parser.add_argument("input", type=Path, help="JSON Lines file (or .json array) of items.")
+    parser.add_argument("--output", type=Path, default=None, help="NDJSON results file (default: stdout).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--progress-every", type=int, default=BATCH_PROGRESS_EVERY)
+    parser.add_argument("--url", default=None, help="Send the batch to a running server instead of calling the model here.")
+    args = parser.parse_args()
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        items = read_items(args.input)
+        if args.url:
+            asyncio.run(run_remote(args.url, items, out, args.concurrency, args.progress_every))
+        else:
+            asyncio.run(run_local(items, out, args.concurrency, args.progress_every))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
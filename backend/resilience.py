@@ -0,0 +1,383 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import httpx
+from metrics import registry
+
+
+# Per-stage deadlines in seconds for a whole model call, including retries (LLM_DEADLINE_<STAGE> overrides):
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+STAGE_DEADLINES = {stage: float(os.getenv(f"LLM_DEADLINE_{stage.upper()}", str(LLM_DEADLINE_SECONDS)))
+                   for stage in ("clarification", "summary", "recommendation")}
+
+# Retries on 429/5xx and connection errors, with full-jitter exponential backoff:
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.25"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+
+# Hedging: send a duplicate request once the first one is slower than the stage's recent p95:
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker: open after this many consecutive failures, probe again after the reset time:
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+LLM_RETRIES = registry.counter("llm_retries_total", "Model call retries by stage.", ["stage"])
+LLM_HEDGES = registry.counter("llm_hedges_total", "Hedged model requests by stage and winner.", ["stage", "winner"])
+LLM_UNAVAILABLE = registry.counter("llm_unavailable_total",
+                                   "Model calls given up on, by stage and reason.", ["stage", "reason"])
+
+
+class ModelUnavailableError(Exception):
+    """
+    The model could not answer: the deadline passed, retries were exhausted or the circuit is open.
+    """
+
+
+class CircuitOpenError(ModelUnavailableError):
+    """
+    The circuit breaker is open, so the call was rejected without contacting the provider.
+    """
+
+
+class ModelResponseError(Exception):
+    """
+    The provider rejected the request (a non-retryable status) or sent a response that could not be read.
+    """
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Check whether a failed model request is worth retrying.
+
+    Parameters:
+        exc (BaseException): The error.
+    Returns:
+        bool: True for rate limits, server errors, timeouts and connection errors.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Read the Retry-After header of a failed response, if any.
+
+    Parameters:
+        exc (BaseException): The error.
+    Returns:
+        Optional[float]: Seconds to wait, or None.
+    """
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    try:
+        return float(exc.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies of one stage, used to pick the hedge delay.
+
+    Attributes:
+        samples (deque): The latest latencies in seconds.
+    """
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """
+        Get a latency quantile.
+
+        Parameters:
+            q (float): The quantile in [0, 1].
+            min_samples (int): Minimum samples needed for an estimate.
+        Returns:
+            Optional[float]: The quantile in seconds, or None if there are too few samples.
+        """
+        if len(self.samples) < min_samples:
+            return None
+        values = sorted(self.samples)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass. open: calls fail fast until `reset_seconds` have passed.
+    half_open: a single probe call passes; its outcome closes or re-opens the circuit.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_seconds (float): Time the circuit stays open before a probe.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0}
+
+    def acquire(self) -> Tuple[bool, bool]:
+        """
+        Check whether a call may go to the provider, and whether it is the half-open probe.
+
+        The caller holding the probe must end it with `record_success`, `record_failure`
+        or `release_probe`, or the circuit would stay half-open with no probe allowed.
+
+        Returns:
+            Tuple[bool, bool]: (allowed, probe). Not allowed while the circuit is open
+            (or a half-open probe is already in flight).
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True, False
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True, True
+            self._counters["rejected"] += 1
+            return False, False
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go to the provider.
+
+        Returns:
+            bool: False while the circuit is open (or a half-open probe is already in flight).
+        """
+        return self.acquire()[0]
+
+    def release_probe(self):
+        """
+        End a half-open probe without an outcome (e.g. the call was cancelled), so the next call can probe.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                if self.state != "open":
+                    self._counters["opened"] += 1
+                    print(f"WARNING: Model circuit breaker opened after {self._failures} consecutive failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the breaker state and counters.
+
+        Returns:
+            Dict[str, Any]: State, consecutive failures and counters.
+        """
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._failures, **self._counters}
+
+
+class ResilientCaller:
+    """
+    Runs model calls with per-stage deadlines, retries, optional hedging and a circuit breaker.
+
+    Attributes:
+        breaker (CircuitBreaker): The shared circuit breaker.
+        trackers (Dict[str, LatencyTracker]): Recent latencies per stage.
+    """
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 max_delay: float = LLM_RETRY_MAX_DELAY, hedge_enabled: bool = LLM_HEDGE_ENABLED,
+                 hedge_quantile: float = LLM_HEDGE_QUANTILE, hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.trackers: Dict[str, LatencyTracker] = {}
+
+    def deadline_for(self, stage: str) -> float:
+        return STAGE_DEADLINES.get(stage, LLM_DEADLINE_SECONDS)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """
+        Get how long to wait before hedging a call of this stage.
+
+        Parameters:
+            stage (str): The pipeline stage.
+        Returns:
+            Optional[float]: Seconds, or None if hedging is off or there is not enough latency history.
+        """
+        if not self.hedge_enabled:
+            return None
+        estimate = self.trackers.setdefault(stage, LatencyTracker()).quantile(self.hedge_quantile)
+        return None if estimate is None else max(estimate, self.hedge_min_delay)
+
+    def check_circuit(self, stage: str) -> bool:
+        """
+        Fail fast if the circuit is open.
+
+        Parameters:
+            stage (str): The pipeline stage.
+        Returns:
+            bool: True if this call is the half-open probe (release it with `breaker.release_probe` when done).
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        allowed, probe = self.breaker.acquire()
+        if not allowed:
+            LLM_UNAVAILABLE.inc(stage=stage, reason="circuit_open")
+            raise CircuitOpenError("Model provider circuit is open")
+        return probe
+
+    def on_failure(self, stage: str, exc: BaseException, attempt_index: int, stats: Dict[str, Any]) -> float:
+        """
+        Record a failed attempt and decide whether to retry.
+
+        Parameters:
+            stage (str): The pipeline stage.
+            exc (BaseException): The error.
+            attempt_index (int): Zero-based index of the failed attempt.
+            stats (Dict[str, Any]): Per-call counters, updated in place.
+        Returns:
+            float: Seconds to wait before the next attempt.
+        Raises:
+            ModelResponseError: If the error is not retryable.
+            ModelUnavailableError: If retries are exhausted.
+        """
+        if not is_retryable(exc):
+            if isinstance(exc, httpx.HTTPStatusError):
+                # The provider answered (e.g. a 400), so it is reachable: that counts as a success for the breaker.
+                self.breaker.record_success()
+            else:
+                # A malformed body (KeyError, ValueError, ...) is a provider failure, but retrying will not fix it.
+                self.breaker.record_failure()
+            LLM_UNAVAILABLE.inc(stage=stage, reason="bad_response")
+            raise ModelResponseError(f"Model call for stage '{stage}' failed: {exc!r}") from exc
+        self.breaker.record_failure()
+        if attempt_index >= self.max_retries or not self.breaker.allow():
+            LLM_UNAVAILABLE.inc(stage=stage, reason="retries_exhausted")
+            raise ModelUnavailableError(f"Model call failed after {attempt_index + 1} attempts: {exc}") from exc
+        stats["retries"] = stats.get("retries", 0) + 1
+        LLM_RETRIES.inc(stage=stage)
+        delay = retry_after_seconds(exc)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt_index))
+        print(f"Retrying {stage} model call in {delay:.2f}s after error: {exc}")
+        return min(delay, self.max_delay)
+
+    async def call(self, stage: str, attempt: Callable[[], Awaitable[Any]],
+                   stats: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Run a model call within the stage's deadline, retrying and hedging as configured.
+
+        Parameters:
+            stage (str): The pipeline stage.
+            attempt (Callable[[], Awaitable[Any]]): Makes one request to the provider.
+            stats (Optional[Dict[str, Any]]): Receives "retries" and "hedges" counts.
+        Returns:
+            Any: The result of the first successful attempt.
+        Raises:
+            ModelUnavailableError: On deadline, exhausted retries or an open circuit.
+            ModelResponseError: On a non-retryable error response or an unreadable body.
+        """
+        stats = {} if stats is None else stats
+        probe = self.check_circuit(stage)
+        deadline = self.deadline_for(stage)
+        try:
+            return await asyncio.wait_for(self._call_with_retries(stage, attempt, stats), deadline)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            LLM_UNAVAILABLE.inc(stage=stage, reason="deadline")
+            raise ModelUnavailableError(f"Model call for stage '{stage}' exceeded its {deadline}s deadline")
+        finally:
+            if probe:
+                self.breaker.release_probe()  # no-op once the outcome was recorded; covers cancellation
+
+    async def _call_with_retries(self, stage: str, attempt: Callable[[], Awaitable[Any]], stats: Dict[str, Any]):
+        attempt_index = 0
+        while True:
+            try:
+                result = await self._hedged(stage, attempt, stats)
+            except Exception as e:
+                await asyncio.sleep(self.on_failure(stage, e, attempt_index, stats))
+                attempt_index += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, stage: str, attempt: Callable[[], Awaitable[Any]], stats: Dict[str, Any]):
+        tracker = self.trackers.setdefault(stage, LatencyTracker())
+        delay = self.hedge_delay(stage)
+        start = time.perf_counter()
+        if delay is None:
+            result = await attempt()
+            tracker.record(time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(attempt())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            result = primary.result()
+            tracker.record(time.perf_counter() - start)
+            return result
+
+        stats["hedges"] = stats.get("hedges", 0) + 1
+        hedge = asyncio.ensure_future(attempt())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.inc(stage=stage, winner="hedge" if task is hedge else "primary")
+                        tracker.record(time.perf_counter() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+
+model_caller = ResilientCaller()
+registry.gauge("llm_circuit_open", "1 while the model circuit breaker is open or half-open.",
+               function=lambda: 0 if model_caller.breaker.state == "closed" else 1)
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from model import complete, payload_key, stage_payload
+
+
+# Cache configuration:
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "32"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")  # empty disables the on-disk tier
+LLM_CACHE_PURGE_SECONDS = float(os.getenv("LLM_CACHE_PURGE_SECONDS", "300"))  # between purges of expired disk rows
+LLM_CACHE_TTL_SECONDS = {
+    "summary": float(os.getenv("LLM_CACHE_TTL_SUMMARY", "900")),
+    "recommendation": float(os.getenv("LLM_CACHE_TTL_RECOMMENDATION", "600")),
+}
+
+
+class ResponseCache:
+    """
+    Two-tier cache of model responses keyed by payload hash.
+
+    The memory tier is an LRU bounded by the total size of the cached entries.
+    The optional disk tier is a SQLite table that survives restarts; entries
+    found there are promoted back into memory. The SQLite connection has its
+    own lock, so disk I/O in worker threads never holds up the memory tier.
+
+    Attributes:
+        max_bytes (int): Size limit of the memory tier.
+        ttl_seconds (Dict[str, float]): Time to live per prompt type.
+        db_path (str): Path of the SQLite database ('' disables the disk tier).
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: Dict[str, float], db_path: str = ""):
+        """
+        Initialize the cache and open the disk tier if configured.
+
+        Parameters:
+            max_bytes (int): Size limit of the memory tier.
+            ttl_seconds (Dict[str, float]): Time to live per prompt type.
+            db_path (str): Path of the SQLite database ('' disables the disk tier).
+        Returns:
+            None
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+
+        self._memory: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._next_purge = time.time() + LLM_CACHE_PURGE_SECONDS
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def ttl_for(self, prompt_type: str) -> float:
+        """
+        Get the time to live for a prompt type.
+
+        Parameters:
+            prompt_type (str): The prompt type (e.g. 'summary', 'recommendation').
+        Returns:
+            float: TTL in seconds (0 means the type is not cached).
+        """
+        return self.ttl_seconds.get(prompt_type, 0.0)
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Parameters:
+            key (str): The payload key.
+        Returns:
+            Optional[str]: The cached response, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                value, expires_at, size = item
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._memory_bytes -= size
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._db_get, key, now)
+            if row is not None:
+                value, expires_at = row
+                self._store_memory(key, value, expires_at)
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: str, prompt_type: str):
+        """
+        Store a response for the TTL of its prompt type.
+
+        Parameters:
+            key (str): The payload key.
+            value (str): The model response.
+            prompt_type (str): The prompt type used to pick the TTL.
+        Returns:
+            None
+        """
+        ttl = self.ttl_for(prompt_type)
+        if ttl <= 0 or not value:
+            return
+        expires_at = time.time() + ttl
+        self._store_memory(key, value, expires_at)
+        with self._lock:
+            self._counters["stores"] += 1
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, key, value, expires_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and occupancy.
+
+        Returns:
+            Dict[str, Any]: Cache statistics, including the hit ratio.
+        """
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_enabled": self._db is not None,
+            }
+
+    def _store_memory(self, key: str, value: str, expires_at: float):
+        size = len(key) + len(value.encode("utf-8")) + 64
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[2]
+            self._memory[key] = (value, expires_at, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+                self._counters["evictions"] += 1
+
+    def _db_get(self, key: str, now: float):
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ? AND expires_at <= ?", (key, now))
+                self._db.commit()
+                return None
+            return row
+
+    def _db_put(self, key: str, value: str, expires_at: float):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, expires_at))
+            if now >= self._next_purge:
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                self._next_purge = now + LLM_CACHE_PURGE_SECONDS
+            self._db.commit()
+
+
+response_cache = ResponseCache(max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                               ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                               db_path=LLM_CACHE_DB)
+
+
+async def send_to_model_cached(input_data, prompt_type: str) -> Tuple[str, bool, Optional[Dict[str, Any]]]:
+    """
+    Send input data to the model through the response cache.
+
+    Parameters:
+        input_data (str or List[Dict]): The input prompt as a string or list of messages.
+        prompt_type (str): The prompt type ('summary' or 'recommendation') used to pick the TTL and label metrics.
+    Returns:
+        tuple: (model_answer (str), cached (bool), call_info (Optional[Dict]) - {"usage", "retries", "hedges",
+        "coalesced"}, None for cache hits)
+    """
+    key = payload_key(stage_payload(input_data, prompt_type))
+    answer = await response_cache.get(key)
+    if answer is not None:
+        return answer, True, None
+    result = await complete(input_data, prompt_type)
+    await response_cache.put(key, result["content"], prompt_type)
+    return result["content"], False, {field: result[field] for field in ("usage", "retries", "hedges", "coalesced")}
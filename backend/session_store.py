@@ -0,0 +1,409 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from chat import Chat
+from monitoring_log import LogEntry
+
+
+# Serialized session format (bumped when the layout changes; version 1 kept expanded monitoring entries):
+SESSION_FORMAT_VERSION = 2
+# Serialized sessions at least this large are zlib-compressed:
+COMPRESS_MIN_BYTES = 512
+# Chat roles are stored as one-letter codes:
+ROLE_CODES = {"system": "s", "user": "u", "assistant": "a"}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+
+class SessionConflictError(Exception):
+    """
+    Raised when a session is saved from a stale version (another worker saved it first),
+    or created with an id that already exists.
+    """
+
+
+def dump_chat(chat: Chat) -> bytes:
+    """
+    Serialize a chat session into compact bytes.
+
+    The system prompt is shared by all sessions and is not stored; roles are
+    one-letter codes, monitoring entries are compact records with their
+    prompt texts stored once, the JSON has no whitespace, and larger sessions
+    are zlib-compressed (level 1). The first byte tells the two forms apart:
+    b"j" for plain JSON and b"z" for compressed JSON. Runtime-only state
+    (the pending background summary task, the store version) is not stored.
+
+    Parameters:
+        chat (Chat): The chat session.
+    Returns:
+        bytes: The serialized session.
+    """
+    texts: Dict[str, str] = {}
+    state = {
+        "f": SESSION_FORMAT_VERSION,
+        "id": chat.session_id,
+        "fb": chat.feedback,
+        "ts": chat.timestamp_start,
+        "c": [[ROLE_CODES.get(m["role"], m["role"]), m["content"]] for m in chat.chat[1:]],
+        "ct": chat.chat_tokens[1:],
+        "m": [entry.to_record(texts) for entry in chat.monitoring_log[1:]],
+        "x": texts,
+        "s": chat.summary,
+        "su": chat.summary_upto,
+        "u": chat.usage,
+    }
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 1)
+    return b"j" + raw
+
+
+def load_chat(data: bytes, initial_prompt: str) -> Chat:
+    """
+    Rebuild a chat session from `dump_chat` output.
+
+    The session continues with the given system prompt (the current one, which
+    differs from the stored session's only if the catalog was reloaded since).
+
+    Parameters:
+        data (bytes): The serialized session.
+        initial_prompt (str): The system prompt.
+    Returns:
+        Chat: The chat session (its version is left at 0 for the caller to set).
+    Raises:
+        ValueError: If the data is not a serialized session of a known format.
+    """
+    kind, body = data[:1], data[1:]
+    if kind == b"z":
+        body = zlib.decompress(body)
+    elif kind != b"j":
+        raise ValueError(f"Unknown session encoding {kind!r}")
+    state = json.loads(body)
+    if state.get("f") not in (1, SESSION_FORMAT_VERSION):
+        raise ValueError(f"Unsupported session format {state.get('f')}")
+
+    chat = Chat(initial_prompt)
+    chat.session_id = state["id"]
+    chat.feedback = state["fb"]
+    chat.timestamp_start = state["ts"]
+    chat.chat.extend({"role": ROLE_NAMES.get(role, role), "content": content} for role, content in state["c"])
+    chat.chat_tokens.extend(state["ct"])
+    texts = state.get("x", {})
+    chat.monitoring_log.extend(LogEntry.from_record(record, texts) for record in state["m"])
+    chat.summary = state["s"]
+    chat.summary_upto = state["su"]
+    chat.usage = state["u"]
+    return chat
+
+
+class SessionStore(ABC):
+    """
+    Base class for shared session storage with optimistic concurrency.
+
+    Every session is stored as serialized bytes with a version number that
+    increases on each save and the wall-clock time of its last save. A save
+    names the version it was loaded at and fails if the stored version moved on.
+
+    Attributes:
+        name (str): The backend name used to select the store.
+    """
+    name = ""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int, float]]:
+        """
+        Read a session.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[Tuple[bytes, int, float]]: (data, version, last_saved), or None if the session is unknown.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        """
+        Write a session if its stored version is still the expected one.
+
+        Parameters:
+            session_id (str): The session identifier.
+            data (bytes): The serialized session.
+            expected_version (int): The version the session was loaded at (0 creates a new session).
+        Returns:
+            int: The new version.
+        Raises:
+            SessionConflictError: If the stored version differs (or, when creating, the session exists).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str) -> Optional[bytes]:
+        """
+        Remove a session.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[bytes]: The removed session's data, or None if it was not stored (or another worker removed it).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def expire(self, saved_before: float, limit: int = 500) -> List[bytes]:
+        """
+        Remove sessions last saved before a point in time.
+
+        Each session is claimed by exactly one caller, so workers sweeping
+        concurrently never flush the same session twice.
+
+        Parameters:
+            saved_before (float): Wall-clock cutoff (time.time()).
+            limit (int): Maximum number of sessions to remove.
+        Returns:
+            List[bytes]: The removed sessions' data.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Count the stored sessions.
+
+        Returns:
+            int: Number of sessions.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release the store's connections.
+
+        Returns:
+            None
+        """
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a local SQLite database in WAL mode, shared by every worker
+    process on the host.
+
+    Versions are checked with conditional UPDATEs; removals run in an
+    immediate transaction so concurrent sweeps claim each session once.
+
+    Attributes:
+        db_path (Path): The SQLite database file.
+    """
+    name = "sqlite"
+
+    def __init__(self, db_path: Path, busy_timeout_ms: int = 5000):
+        """
+        Open (and create if needed) the database.
+
+        Parameters:
+            db_path (Path): The SQLite database file.
+            busy_timeout_ms (int): How long to wait for another process's write lock.
+        Returns:
+            None
+        """
+        self.db_path = Path(db_path)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, "
+                             "version INTEGER NOT NULL, last_saved REAL NOT NULL, data BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_saved ON sessions (last_saved)")
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int, float]]:
+        with self._lock:
+            row = self._db.execute("SELECT data, version, last_saved FROM sessions WHERE session_id = ?",
+                                   (session_id,)).fetchone()
+        return (bytes(row[0]), row[1], row[2]) if row is not None else None
+
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        now = time.time()
+        with self._lock:
+            if expected_version == 0:
+                try:
+                    self._db.execute("INSERT INTO sessions (session_id, version, last_saved, data) VALUES (?, 1, ?, ?)",
+                                     (session_id, now, data))
+                except sqlite3.IntegrityError:
+                    raise SessionConflictError(f"Session {session_id} already exists") from None
+                return 1
+            cursor = self._db.execute("UPDATE sessions SET version = version + 1, last_saved = ?, data = ? "
+                                      "WHERE session_id = ? AND version = ?",
+                                      (now, data, session_id, expected_version))
+        if cursor.rowcount != 1:
+            raise SessionConflictError(f"Session {session_id} changed since version {expected_version}")
+        return expected_version + 1
+
+    def delete(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                if row is not None:
+                    self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return bytes(row[0]) if row is not None else None
+
+    def expire(self, saved_before: float, limit: int = 500) -> List[bytes]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute("SELECT session_id, data FROM sessions WHERE last_saved < ? "
+                                        "ORDER BY last_saved LIMIT ?", (saved_before, limit)).fetchall()
+                self._db.executemany("DELETE FROM sessions WHERE session_id = ?", [(row[0],) for row in rows])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [bytes(row[1]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in Redis (or any server speaking its protocol), shared by every
+    worker and replica.
+
+    Each session is a hash {v: version, t: last saved, d: data} under
+    `<prefix><session_id>`, and a sorted set `<prefix>index` orders the
+    sessions by last save for sweeping. Version checks use WATCH/MULTI
+    transactions. Requires the optional `redis` package.
+
+    Attributes:
+        prefix (str): Key prefix.
+    """
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "session:", client: Any = None):
+        """
+        Connect to the server.
+
+        Parameters:
+            url (str): The server URL.
+            prefix (str): Key prefix.
+            client (Any): An existing redis-py compatible client (e.g. a local stand-in); `url` is ignored if given.
+        Returns:
+            None
+        Raises:
+            RuntimeError: If no client is given and the `redis` package is not installed.
+        """
+        try:
+            from redis.exceptions import WatchError
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)") from None
+        self._watch_error = WatchError
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self.prefix = prefix
+        self._index = prefix + "index"
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int, float]]:
+        data, version, saved = self._redis.hmget(self._key(session_id), "d", "v", "t")
+        if data is None:
+            return None
+        return data, int(version), float(saved)
+
+    def save(self, session_id: str, data: bytes, expected_version: int) -> int:
+        key = self._key(session_id)
+        now = time.time()
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                stored = pipe.hget(key, "v")
+                if (int(stored) if stored is not None else 0) != expected_version:
+                    raise SessionConflictError(f"Session {session_id} changed since version {expected_version}")
+                pipe.multi()
+                pipe.hset(key, mapping={"v": expected_version + 1, "t": now, "d": data})
+                pipe.zadd(self._index, {session_id: now})
+                pipe.execute()
+            except self._watch_error:
+                raise SessionConflictError(f"Session {session_id} was saved concurrently") from None
+        return expected_version + 1
+
+    def delete(self, session_id: str) -> Optional[bytes]:
+        key = self._key(session_id)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                data = pipe.hget(key, "d")
+                pipe.multi()
+                pipe.delete(key)
+                pipe.zrem(self._index, session_id)
+                pipe.execute()
+            except self._watch_error:
+                return None
+        return data
+
+    def expire(self, saved_before: float, limit: int = 500) -> List[bytes]:
+        expired = []
+        for member in self._redis.zrangebyscore(self._index, "-inf", f"({saved_before}", start=0, num=limit):
+            session_id = member.decode("utf-8") if isinstance(member, bytes) else member
+            key = self._key(session_id)
+            with self._redis.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    data, saved = pipe.hmget(key, "d", "t")
+                    if saved is not None and float(saved) >= saved_before:
+                        continue  # saved again since the index was read
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.zrem(self._index, session_id)
+                    pipe.execute()
+                except self._watch_error:
+                    continue
+            if data is not None:
+                expired.append(data)
+        return expired
+
+    def count(self) -> int:
+        return self._redis.zcard(self._index)
+
+    def close(self):
+        self._redis.close()
+
+
+def create_session_store(backend: str, db_path: Path, redis_url: str, redis_prefix: str) -> SessionStore:
+    """
+    Create the shared session store for a backend name.
+
+    Parameters:
+        backend (str): 'sqlite' or 'redis'.
+        db_path (Path): SQLite database file (sqlite backend).
+        redis_url (str): Server URL (redis backend).
+        redis_prefix (str): Key prefix (redis backend).
+    Returns:
+        SessionStore: The store.
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, redis_prefix)
+    raise ValueError(f"Unknown session store '{backend}', expected 'sqlite' or 'redis'")
@@ -0,0 +1,485 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, List
+from chat import Chat
+from metrics import registry
+from session_store import SessionConflictError, SessionStore, dump_chat, load_chat
+
+
+SESSION_CONFLICTS = registry.counter("session_conflicts_total",
+                                     "Session saves rejected because another request saved the session first.")
+SESSION_STORE_SECONDS = registry.histogram("session_store_duration_seconds", "Shared session store call time.",
+                                           ["op"], buckets=[0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                                                            0.01, 0.025, 0.05, 0.1, 0.5])
+
+
+class _SessionEntry:
+    """
+    Internal bookkeeping record for a live session in the registry.
+
+    Attributes:
+        chat (Chat): The chat session object.
+        last_access (float): Monotonic time of the last access.
+        size_bytes (int): Approximate memory footprint of the session.
+    """
+    __slots__ = ("chat", "last_access", "size_bytes")
+
+    def __init__(self, chat: Chat, last_access: float, size_bytes: int):
+        self.chat = chat
+        self.last_access = last_access
+        self.size_bytes = size_bytes
+
+
+class SessionRegistry:
+    """
+    A bounded in-memory registry of live chat sessions (one process only).
+
+    Sessions are kept in LRU order and evicted when the registry exceeds
+    its session count or memory cap, or when they stay idle longer than
+    the configured TTL. Every session that leaves the registry is handed
+    to the `on_evict` callback so it can be flushed to the conversation log.
+
+    Attributes:
+        factory (Callable[[], Chat]): Creates a new chat session.
+        max_sessions (int): Maximum number of live sessions.
+        idle_ttl_seconds (float): Idle time after which a session expires.
+        max_bytes (int): Approximate memory cap for all live sessions.
+        on_evict (Callable[[Chat, str], None]): Called with (chat, reason) on eviction.
+    """
+
+    def __init__(self,
+                 factory: Callable[[], Chat],
+                 max_sessions: int = 10000,
+                 idle_ttl_seconds: float = 1800.0,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 on_evict: Optional[Callable[[Chat, str], None]] = None):
+        """
+        Initialize an empty session registry.
+
+        Parameters:
+            factory (Callable[[], Chat]): Creates a new chat session.
+            max_sessions (int): Maximum number of live sessions.
+            idle_ttl_seconds (float): Idle time after which a session expires.
+            max_bytes (int): Approximate memory cap for all live sessions.
+            on_evict (Callable[[Chat, str], None]): Called with (chat, reason) on eviction.
+        Returns:
+            None
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+
+        self._entries: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "created": 0,
+                          "evicted_lru": 0, "evicted_memory": 0, "expired": 0}
+
+    async def get(self, session_id: Optional[str]) -> Optional[Chat]:
+        """
+        Look up a live session and mark it as recently used.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[Chat]: The chat session, or None if it is unknown or expired.
+        """
+        expired = None
+        with self._lock:
+            entry = self._entries.get(session_id) if session_id else None
+            now = time.monotonic()
+            if entry is not None and now - entry.last_access > self.idle_ttl_seconds:
+                expired = self._remove(session_id)
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+            else:
+                self._counters["hits"] += 1
+                entry.last_access = now
+                self._entries.move_to_end(session_id)
+        if expired is not None:
+            self._evict_callback(expired, "expired")
+        return entry.chat if entry is not None else None
+
+    async def create(self) -> Chat:
+        """
+        Create and register a new chat session.
+
+        Returns:
+            Chat: The new chat session.
+        """
+        chat = self.factory()
+        size = chat.approx_size_bytes()
+        with self._lock:
+            self._entries[chat.session_id] = _SessionEntry(chat, time.monotonic(), size)
+            self._total_bytes += size
+            self._counters["created"] += 1
+            evicted = self._enforce_limits()
+        for victim, reason in evicted:
+            self._evict_callback(victim, reason)
+        return chat
+
+    async def get_or_create(self, session_id: Optional[str]) -> Chat:
+        """
+        Resolve a session id to a live session, creating a new one on a miss.
+
+        A miss always creates a session with a fresh id; callers must return
+        `chat.session_id` to the client so it can continue the conversation.
+
+        Parameters:
+            session_id (str): The session identifier (may be None).
+        Returns:
+            Chat: The resolved chat session.
+        """
+        chat = await self.get(session_id)
+        if chat is None:
+            chat = await self.create()
+        return chat
+
+    async def pop(self, session_id: Optional[str]) -> Optional[Chat]:
+        """
+        Remove a session from the registry without calling `on_evict`.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[Chat]: The removed chat session, or None if it was not registered.
+        """
+        with self._lock:
+            if not session_id or session_id not in self._entries:
+                return None
+            return self._remove(session_id)
+
+    async def refresh(self, chat: Chat):
+        """
+        Re-measure a session after it was mutated and enforce the memory cap.
+
+        Sessions live in this process, so there is nothing to save and no conflict to detect.
+
+        Parameters:
+            chat (Chat): The chat session that changed.
+        Returns:
+            None
+        """
+        with self._lock:
+            entry = self._entries.get(chat.session_id)
+            if entry is None:
+                return
+            size = chat.approx_size_bytes()
+            self._total_bytes += size - entry.size_bytes
+            entry.size_bytes = size
+            entry.last_access = time.monotonic()
+            evicted = self._enforce_limits()
+        for victim, reason in evicted:
+            self._evict_callback(victim, reason)
+
+    async def sweep(self) -> int:
+        """
+        Expire every session that has been idle longer than the TTL.
+
+        Returns:
+            int: Number of expired sessions.
+        """
+        expired: List[Chat] = []
+        with self._lock:
+            deadline = time.monotonic() - self.idle_ttl_seconds
+            # Entries are in LRU order, so the idle ones are at the front.
+            while self._entries:
+                session_id, entry = next(iter(self._entries.items()))
+                if entry.last_access > deadline:
+                    break
+                expired.append(self._remove(session_id))
+                self._counters["expired"] += 1
+        for chat in expired:
+            self._evict_callback(chat, "expired")
+        return len(expired)
+
+    async def drain(self) -> List[Chat]:
+        """
+        Remove and return every live session (used on shutdown).
+
+        Returns:
+            List[Chat]: The removed chat sessions.
+        """
+        with self._lock:
+            chats = [entry.chat for entry in self._entries.values()]
+            self._entries.clear()
+            self._total_bytes = 0
+        return chats
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry counters and occupancy.
+
+        Returns:
+            Dict[str, Any]: Registry statistics.
+        """
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0,
+                "live_sessions": len(self._entries),
+                "approx_bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+            }
+
+    def close(self):
+        """
+        Nothing to release for the in-memory registry.
+
+        Returns:
+            None
+        """
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, session_id: str) -> Chat:
+        # Caller must hold the lock.
+        entry = self._entries.pop(session_id)
+        self._total_bytes -= entry.size_bytes
+        return entry.chat
+
+    def _enforce_limits(self) -> List[tuple]:
+        # Caller must hold the lock. Never evicts the most recently used session, even with
+        # max_sessions=0 or when that session alone is over max_bytes.
+        evicted = []
+        while len(self._entries) > max(self.max_sessions, 1):
+            session_id = next(iter(self._entries))
+            evicted.append((self._remove(session_id), "lru"))
+            self._counters["evicted_lru"] += 1
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            session_id = next(iter(self._entries))
+            evicted.append((self._remove(session_id), "memory"))
+            self._counters["evicted_memory"] += 1
+        return evicted
+
+    def _evict_callback(self, chat: Chat, reason: str):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(chat, reason)
+        except Exception as e:
+            print(f"ERROR: Failed to flush evicted session {chat.session_id}. Error: {e}")
+
+
+class SharedSessionRegistry:
+    """
+    Chat sessions kept in a shared `SessionStore`, so any worker process or
+    replica can serve any turn.
+
+    Sessions are loaded from the store on every request and saved back with
+    the version they were loaded at. A save that lost a race with another
+    request raises `SessionConflictError` instead of overwriting that turn.
+    Idle sessions are removed by the sweep of whichever worker reaches them
+    first and handed to `on_evict`. Store calls run in a worker thread.
+    Same interface as `SessionRegistry`.
+
+    Attributes:
+        store (SessionStore): The shared store.
+        initial_prompt (Callable[[], str]): Returns the system prompt for new and loaded sessions.
+        idle_ttl_seconds (float): Time since the last save after which a session expires.
+        on_evict (Callable[[Chat, str], None]): Called with (chat, 'expired') on expiry.
+    """
+
+    def __init__(self,
+                 store: SessionStore,
+                 initial_prompt: Callable[[], str],
+                 idle_ttl_seconds: float = 1800.0,
+                 on_evict: Optional[Callable[[Chat, str], None]] = None):
+        """
+        Initialize the registry over a store.
+
+        Parameters:
+            store (SessionStore): The shared store.
+            initial_prompt (Callable[[], str]): Returns the system prompt for new and loaded sessions.
+            idle_ttl_seconds (float): Time since the last save after which a session expires.
+            on_evict (Callable[[Chat, str], None]): Called with (chat, 'expired') on expiry.
+        Returns:
+            None
+        """
+        self.store = store
+        self.initial_prompt = initial_prompt
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.on_evict = on_evict
+
+        # Saves of the same Chat object (turn and background summary) go one at a time.
+        self._save_locks: "weakref.WeakKeyDictionary[Chat, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self._stored_sessions = 0
+        self._counters = {"hits": 0, "misses": 0, "created": 0, "saves": 0, "conflicts": 0, "expired": 0,
+                          "bytes_saved": 0}
+
+    async def get(self, session_id: Optional[str]) -> Optional[Chat]:
+        """
+        Load a session from the store.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[Chat]: The chat session (with its store version), or None if it is unknown or expired.
+        """
+        row = await self._call("load", self.store.load, session_id) if session_id else None
+        if row is not None and time.time() - row[2] > self.idle_ttl_seconds:
+            expired = await self._call("delete", self.store.delete, session_id)
+            self._counters["expired"] += 1
+            if expired is not None:
+                self._evict_callback(expired, "expired")
+            row = None
+        chat = self._decode(row[0]) if row is not None else None
+        if chat is None:
+            self._counters["misses"] += 1
+            return None
+        chat.version = row[1]
+        self._counters["hits"] += 1
+        return chat
+
+    async def create(self) -> Chat:
+        """
+        Create a new chat session and store it.
+
+        Returns:
+            Chat: The new chat session.
+        """
+        chat = Chat(self.initial_prompt())
+        await self.refresh(chat)
+        self._counters["created"] += 1
+        return chat
+
+    async def get_or_create(self, session_id: Optional[str]) -> Chat:
+        """
+        Resolve a session id to a stored session, creating a new one on a miss.
+
+        A miss always creates a session with a fresh id; callers must return
+        `chat.session_id` to the client so it can continue the conversation.
+
+        Parameters:
+            session_id (str): The session identifier (may be None).
+        Returns:
+            Chat: The resolved chat session.
+        """
+        chat = await self.get(session_id)
+        if chat is None:
+            chat = await self.create()
+        return chat
+
+    async def pop(self, session_id: Optional[str]) -> Optional[Chat]:
+        """
+        Remove a session from the store without calling `on_evict`.
+
+        Parameters:
+            session_id (str): The session identifier.
+        Returns:
+            Optional[Chat]: The removed chat session, or None if it was not stored.
+        """
+        if not session_id:
+            return None
+        data = await self._call("delete", self.store.delete, session_id)
+        return self._decode(data) if data is not None else None
+
+    async def refresh(self, chat: Chat):
+        """
+        Save a session after it was mutated.
+
+        Parameters:
+            chat (Chat): The chat session that changed.
+        Returns:
+            None
+        Raises:
+            SessionConflictError: If the session was saved by another request since it was loaded.
+        """
+        lock = self._save_locks.setdefault(chat, asyncio.Lock())
+        async with lock:
+            data = dump_chat(chat)
+            try:
+                chat.version = await self._call("save", self.store.save, chat.session_id, data, chat.version)
+            except SessionConflictError:
+                self._counters["conflicts"] += 1
+                SESSION_CONFLICTS.inc()
+                raise
+            self._counters["saves"] += 1
+            self._counters["bytes_saved"] += len(data)
+
+    async def sweep(self) -> int:
+        """
+        Expire every session that has not been saved within the TTL.
+
+        Returns:
+            int: Number of sessions this worker expired.
+        """
+        expired = await self._call("expire", self.store.expire, time.time() - self.idle_ttl_seconds)
+        self._counters["expired"] += len(expired)
+        for data in expired:
+            self._evict_callback(data, "expired")
+        self._stored_sessions = await self._call("count", self.store.count)
+        return len(expired)
+
+    async def drain(self) -> List[Chat]:
+        """
+        Stored sessions outlive this worker (other workers keep serving them), so nothing is drained.
+
+        Returns:
+            List[Chat]: An empty list.
+        """
+        return []
+
+    def close(self):
+        """
+        Close the store.
+
+        Returns:
+            None
+        """
+        self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get this worker's registry counters and the number of stored sessions (as of the last sweep).
+
+        Returns:
+            Dict[str, Any]: Registry statistics.
+        """
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0,
+            "avg_session_bytes": round(self._counters["bytes_saved"] / self._counters["saves"])
+            if self._counters["saves"] else 0,
+            "backend": self.store.name,
+            "stored_sessions": self._stored_sessions,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+        }
+
+    def __len__(self) -> int:
+        return self._stored_sessions
+
+    async def _call(self, op: str, fn: Callable, *args):
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            SESSION_STORE_SECONDS.observe(time.perf_counter() - start, op=op)
+
+    def _decode(self, data: bytes) -> Optional[Chat]:
+        try:
+            return load_chat(data, self.initial_prompt())
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"ERROR: Failed to load stored session. Error: {e}")
+            return None
+
+    def _evict_callback(self, data: bytes, reason: str):
+        chat = self._decode(data)
+        if chat is None or self.on_evict is None:
+            return
+        try:
+            self.on_evict(chat, reason)
+        except Exception as e:
+            print(f"ERROR: Failed to flush evicted session {chat.session_id}. Error: {e}")
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight wait for the same result (or exception). The call runs in its own
+    task, so a cancelled caller does not cancel it for the others. At most
+    `max_waiters` callers join one call; further callers run their own.
+
+    Attributes:
+        max_waiters (int): Maximum callers sharing one in-flight call (besides the one that started it).
+    """
+
+    def __init__(self, max_waiters: int = 64):
+        self.max_waiters = max_waiters
+        self._calls: Dict[str, list] = {}  # key -> [task, waiter count]
+        self._counters = {"leaders": 0, "coalesced": 0, "overflow": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Run `fn` once for all concurrent callers with the same key.
+
+        Parameters:
+            key (str): The coalescing key (e.g. a payload hash).
+            fn (Callable[[], Awaitable[Any]]): Starts the call.
+        Returns:
+            Tuple[Any, str]: The result and the caller's role: 'leader', 'coalesced' or 'overflow'.
+        """
+        call = self._calls.get(key)
+        if call is not None and not call[0].done():
+            if call[1] < self.max_waiters:
+                call[1] += 1
+                self._counters["coalesced"] += 1
+                return await asyncio.shield(call[0]), "coalesced"
+            self._counters["overflow"] += 1
+            return await fn(), "overflow"
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = [task, 0]
+        task.add_done_callback(lambda done: self._finish(key, done))
+        self._counters["leaders"] += 1
+        return await asyncio.shield(task), "leader"
+
+    def _finish(self, key: str, task: asyncio.Future):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
+
+    def in_flight(self) -> int:
+        """
+        Get the number of keys with a call in flight.
+
+        Returns:
+            int: In-flight keys.
+        """
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the coalescing counters.
+
+        Returns:
+            Dict[str, int]: Leaders, coalesced and overflow callers, and in-flight keys.
+        """
+        return {**self._counters, "in_flight": len(self._calls)}
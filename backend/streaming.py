@@ -0,0 +1,133 @@
+import json
+import re
+from typing import Any, Dict
+
+_ANSWER_KEY_RE = re.compile(r'"Answer"\s*:\s*"')
+_SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b',
+                   'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class AnswerStreamExtractor:
+    """
+    Incrementally extract the "Answer" string from a streamed JSON envelope.
+
+    The model replies with the JSON structure defined in INITIAL_PROMPT. Chunks
+    of that reply are fed in as they arrive and the decoded characters of the
+    "Answer" value are returned as soon as they are available, so they can be
+    forwarded to the client before the rest of the envelope is generated.
+
+    Attributes:
+        done (bool): True once the closing quote of the Answer value was seen.
+    """
+
+    def __init__(self):
+        """
+        Initialize the extractor.
+
+        Returns:
+            None
+        """
+        self.done = False
+        self._in_value = False
+        self._buffer = ""      # raw text seen before the Answer value starts
+        self._escape = None    # pending escape sequence inside the value
+        self._high = None      # decoded high surrogate waiting for its low half
+
+    def feed(self, chunk: str) -> str:
+        """
+        Feed the next chunk of raw model output.
+
+        Parameters:
+            chunk (str): The next piece of the streamed response.
+        Returns:
+            str: Newly decoded Answer text (may be empty).
+        """
+        if self.done:
+            return ""
+        if not self._in_value:
+            self._buffer += chunk
+            match = _ANSWER_KEY_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._in_value = True
+            chunk = self._buffer[match.end():]
+            self._buffer = ""
+
+        out = []
+        for ch in chunk:
+            if self._escape is not None:
+                self._escape += ch
+                decoded = self._decode_escape()
+                if decoded is not None:
+                    self._escape = None
+                    if len(decoded) == 1 and 0xD800 <= ord(decoded) <= 0xDFFF:
+                        self._add_surrogate(out, decoded)
+                    else:
+                        self._flush_surrogate(out)
+                        out.append(decoded)
+            elif ch == "\\":
+                self._escape = ""
+            elif ch == '"':
+                self._flush_surrogate(out)
+                self.done = True
+                break
+            else:
+                if self._high is not None:
+                    self._flush_surrogate(out)
+                out.append(ch)
+        return "".join(out)
+
+    def _decode_escape(self):
+        # Returns the decoded character, or None while the escape is incomplete.
+        esc = self._escape
+        if esc[0] == "u":
+            if len(esc) < 5:
+                return None
+            try:
+                return chr(int(esc[1:5], 16))
+            except ValueError:
+                return esc
+        return _SIMPLE_ESCAPES.get(esc[0], esc[0])
+
+    def _add_surrogate(self, out, ch: str):
+        # A character outside the BMP arrives as two \uXXXX escapes: hold the high half
+        # until the low half arrives. A lone half cannot be encoded, so it becomes U+FFFD.
+        if self._high is not None and 0xDC00 <= ord(ch) <= 0xDFFF:
+            out.append(chr(0x10000 + ((ord(self._high) - 0xD800) << 10) + (ord(ch) - 0xDC00)))
+            self._high = None
+            return
+        self._flush_surrogate(out)
+        if ord(ch) <= 0xDBFF:
+            self._high = ch
+        else:
+            out.append("\ufffd")
+
+    def _flush_surrogate(self, out):
+        if self._high is not None:
+            out.append("\ufffd")
+            self._high = None
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format a server-sent event.
+
+    Parameters:
+        event (str): The event name.
+        data (Dict[str, Any]): The JSON payload.
+    Returns:
+        str: The encoded event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def format_ndjson(data: Dict[str, Any]) -> str:
+    """
+    Format one newline-delimited JSON record.
+
+    Parameters:
+        data (Dict[str, Any]): The record.
+    Returns:
+        str: The encoded line.
+    """
+    return json.dumps(data, ensure_ascii=False) + "\n"
@@ -0,0 +1,25 @@
+"""
+Shared test setup: the backend modules import each other by their flat names
+(`from chat import Chat`), so the backend directory goes on the import path.
+"""
+import importlib
+import os
+import sys
+from pathlib import Path
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """
+    The FastAPI app module, with its conversation log in a temporary directory
+    (when this is the first test to import it; the lifespan hook is not run).
+    """
+    monkeypatch.setenv("CONVERSATION_LOG_PATH", str(tmp_path / "log.jsonl"))
+    return importlib.import_module("main")
@@ -0,0 +1,66 @@
+import pytest
+from answer_parser import AnswerParseError, extract_json_object, parse_answer
+
+CATEGORIES = ["Gaming & High Performance", "Business & Travel"]
+
+
+def test_valid_envelope():
+    envelope, outcome = parse_answer('{"Answer": "Any budget?", "ready_to_filter": false, "selected_category": null}',
+                                     CATEGORIES)
+    assert envelope == {"Answer": "Any budget?", "ready_to_filter": False, "selected_category": None}
+    assert outcome == "ok"
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"Answer": "Any budget?", "ready_to_filter": false, "selected_category": null}\n```',
+    '{"Answer": "Any budget?", "ready_to_filter": False, "selected_category": None,}',
+    '{"Answer": "Any budget?", "ready_to_filter": false, "selected_category": null',
+])
+def test_malformed_json_is_repaired(text):
+    envelope, outcome = parse_answer(text, CATEGORIES)
+    assert envelope == {"Answer": "Any budget?", "ready_to_filter": False, "selected_category": None}
+    assert outcome == "repaired"
+
+
+def test_text_around_the_object_is_ignored():
+    envelope, _ = parse_answer('Sure! {"Answer": "Any budget?", "ready_to_filter": false, "selected_category": null} '
+                               'Hope this helps. {"Answer": "second"}', CATEGORIES)
+    assert envelope["Answer"] == "Any budget?"
+
+
+def test_braces_and_commas_inside_strings_are_kept():
+    json_text, repaired = extract_json_object('{"Answer": "Use {braces}, ]brackets[ and commas,}"}')
+    assert json_text == '{"Answer": "Use {braces}, ]brackets[ and commas,}"}'
+    assert not repaired
+
+
+def test_category_is_matched_to_the_closed_list():
+    envelope, outcome = parse_answer('{"Answer": "Here you go", "ready_to_filter": "true", '
+                                     '"selected_category": " gaming & high performance "}', CATEGORIES)
+    assert envelope["ready_to_filter"] is True
+    assert envelope["selected_category"] == "Gaming & High Performance"
+    assert outcome == "repaired"
+
+
+def test_unknown_category_turns_back_into_clarification():
+    envelope, _ = parse_answer('{"Answer": "Here you go", "ready_to_filter": true, "selected_category": "Phones"}',
+                               CATEGORIES)
+    assert envelope["ready_to_filter"] is False
+    assert envelope["selected_category"] is None
+
+
+def test_plain_text_reply_is_used_as_the_answer():
+    envelope, outcome = parse_answer("What will you use the laptop for?", CATEGORIES)
+    assert envelope == {"Answer": "What will you use the laptop for?", "ready_to_filter": False,
+                        "selected_category": None}
+    assert outcome == "plain_text"
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    '{"ready_to_filter": false}',
+    '{"Answer": "unterminated string',
+])
+def test_unusable_replies_raise(text):
+    with pytest.raises(AnswerParseError):
+        parse_answer(text, CATEGORIES)
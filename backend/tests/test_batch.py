@@ -0,0 +1,88 @@
+import asyncio
+import json
+import pytest
+import recommendations
+from recommendations import iter_spooled, run_batch, spool_ndjson
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    calls = {"in_flight": 0, "max_in_flight": 0}
+
+    async def fake_send(prompt_text, prompt_type):
+        calls["in_flight"] += 1
+        calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+        await asyncio.sleep(0.01)
+        calls["in_flight"] -= 1
+        return f"pick for {prompt_text}", False, {"usage": {"total_tokens": 10, "cost_usd": 0.001}}
+
+    monkeypatch.setattr(recommendations, "get_categories", lambda: ["Laptops"])
+    monkeypatch.setattr(recommendations, "build_recommendation_text", lambda summary, category: summary)
+    monkeypatch.setattr(recommendations, "send_to_model_cached", fake_send)
+    return calls
+
+
+async def collect(records):
+    return [record async for record in records]
+
+
+def test_run_batch_reports_results_progress_and_summary(fake_model):
+    items = [{"id": f"item-{i}", "summary": f"need {i}", "category": "Laptops"} for i in range(5)]
+    items += [{"summary": "", "category": "Laptops"}, {"summary": "need", "category": "Toasters"}]
+    records = asyncio.run(collect(run_batch(items, concurrency=2, progress_every=3, total=len(items))))
+
+    results = [r for r in records if r["type"] == "result"]
+    assert sorted(r["index"] for r in results) == list(range(7))
+    assert {r["id"]: r["recommendation"] for r in results if "error" not in r}["item-3"] == "pick for need 3"
+    assert [r["completed"] for r in records if r["type"] == "progress"] == [3, 6]
+    summary = records[-1]
+    assert summary["type"] == "summary"
+    assert (summary["completed"], summary["errors"], summary["total_tokens"]) == (7, 2, 50)
+    assert fake_model["max_in_flight"] <= 2
+
+
+def test_run_batch_reports_unreadable_input(fake_model):
+    def items():
+        yield {"summary": "need", "category": "Laptops"}
+        raise ValueError("bad line")
+
+    records = asyncio.run(collect(run_batch(items(), progress_every=0)))
+    assert records[-1]["completed"] == 1
+    assert records[-1]["input_error"] == "bad line"
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.parametrize("size", [1, 5, 64, 10_000])
+def test_spool_ndjson_splits_lines_across_chunks(size):
+    items = [{"summary": f"need {i}", "category": "Laptops"} for i in range(20)]
+    body = b"\n".join(json.dumps(item).encode() for item in items) + b"\n\n"
+    spool, count = asyncio.run(spool_ndjson(chunked(body, size)))
+    assert count == 20
+    assert list(iter_spooled(spool)) == items
+
+
+def test_spool_ndjson_rejects_invalid_json():
+    with pytest.raises(ValueError, match="item 2 is not valid JSON"):
+        asyncio.run(spool_ndjson(chunked(b'{"a": 1}\n{not json}\n', 4)))
+
+
+def test_spool_ndjson_rejects_long_lines(monkeypatch):
+    monkeypatch.setattr(recommendations, "BATCH_MAX_LINE_KB", 1)
+    pieces = []
+
+    async def endless_line():
+        yield b'{"a": 1}\n'
+        while True:
+            pieces.append(1)
+            yield b"x" * 100
+
+    with pytest.raises(ValueError, match="item 2 is longer than 1 KB"):
+        asyncio.run(spool_ndjson(endless_line()))
+    assert len(pieces) == 11
+
+    with pytest.raises(ValueError, match="item 1 is longer"):
+        asyncio.run(spool_ndjson(chunked(b'"' + b"x" * 2000 + b'"\n', 5000)))
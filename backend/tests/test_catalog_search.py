@@ -0,0 +1,53 @@
+import pytest
+from catalog_search import CatalogSearchIndex
+
+
+def product(sku: str, name: str, description: str, family: str = "", cpu: str = "", gpu: str = "") -> dict:
+    return {"SKU": sku, "Name": name, "Description": description, "Family": family, "CPU": cpu, "GPU": gpu}
+
+
+PRODUCTS = [
+    product("G1", "Raptor 16", "Gaming laptop with a high refresh display", "Raptor", "Intel Core i9", "RTX 4080"),
+    product("G2", "Raptor 14", "Compact gaming laptop", "Raptor", "Intel Core i7", "RTX 4060"),
+    product("B1", "Voyager 13", "Lightweight business laptop with long battery life", "Voyager", "Intel Core i5"),
+    product("W1", "Forge 17", "Mobile workstation for CAD and rendering", "Forge", "Intel Core i9", "RTX 5000 Ada"),
+]
+CATEGORIES = {"Gaming": ["G1", "G2"], "Business": ["B1"], "Workstations": ["W1"]}
+
+
+@pytest.fixture(scope="module")
+def index() -> CatalogSearchIndex:
+    return CatalogSearchIndex(PRODUCTS, CATEGORIES)
+
+
+def test_best_match_ranks_first(index):
+    results = index.search("gaming laptop with high refresh display", top_k=4)
+    assert results[0][0] == "G1"
+    assert [sku for sku, _ in results][:2] == ["G1", "G2"]
+    assert all(score > 0 for _, score in results)
+
+
+def test_results_are_limited_to_top_k(index):
+    assert len(index.search("laptop", top_k=2)) == 2
+
+
+def test_query_matching_nothing_returns_no_results(index):
+    assert index.search("espresso machine") == []
+    assert not index.scores("espresso machine").any()
+
+
+def test_category_boost_lifts_products_of_the_category(index):
+    plain = [sku for sku, _ in index.search("rtx", top_k=4, category_boost=0)]
+    boosted = [sku for sku, _ in index.search("rtx", top_k=4, category="Workstations")]
+    assert boosted[0] == "W1"
+    assert plain[0] != "W1"
+
+
+def test_allowed_skus_restrict_the_results(index):
+    results = index.search("rtx gaming", top_k=4, category="Gaming", allowed_skus=["G2", "W1"])
+    assert [sku for sku, _ in results] == ["G2", "W1"]
+
+
+def test_product_lookup(index):
+    assert index.product("B1")["Name"] == "Voyager 13"
+    assert len(index) == 4
@@ -0,0 +1,55 @@
+import chat
+from chat import Chat, estimate_tokens
+
+WORDS = "one two three four five six seven eight nine ten"
+
+
+def make_chat(turns: int) -> Chat:
+    chat_instance = Chat("system prompt")
+    for i in range(turns):
+        chat_instance.add_user_message(WORDS)
+        chat_instance.add_model_response(WORDS)
+    return chat_instance
+
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("Hello, world!") == 4
+    assert estimate_tokens("") == 0
+
+
+def test_history_within_budget_is_sent_as_is():
+    chat_instance = make_chat(3)
+    messages, tokens = chat_instance.get_context(token_budget=0)
+    assert messages == chat_instance.get_chat()
+    assert tokens == sum(chat_instance.chat_tokens)
+    assert chat_instance.get_context(token_budget=10_000)[0] == chat_instance.get_chat()
+
+
+def test_oldest_turns_are_dropped_without_a_summary(monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_CONTEXT_KEEP_MESSAGES", 2)
+    chat_instance = make_chat(3)
+    messages, tokens = chat_instance.get_context(token_budget=50)
+    # Dropping three messages fits the budget, but the next one is an assistant turn, so it goes too.
+    assert [m["role"] for m in messages] == ["system", "user", "assistant"]
+    assert messages[0] == chat_instance.get_chat()[0]
+    assert tokens == chat_instance.chat_tokens[0] + sum(chat_instance.chat_tokens[5:])
+
+
+def test_latest_messages_are_always_kept(monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_CONTEXT_KEEP_MESSAGES", 2)
+    chat_instance = make_chat(3)
+    messages, _ = chat_instance.get_context(token_budget=1)
+    assert messages[-2:] == chat_instance.get_chat()[-2:]
+
+
+def test_summarized_turns_are_folded_into_the_summary(monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_CONTEXT_KEEP_MESSAGES", 2)
+    chat_instance = make_chat(3)
+    chat_instance.summary = "The user wants a laptop."
+    chat_instance.summary_upto = 3
+    messages, tokens = chat_instance.get_context(token_budget=10)
+    # Only the turns the summary covers are left out, however far over the budget.
+    assert [m["role"] for m in messages] == ["system", "system", "user", "assistant", "user", "assistant"]
+    assert messages[1]["content"] == "Summary of the earlier conversation: The user wants a laptop."
+    assert messages[2:] == chat_instance.get_chat()[3:]
+    assert tokens == sum(chat_instance._message_tokens(m) for m in messages)
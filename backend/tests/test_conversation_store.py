@@ -0,0 +1,88 @@
+import sqlite3
+import pytest
+from chat import Chat
+from conversation_store import SQLiteConversationStore
+from log_writer import LogWriter
+from monitoring_log import TextStore, expand_log, texts_path
+from prompt_template import PromptTemplate
+
+TEMPLATE = PromptTemplate("Recommend one of these products:\n{products_str}")
+CATALOG = "X1 Carbon, 16GB RAM, $1,499. " * 20  # long enough to be stored by reference
+
+
+def make_log(session_id: str, start: str, feedback: str = "none") -> dict:
+    chat = Chat("system prompt")
+    chat.session_id = session_id
+    chat.timestamp_start = start
+    chat.feedback = feedback
+    chat.add_monitoring_log("user", "I need a laptop")
+    chat.add_monitoring_prompt(TEMPLATE, products_str=CATALOG)
+    chat.add_monitoring_log("assistant", "Try the X1", latency_seconds=2.0, stage="recommendation",
+                            usage={"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120})
+    return chat.log_conversation()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteConversationStore(tmp_path / "conversations.db")
+    yield store
+    store.close()
+
+
+def test_session_round_trip(store):
+    log = make_log("a", "2025-01-01T10:00:00", "positive")
+    store.write_batch([log])
+    assert store.get_session("a") == expand_log(log)
+    compact = store.get_session("a", expand=False)
+    history = compact["conversation_history"]
+    assert history[0]["text_ref"] == log["conversation_history"][0]["text_ref"]
+    assert history[2]["prompt"] == log["conversation_history"][2]["prompt"]
+    assert "texts" not in compact
+    assert store.get_session("missing") is None
+
+
+def test_shared_texts_are_stored_once(store, tmp_path):
+    store.write_batch([make_log("a", "2025-01-01T10:00:00"), make_log("b", "2025-01-01T11:00:00")])
+    store.write_batch([make_log("a", "2025-01-01T10:00:00")])  # rewriting a session replaces it
+    with sqlite3.connect(tmp_path / "conversations.db") as db:
+        assert db.execute("SELECT COUNT(*) FROM texts").fetchone()[0] == 3  # system prompt, template, catalog
+        assert db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 2
+        assert db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 8
+
+
+def test_list_sessions_filters_and_pages(store):
+    store.write_batch([make_log("a", "2025-01-01T10:00:00", "positive"),
+                       make_log("b", "2025-01-02T10:00:00", "negative"),
+                       make_log("c", "2025-01-03T10:00:00", "positive")])
+    page = store.list_sessions(limit=2)
+    assert [s["session_id"] for s in page["items"]] == ["c", "b"]
+    assert page["total"] == 3
+    assert [s["session_id"] for s in store.list_sessions(limit=2, offset=2)["items"]] == ["a"]
+    assert [s["session_id"] for s in store.list_sessions(feedback="positive")["items"]] == ["c", "a"]
+    assert [s["session_id"] for s in store.list_sessions(since="2025-01-02", until="2025-01-03")["items"]] == ["b"]
+    assert [s["session_id"] for s in store.recent_sessions(2)] == ["b", "c"]
+
+
+def test_aggregate(store):
+    store.write_batch([make_log("a", "2025-01-01T10:00:00", "positive"),
+                       make_log("b", "2025-01-02T10:00:00", "negative"),
+                       make_log("c", "2025-01-03T10:00:00")])
+    stats = store.aggregate()
+    assert stats["total_chats"] == 3
+    assert stats["chats_with_feedback"] == 2
+    assert stats["positive_feedback_percent"] == 50.0
+    assert stats["avg_messages_per_chat"] == 4.0
+    assert stats["usage_by_stage"]["recommendation"]["calls"] == 3
+    assert store.aggregate(feedback="negative")["total_chats"] == 1
+
+
+def test_import_jsonl_with_its_texts_file(store, tmp_path):
+    log_path = tmp_path / "log.jsonl"
+    writer = LogWriter(log_path, fsync_policy="never", text_store=TextStore(texts_path(log_path)))
+    logs = [make_log("a", "2025-01-01T10:00:00"), make_log("b", "2025-01-02T10:00:00")]
+    for log in logs:
+        writer.submit(log)
+    assert "texts" not in log_path.read_text(encoding="utf-8")
+
+    assert store.import_jsonl(log_path, batch_size=1) == 2
+    assert [store.get_session(log["session_id"]) for log in logs] == [expand_log(log) for log in logs]
@@ -0,0 +1,36 @@
+from chat import Chat
+from intent_classifier import classify_user_messages
+
+GAMING_REQUEST = "I need a gaming laptop with an RTX GPU for AAA games, high refresh rate"
+
+
+def test_clear_request_takes_the_fast_path():
+    decision = classify_user_messages([GAMING_REQUEST])
+    assert decision["fast_path"]
+    assert decision["category"] == "Gaming & High Performance"
+
+
+def test_vague_message_goes_to_the_model():
+    assert not classify_user_messages(["hi, can you help me?"])["fast_path"]
+
+
+def test_only_messages_since_the_last_reply_are_classified():
+    chat = Chat("system prompt")
+    chat.add_user_message(GAMING_REQUEST)
+    chat.add_model_response("What is your budget?")
+    chat.add_user_message("ok thanks")
+    assert chat.user_messages_since_reply() == ["ok thanks"]
+
+
+def test_follow_up_after_a_recommendation_goes_to_the_model(backend):
+    chat = Chat("system prompt")
+    chat.add_user_message(GAMING_REQUEST)
+    assert backend.classify_intent(chat)["fast_path"]
+
+    chat.add_monitoring_log("assistant", "Here are three gaming laptops...", stage="recommendation")
+    chat.add_model_response("Here are three gaming laptops...")
+    chat.add_user_message("ok thanks, anything cheaper?")
+    assert not backend.classify_intent(chat)["fast_path"]
+
+    chat.add_user_message(GAMING_REQUEST)  # even a clear request, once a recommendation was given
+    assert not backend.classify_intent(chat)["fast_path"]
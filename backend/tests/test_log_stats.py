@@ -0,0 +1,80 @@
+import asyncio
+import json
+import httpx
+from log_stats import LogAggregator
+
+
+def session(session_id: str, feedback: str = "none", messages: int = 4) -> dict:
+    return {"session_id": session_id, "user_feedback": feedback, "total_messages": messages,
+            "timestamp_start": "2025-01-01T10:00:00", "timestamp_end": "2025-01-01T10:02:00",
+            "usage": {"by_stage": {"clarification": {"calls": 2, "total_tokens": 300}}}}
+
+
+def append(path, *logs, raw: str = ""):
+    with open(path, "a", encoding="utf-8") as f:
+        for log in logs:
+            f.write(json.dumps(log) + "\n")
+        f.write(raw)
+
+
+def test_catch_up_reads_only_new_lines(tmp_path):
+    log_path, checkpoint = tmp_path / "log.jsonl", tmp_path / "log.checkpoint.json"
+    append(log_path, session("a", "positive"), session("b", "negative"))
+    aggregator = LogAggregator(log_path, checkpoint)
+    assert aggregator.catch_up() == 2
+
+    append(log_path, session("c", "positive", messages=10))
+    restarted = LogAggregator(log_path, checkpoint)
+    assert restarted.catch_up() == 1
+    stats = restarted.stats()
+    assert stats["total_chats"] == 3
+    assert stats["positive_feedback_percent"] == 66.67
+    assert stats["avg_messages_per_chat"] == 6.0
+    assert stats["avg_conversation_duration_sec"] == 120.0
+    assert stats["usage_by_stage"]["clarification"]["calls"] == 6
+    assert [s["session_id"] for s in stats["recent_sessions"]] == ["a", "b", "c"]
+
+
+def test_partial_and_invalid_lines(tmp_path):
+    log_path = tmp_path / "log.jsonl"
+    append(log_path, session("a"), raw="not json\n" + json.dumps(session("b"))[:20])
+    aggregator = LogAggregator(log_path, None)
+    assert aggregator.catch_up() == 1
+    append(log_path, raw=json.dumps(session("b"))[20:] + "\n")
+    assert aggregator.catch_up() == 1
+    assert aggregator.stats()["total_chats"] == 2
+
+
+def test_shrunk_log_is_recounted(tmp_path):
+    log_path = tmp_path / "log.jsonl"
+    append(log_path, session("a"), session("b"))
+    aggregator = LogAggregator(log_path, None)
+    aggregator.catch_up()
+    log_path.write_text(json.dumps(session("c")) + "\n", encoding="utf-8")
+    aggregator.catch_up()
+    assert aggregator.stats()["total_chats"] == 1
+
+
+def test_record_batch_moves_the_checkpoint(tmp_path):
+    log_path, checkpoint = tmp_path / "log.jsonl", tmp_path / "log.checkpoint.json"
+    append(log_path, session("a"))
+    aggregator = LogAggregator(log_path, checkpoint)
+    aggregator.record_batch([session("a")], end_offset=log_path.stat().st_size)
+    assert LogAggregator(log_path, checkpoint).catch_up() == 0
+
+
+def test_logs_endpoint_answers_304_until_the_statistics_change(backend):
+    async def get(headers=None):
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/logs", headers=headers)
+
+    first = asyncio.run(get())
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert asyncio.run(get({"If-None-Match": etag})).status_code == 304
+
+    backend.log_aggregator.record(session("new"))
+    changed = asyncio.run(get({"If-None-Match": etag}))
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
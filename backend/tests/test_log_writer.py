@@ -0,0 +1,77 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime
+import pytest
+import log_writer
+from log_writer import LogWriter
+
+
+class FrozenDatetime(datetime):
+    """Pins the rotation timestamp so several rotations land in the same second."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 2, 3, 4, 5)
+
+
+def read_lines(path) -> list:
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_invalid_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LogWriter(tmp_path / "log.jsonl", fsync_policy="sometimes")
+
+
+def test_background_writer_batches_entries(tmp_path):
+    flushed = []
+    writer = LogWriter(tmp_path / "log.jsonl", batch_size=2, fsync_policy="never",
+                       on_flush=lambda batch, offset: flushed.append((len(batch), offset)))
+
+    async def scenario():
+        await writer.start()
+        for i in range(5):
+            assert writer.submit({"session_id": str(i)})
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert [entry["session_id"] for entry in read_lines(tmp_path / "log.jsonl")] == ["0", "1", "2", "3", "4"]
+    assert [size for size, _ in flushed] == [2, 2, 1]
+    assert flushed[-1][1] == (tmp_path / "log.jsonl").stat().st_size
+    assert writer.stats()["batches"] == 3
+
+
+def test_failed_batch_does_not_stop_the_writer(tmp_path):
+    writer = LogWriter(tmp_path / "log.jsonl", batch_size=1, fsync_policy="never")
+
+    async def scenario():
+        await writer.start()
+        writer.submit({"session_id": "bad", "value": {1, 2}})  # sets are not JSON-serializable
+        writer.submit({"session_id": "good"})
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert read_lines(tmp_path / "log.jsonl") == [{"session_id": "good"}]
+    assert writer.stats()["failed_batches"] == 1
+    assert writer.stats()["written"] == 1
+
+
+@pytest.mark.parametrize("gzip_rotated", [False, True])
+def test_rotations_in_the_same_second_get_a_counter(tmp_path, monkeypatch, gzip_rotated):
+    monkeypatch.setattr(log_writer, "datetime", FrozenDatetime)
+    rotated = []
+    writer = LogWriter(tmp_path / "log.jsonl", fsync_policy="never", rotate_max_bytes=1,
+                       gzip_rotated=gzip_rotated, on_rotate=rotated.append)
+    for i in range(3):
+        writer.submit({"session_id": str(i)})
+
+    suffix = ".jsonl.gz" if gzip_rotated else ".jsonl"
+    assert [path.name for path in rotated] == [f"log.20260102-030405{suffix}",
+                                               f"log.20260102-030405-1{suffix}",
+                                               f"log.20260102-030405-2{suffix}"]
+    assert [read_lines(path)[0]["session_id"] for path in rotated] == ["0", "1", "2"]
+    assert not (tmp_path / "log.jsonl").exists()
+    assert writer.stats()["rotations"] == 3
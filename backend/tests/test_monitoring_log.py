@@ -0,0 +1,58 @@
+import json
+from monitoring_log import LogEntry, PromptRef, TextStore, expand_record, intern_text, text_id
+from prompt_template import PromptTemplate
+
+TEMPLATE = PromptTemplate("Summary: {chat_summary}\nProducts:\n{products_str}")
+CATALOG = "X1 Carbon, 16GB RAM, $1,499. " * 20  # long enough to be interned
+
+
+def test_intern_text_shares_one_instance():
+    text = "a long system prompt"
+    first = intern_text(text)
+    assert intern_text(text) is first
+    assert first.id == text_id(text)
+
+
+def test_prompt_ref_round_trips_through_a_record():
+    entry = LogEntry("system", PromptRef.from_template(TEMPLATE, {"chat_summary": "gaming", "products_str": CATALOG}),
+                     extra={"stage": "recommendation"})
+    texts = {}
+    record = entry.to_record(texts)
+    assert record["prompt"]["params"] == {"chat_summary": "gaming"}
+    assert set(texts) == {record["prompt"]["template"], record["prompt"]["refs"]["products_str"]}
+    assert CATALOG not in json.dumps(record)
+
+    rebuilt = LogEntry.from_record(record, texts)
+    assert rebuilt.to_dict() == entry.to_dict()
+    assert rebuilt.text() == TEMPLATE.format(chat_summary="gaming", products_str=CATALOG)
+    assert rebuilt.get("stage") == "recommendation"
+
+
+def test_missing_text_leaves_the_content_empty():
+    record = LogEntry("system", intern_text("system prompt")).to_record({})
+    assert expand_record(record, {})["content"] is None
+    plain = {"role": "user", "content": "hi", "latency_seconds": 0.0}
+    assert expand_record(plain, {}) is plain
+
+
+def test_text_store_writes_each_text_once_across_instances(tmp_path):
+    path = tmp_path / "log.texts.jsonl"
+    first, second = TextStore(path), TextStore(path)
+    assert first.write({"a": "alpha", "b": "beta"}) > 0
+    assert first.write({"a": "alpha"}) == 0
+    assert second.write({"a": "alpha", "b": "beta"}) == 0  # another process sharing the file
+    assert second.write({"c": "gamma"}) > 0
+    assert first.write({"c": "gamma"}) == 0
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+    assert TextStore(path).load() == {"a": "alpha", "b": "beta", "c": "gamma"}
+    assert TextStore(path).load(["b"]) == {"b": "beta"}
+
+
+def test_text_store_ends_a_partial_line(tmp_path):
+    path = tmp_path / "log.texts.jsonl"
+    store = TextStore(path)
+    store.write({"a": "alpha"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "b", "te')  # a writer that crashed mid-line
+    store.write({"c": "gamma"})
+    assert TextStore(path).load() == {"a": "alpha", "c": "gamma"}
@@ -0,0 +1,69 @@
+import math
+import pytest
+from product_index import ProductIndex, constraints_from_text, parse_capacity_gb, parse_max_price, parse_price
+
+
+def product(sku: str, vendor: str, price: str, ram: str, storage: str, cpu: str, gpu: str) -> dict:
+    return {"SKU": sku, "Vendor": vendor, "Price": price, "RAM": ram, "Storage": storage, "CPU": cpu, "GPU": gpu}
+
+
+PRODUCTS = [
+    product("A1", "Apple", "$2499", "36GB", "1TB SSD", "Apple M3 Max", "Apple M3 Max 30-core"),
+    product("D1", "Dell", "$1,299.00", "16GB", "512GB SSD", "Intel Core i7-13700H", "NVIDIA GeForce RTX 4060"),
+    product("D2", "Dell", "$899", "8GB", "256GB SSD", "Intel Core i5-1335U", "Intel Iris Xe"),
+    product("L1", "Lenovo", "$3,199", "64GB", "2TB NVMe + 2TB SSD", "Intel Core i9-13980HX", "NVIDIA RTX 5000 Ada"),
+]
+
+
+@pytest.fixture(scope="module")
+def index() -> ProductIndex:
+    return ProductIndex(PRODUCTS)
+
+
+def test_attribute_parsing():
+    assert parse_price("$1,299.00") == 1299.0
+    assert math.isnan(parse_price("call us"))
+    assert parse_capacity_gb("2TB NVMe + 2TB SSD") == 4096
+    assert parse_capacity_gb("") == 0
+
+
+def test_query_ranks_by_performance(index):
+    assert index.query() == ["L1", "A1", "D1", "D2"]
+    assert index.query(top_k=2) == ["L1", "A1"]
+
+
+def test_ties_are_ranked_by_price():
+    cheap = product("C1", "Dell", "$999", "16GB", "512GB", "Intel Core i7-13700H", "NVIDIA GeForce RTX 4060")
+    assert ProductIndex([PRODUCTS[1], cheap]).query() == ["C1", "D1"]
+
+
+def test_query_filters(index):
+    assert index.query(max_price=1500) == ["D1", "D2"]
+    assert index.query(min_ram_gb=32) == ["L1", "A1"]
+    assert index.query(min_storage_gb=1024) == ["L1", "A1"]
+    assert index.query(require_discrete_gpu=True) == ["L1", "D1"]
+    assert index.query(vendor="dell") == ["D1", "D2"]
+    assert index.query(vendor="Acme") == []
+    assert index.query(skus=["D2", "A1", "missing"]) == ["A1", "D2"]
+
+
+@pytest.mark.parametrize("text, price", [
+    ("budget of $1,500 for a laptop", 1500),
+    ("my budget is around 2k", 2000),
+    ("something under $1200", 1200),
+    ("up to 2000 dollars", 2000),
+    ("price below 900", 900),
+    ("under 1200", None),
+    ("budget laptop with 16gb of ram", None),
+    ("a 15 inch screen", None),
+])
+def test_parse_max_price(text, price):
+    assert parse_max_price(text) == price
+
+
+def test_constraints_from_text():
+    summary = "Needs 32GB RAM, a 1TB SSD and an NVIDIA GPU, prefers Dell. Budget $2,000."
+    assert constraints_from_text(summary, ["Apple", "Dell", "Lenovo"]) == {
+        "max_price": 2000, "min_ram_gb": 32, "min_storage_gb": 1024, "require_discrete_gpu": True, "vendor": "Dell"}
+    assert constraints_from_text("wants a MacBook", ["Apple", "Dell"]) == {"vendor": "Apple"}
+    assert constraints_from_text("", ["Apple"]) == {}
@@ -0,0 +1,184 @@
+import asyncio
+import httpx
+import pytest
+import model
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, ModelResponseError, ModelUnavailableError, ResilientCaller
+
+
+def make_caller(**kwargs) -> ResilientCaller:
+    return ResilientCaller(max_retries=0, base_delay=0, max_delay=0, hedge_enabled=False,
+                           breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0), **kwargs)
+
+
+async def failing():
+    raise httpx.ConnectError("provider unreachable")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["opened"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.acquire() == (True, True)
+    assert breaker.state == "half_open"
+    assert breaker.acquire() == (False, False)
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.acquire() == (True, False)
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker.reset_seconds = 0
+    assert breaker.acquire() == (True, True)
+    breaker.reset_seconds = 60
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.acquire() == (True, True)
+    breaker.release_probe()
+    assert breaker.acquire() == (True, True)
+
+
+def test_open_circuit_fails_fast():
+    caller = make_caller()
+    caller.breaker.reset_seconds = 60
+    for _ in range(2):
+        with pytest.raises(ModelUnavailableError):
+            asyncio.run(caller.call("clarification", failing))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call("clarification", failing))
+
+
+def test_cancelled_probe_does_not_wedge_the_circuit():
+    caller = make_caller()
+    caller.breaker.record_failure()
+    caller.breaker.record_failure()
+    assert caller.breaker.state == "open"
+
+    async def cancel_probe():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(caller.call("clarification", slow))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert caller.breaker.state == "half_open"
+
+    async def ok():
+        return "answer"
+
+    assert asyncio.run(caller.call("clarification", ok)) == "answer"
+    assert caller.breaker.state == "closed"
+
+
+def test_non_retryable_status_closes_the_circuit():
+    caller = make_caller()
+    caller.breaker.record_failure()
+    caller.breaker.record_failure()
+
+    async def bad_request():
+        request = httpx.Request("POST", "https://llm.test/v1/chat/completions")
+        response = httpx.Response(400, request=request)
+        raise httpx.HTTPStatusError("bad request", request=request, response=response)
+
+    with pytest.raises(ModelResponseError):
+        asyncio.run(caller.call("clarification", bad_request))
+    assert caller.breaker.state == "closed"
+
+
+def test_malformed_body_counts_as_a_failure():
+    caller = make_caller()
+    caller.breaker.record_failure()
+
+    async def malformed():
+        raise KeyError("choices")
+
+    with pytest.raises(ModelResponseError):
+        asyncio.run(caller.call("clarification", malformed))
+    assert caller.breaker.state == "open"
+
+
+def test_retries_until_success():
+    caller = ResilientCaller(max_retries=2, base_delay=0, max_delay=0, hedge_enabled=False,
+                             breaker=CircuitBreaker(failure_threshold=5, reset_seconds=60))
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("provider unreachable")
+        return "answer"
+
+    stats = {}
+    assert asyncio.run(caller.call("summary", flaky, stats)) == "answer"
+    assert stats["retries"] == 2
+    assert caller.breaker.state == "closed"
+
+
+@pytest.fixture
+def stream_caller(monkeypatch):
+    caller = make_caller()
+    monkeypatch.setattr(model, "model_caller", caller)
+    monkeypatch.setitem(resilience.STAGE_DEADLINES, "summary", 0.2)
+    yield caller
+    asyncio.run(model.use_transport(None))
+
+
+async def collect_stream(handler):
+    await model.use_transport(httpx.MockTransport(handler))
+    return [delta async for delta in model.stream_from_model("prompt", stage="summary")]
+
+
+def test_stalled_stream_hits_the_stage_deadline(stream_caller):
+    async def stalled():
+        yield b'data: {"choices": [{"delta": {"content": "Hel"}}]}\n\n'
+        await asyncio.sleep(5)
+        yield b"data: [DONE]\n\n"
+
+    def handler(request):
+        return httpx.Response(200, content=stalled())
+
+    with pytest.raises(ModelUnavailableError, match="deadline"):
+        asyncio.run(collect_stream(handler))
+    assert stream_caller.breaker.stats()["consecutive_failures"] == 1
+
+
+def test_stream_with_a_malformed_body_raises_a_response_error(stream_caller):
+    def handler(request):
+        return httpx.Response(200, content=b"data: {not json\n\n")
+
+    with pytest.raises(ModelResponseError):
+        asyncio.run(collect_stream(handler))
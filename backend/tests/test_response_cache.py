@@ -0,0 +1,87 @@
+import asyncio
+import sqlite3
+import model
+import response_cache
+from model import build_payload, payload_key
+from response_cache import ResponseCache
+
+TTL = {"summary": 60, "recommendation": 60}
+
+
+def test_memory_hit_and_uncached_prompt_type():
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=TTL)
+    asyncio.run(cache.put("a", "answer", "summary"))
+    asyncio.run(cache.put("b", "answer", "clarification"))
+    assert asyncio.run(cache.get("a")) == "answer"
+    assert asyncio.run(cache.get("b")) is None
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=300, ttl_seconds=TTL)
+    for key in ("a", "b"):
+        asyncio.run(cache.put(key, "x" * 60, "summary"))
+    asyncio.run(cache.get("a"))
+    asyncio.run(cache.put("c", "x" * 60, "summary"))
+    assert asyncio.run(cache.get("b")) is None
+    assert asyncio.run(cache.get("a")) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    asyncio.run(ResponseCache(max_bytes=10_000, ttl_seconds=TTL, db_path=db_path).put("a", "answer", "summary"))
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=TTL, db_path=db_path)
+    assert asyncio.run(cache.get("a")) == "answer"
+    assert asyncio.run(cache.get("a")) == "answer"
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+def count_rows(db_path: str) -> int:
+    with sqlite3.connect(db_path) as db:
+        return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_expired_disk_rows_are_deleted(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds={"summary": 0.01}, db_path=db_path)
+    for key in ("a", "b"):
+        asyncio.run(cache.put(key, "answer", "summary"))
+    cache._memory.clear()
+    asyncio.run(asyncio.sleep(0.02))
+
+    # A read that finds an expired row deletes it.
+    assert asyncio.run(cache.get("a")) is None
+    assert count_rows(db_path) == 1
+
+    # A put past the purge time deletes every expired row.
+    cache._next_purge = 0
+    asyncio.run(cache.put("c", "answer", "summary"))
+    assert count_rows(db_path) == 1
+
+
+def test_memory_tier_does_not_wait_for_sqlite(tmp_path):
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=TTL, db_path=str(tmp_path / "cache.db"))
+    asyncio.run(cache.put("a", "answer", "summary"))
+    with cache._db_lock:
+        assert asyncio.run(asyncio.wait_for(cache.get("a"), 1)) == "answer"
+
+
+def test_key_includes_the_stage_response_format(monkeypatch):
+    cache = ResponseCache(max_bytes=10_000, ttl_seconds=TTL)
+    monkeypatch.setattr(response_cache, "response_cache", cache)
+    monkeypatch.setattr(model, "LLM_JSON_MODE_STAGES", {"summary"})
+    calls = []
+
+    async def fake_complete(input_data, stage):
+        calls.append(stage)
+        return {"content": "answer", "usage": None, "retries": 0, "hedges": 0, "coalesced": False}
+
+    monkeypatch.setattr(response_cache, "complete", fake_complete)
+    assert asyncio.run(response_cache.send_to_model_cached("prompt", "summary"))[:2] == ("answer", False)
+    assert asyncio.run(response_cache.send_to_model_cached("prompt", "summary"))[:2] == ("answer", True)
+    assert calls == ["summary"]
+    assert asyncio.run(cache.get(payload_key(build_payload("prompt", json_mode=True)))) == "answer"
+    assert asyncio.run(cache.get(payload_key(build_payload("prompt")))) is None
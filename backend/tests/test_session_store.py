@@ -0,0 +1,91 @@
+import asyncio
+import time
+import pytest
+from chat import Chat
+from session_store import RedisSessionStore, SessionConflictError, SQLiteSessionStore, dump_chat, load_chat
+from sessions import SharedSessionRegistry
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteSessionStore(tmp_path / "sessions.db")
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        store = RedisSessionStore(client=fakeredis.FakeRedis())
+    yield store
+    store.close()
+
+
+def test_save_increments_the_version(store):
+    assert store.save("s1", b"first", 0) == 1
+    assert store.save("s1", b"second", 1) == 2
+    data, version, saved = store.load("s1")
+    assert (data, version) == (b"second", 2)
+    assert saved <= time.time()
+    assert store.load("missing") is None
+
+
+def test_stale_save_is_rejected(store):
+    store.save("s1", b"first", 0)
+    store.save("s1", b"from worker a", 1)
+    with pytest.raises(SessionConflictError):
+        store.save("s1", b"from worker b", 1)
+    assert store.load("s1")[0] == b"from worker a"
+
+
+def test_creating_an_existing_session_is_rejected(store):
+    store.save("s1", b"first", 0)
+    with pytest.raises(SessionConflictError):
+        store.save("s1", b"again", 0)
+
+
+def test_delete_returns_the_data_once(store):
+    store.save("s1", b"data", 0)
+    assert store.delete("s1") == b"data"
+    assert store.delete("s1") is None
+    assert store.count() == 0
+
+
+def test_expire_removes_sessions_saved_before_the_cutoff(store):
+    store.save("old", b"old", 0)
+    cutoff = time.time() + 0.001
+    time.sleep(0.01)
+    store.save("new", b"new", 0)
+    assert store.expire(cutoff) == [b"old"]
+    assert store.load("old") is None
+    assert store.count() == 1
+
+
+def test_dump_and_load_round_trip():
+    chat = Chat("system prompt")
+    chat.add_user_message("I need a gaming laptop")
+    chat.add_model_response("What is your budget?")
+    chat.add_monitoring_log("user", "I need a gaming laptop")
+    chat.summary, chat.summary_upto = "- gaming laptop", 2
+    restored = load_chat(dump_chat(chat), "system prompt")
+    assert restored.session_id == chat.session_id
+    assert restored.get_chat() == chat.get_chat()
+    assert restored.chat_tokens == chat.chat_tokens
+    assert restored.get_monitoring_log() == chat.get_monitoring_log()
+    assert (restored.summary, restored.summary_upto) == (chat.summary, chat.summary_upto)
+
+
+def test_registry_detects_a_lost_update(store):
+    registry = SharedSessionRegistry(store, lambda: "system prompt")
+
+    async def scenario():
+        created = await registry.create()
+        first = await registry.get(created.session_id)
+        second = await registry.get(created.session_id)
+        first.add_user_message("from worker a")
+        await registry.refresh(first)
+        second.add_user_message("from worker b")
+        with pytest.raises(SessionConflictError):
+            await registry.refresh(second)
+        return await registry.get(created.session_id)
+
+    latest = asyncio.run(scenario())
+    assert latest.get_chat()[-1]["content"] == "from worker a"
+    assert latest.version == 2
+    assert registry.stats()["conflicts"] == 1
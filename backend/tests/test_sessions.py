@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+import sessions
+from chat import Chat
+from sessions import SessionRegistry
+
+
+class FakeClock:
+    """Stands in for time.monotonic so idle timeouts can be tested without sleeping."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(sessions.time, "monotonic", clock)
+    return clock
+
+
+def make_registry(evicted, **kwargs) -> SessionRegistry:
+    return SessionRegistry(lambda: Chat("system prompt"), on_evict=lambda chat, reason: evicted.append((chat, reason)),
+                           **kwargs)
+
+
+def test_get_or_create_reuses_a_live_session():
+    registry = make_registry([])
+
+    async def scenario():
+        chat = await registry.get_or_create(None)
+        return chat, await registry.get_or_create(chat.session_id)
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert registry.stats()["created"] == 1
+    assert registry.stats()["hits"] == 1
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    evicted = []
+    registry = make_registry(evicted, max_sessions=2)
+
+    async def scenario():
+        a = await registry.create()
+        b = await registry.create()
+        await registry.get(a.session_id)  # b is now the least recently used
+        c = await registry.create()
+        return a, b, c
+
+    a, b, c = asyncio.run(scenario())
+    assert evicted == [(b, "lru")]
+    assert len(registry) == 2
+    assert asyncio.run(registry.get(b.session_id)) is None
+    assert asyncio.run(registry.get(a.session_id)) is a
+
+
+def test_idle_session_expires_on_lookup(clock):
+    evicted = []
+    registry = make_registry(evicted, idle_ttl_seconds=60)
+    chat = asyncio.run(registry.create())
+    clock.now += 61
+    assert asyncio.run(registry.get(chat.session_id)) is None
+    assert evicted == [(chat, "expired")]
+    assert registry.stats()["expired"] == 1
+
+
+def test_sweep_expires_only_idle_sessions(clock):
+    evicted = []
+    registry = make_registry(evicted, idle_ttl_seconds=60)
+    idle = asyncio.run(registry.create())
+    clock.now += 30
+    active = asyncio.run(registry.create())
+    clock.now += 40
+    assert asyncio.run(registry.sweep()) == 1
+    assert evicted == [(idle, "expired")]
+    assert asyncio.run(registry.get(active.session_id)) is active
+
+
+def test_memory_cap_evicts_but_keeps_the_newest_session():
+    evicted = []
+    registry = make_registry(evicted, max_bytes=2000)
+
+    async def scenario():
+        old = await registry.create()
+        new = await registry.create()
+        new.add_user_message("x" * 3000)
+        await registry.refresh(new)
+        return old, new
+
+    old, new = asyncio.run(scenario())
+    assert evicted == [(old, "memory")]
+    assert len(registry) == 1
+    assert asyncio.run(registry.get(new.session_id)) is new
+
+
+def test_pop_removes_without_eviction_callback():
+    evicted = []
+    registry = make_registry(evicted)
+    chat = asyncio.run(registry.create())
+    assert asyncio.run(registry.pop(chat.session_id)) is chat
+    assert evicted == []
+    assert len(registry) == 0
+
+
+def test_zero_session_limit_keeps_the_session_in_use():
+    evicted = []
+    registry = make_registry(evicted, max_sessions=0)
+
+    async def scenario():
+        first = await registry.create()
+        second = await registry.create()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert evicted == [(first, "lru")]
+    assert asyncio.run(registry.get(second.session_id)) is second
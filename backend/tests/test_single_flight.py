@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        tasks = [asyncio.create_task(flight.do("key", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 1
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert sorted(role for _, role in results) == ["coalesced"] * 4 + ["leader"]
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "overflow": 0, "in_flight": 0}
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+        return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0, "a")),
+                                    flight.do("b", lambda: asyncio.sleep(0, "b")))
+
+    assert asyncio.run(scenario()) == [("a", "leader"), ("b", "leader")]
+
+
+def test_waiters_get_the_leaders_exception():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("key", fetch))
+        follower = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == ("answer", "coalesced")
+
+
+def test_callers_beyond_max_waiters_run_their_own_call():
+    async def scenario():
+        flight = SingleFlight(max_waiters=1)
+        calls = []
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        tasks = [asyncio.create_task(flight.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return calls, [role for _, role in results]
+
+    calls, roles = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert roles == ["leader", "coalesced", "overflow"]
@@ -0,0 +1,41 @@
+import json
+import pytest
+from streaming import AnswerStreamExtractor, format_ndjson, format_sse
+
+ENVELOPE = json.dumps({"Answer": 'Say "hi"\nto the 😀 emoji, café', "ready_to_filter": False,
+                       "selected_category": None})
+
+
+def extract(text: str, chunk_size: int) -> str:
+    extractor = AnswerStreamExtractor()
+    parts = [extractor.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    assert extractor.done
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_answer_is_extracted_whatever_the_chunking(chunk_size):
+    assert extract(ENVELOPE, chunk_size) == 'Say "hi"\nto the 😀 emoji, café'
+
+
+def test_escaped_surrogate_pair_fed_one_character_at_a_time():
+    envelope = '{"Answer": "hi \\ud83d\\ude00 there", "ready_to_filter": false}'
+    text = extract(envelope, 1)
+    assert text == "hi 😀 there"
+    assert format_sse("answer", {"text": text}).encode("utf-8")
+
+
+def test_lone_surrogates_are_replaced():
+    assert extract('{"Answer": "a\\ud83d b \\ude00 c\\ud83d"}', 1) == "a� b � c�"
+
+
+def test_text_before_the_answer_key_is_skipped():
+    extractor = AnswerStreamExtractor()
+    assert extractor.feed('```json\n{"ready_to_filter": false, "Ans') == ""
+    assert extractor.feed('wer": "Which budget?"}') == "Which budget?"
+    assert extractor.feed(" trailing") == ""
+
+
+def test_event_formats():
+    assert format_sse("answer", {"text": "é"}) == 'event: answer\ndata: {"text": "é"}\n\n'
+    assert json.loads(format_ndjson({"type": "result"})) == {"type": "result"}
@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Warmup:
+    """
+    Runs the service's start-up steps in order and reports their progress.
+
+    Steps fill caches that would otherwise be built by the first request
+    (catalog, indexes, prompt fragments, HTTP client). Blocking steps run in a
+    worker thread so the event loop keeps serving while they run.
+
+    Attributes:
+        steps (List[Dict[str, Any]]): Per step: name, status ('pending', 'running', 'done' or 'failed'),
+            seconds and error.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict[str, Any]] = []
+        self._functions: Dict[str, Callable[[], Any]] = {}
+        self._in_thread: Dict[str, bool] = {}
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[[], Any], in_thread: bool = True):
+        """
+        Register a step.
+
+        Parameters:
+            name (str): Step name shown by the readiness endpoint.
+            fn (Callable[[], Any]): The step (a plain function or a coroutine function).
+            in_thread (bool): Run a plain function in a worker thread.
+        Returns:
+            None
+        """
+        self.steps.append({"name": name, "status": "pending", "seconds": None, "error": None})
+        self._functions[name] = fn
+        self._in_thread[name] = in_thread
+
+    async def run_step(self, name: str):
+        """
+        Run one step now (if it has not run yet).
+
+        Parameters:
+            name (str): The step name.
+        Returns:
+            None
+        """
+        step = next(step for step in self.steps if step["name"] == name)
+        if step["status"] != "pending":
+            return
+        if self._started is None:
+            self._started = time.perf_counter()
+        fn = self._functions[name]
+        step["status"] = "running"
+        start = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(fn):
+                await fn()
+            elif self._in_thread[name]:
+                await asyncio.to_thread(fn)
+            else:
+                fn()
+            step["status"] = "done"
+        except Exception as e:
+            print(f"ERROR: Warm-up step '{name}' failed. Error: {e}")
+            step["status"], step["error"] = "failed", str(e)
+        step["seconds"] = round(time.perf_counter() - start, 4)
+
+    async def run(self):
+        """
+        Run every pending step in order.
+
+        Returns:
+            None
+        """
+        for step in list(self.steps):
+            await self.run_step(step["name"])
+        self._finished = time.perf_counter()
+        print(f"Warm-up finished in {self._finished - (self._started or self._finished):.3f}s")
+
+    def is_ready(self) -> bool:
+        """
+        Check whether every step has finished (a failed step leaves its cache to be built on first use).
+
+        Returns:
+            bool: True once all steps are done or failed.
+        """
+        return all(step["status"] in ("done", "failed") for step in self.steps)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Get the warm-up progress.
+
+        Returns:
+            Dict[str, Any]: ready, completed and total step counts, elapsed seconds and the steps.
+        """
+        completed = sum(1 for step in self.steps if step["status"] in ("done", "failed"))
+        end = self._finished or time.perf_counter()
+        return {"ready": self.is_ready(),
+                "completed": completed,
+                "total": len(self.steps),
+                "elapsed_seconds": round(end - self._started, 4) if self._started else 0.0,
+                "steps": [dict(step) for step in self.steps]}
@@ -9,6 +9,7 @@ import { MessageProps } from "./types";
 const ChatApp: React.FC = () => {
   const [messages, setMessages] = useState<MessageProps[]>([]);
   const hasMessagesRef = useRef(false);
+  const sessionIdRef = useRef<string | null>(null);
 
   // Track if there are messages in the chat
   useEffect(() => {
@@ -49,12 +50,13 @@ const ChatApp: React.FC = () => {
       const response = await fetch("http://127.0.0.1:8000/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text }),
+        body: JSON.stringify({ text, session_id: sessionIdRef.current }),
       });
 
       if (!response.ok) throw new Error("API error");
 
       const data = await response.json();
+      sessionIdRef.current = data.session_id;
       const botMessage: MessageProps = { 
         role: "assistant", 
         content: data.response,
@@ -84,7 +86,7 @@ const ChatApp: React.FC = () => {
       await fetch("http://127.0.0.1:8000/feedback", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ feedback: feedbackType }),
+        body: JSON.stringify({ feedback: feedbackType, session_id: sessionIdRef.current }),
       });
       console.log(`Feedback sent: ${feedbackType}`);
     } catch (err) {
@@ -101,8 +103,13 @@ const ChatApp: React.FC = () => {
     try {
       const response = await fetch("http://127.0.0.1:8000/new_chat", {
         method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ session_id: sessionIdRef.current }),
+        keepalive: true,
       });
       if (!response.ok) throw new Error("Failed to reset chat on backend");
+      const data = await response.json();
+      sessionIdRef.current = data.session_id;
       console.log("Chat reset successfully");
     } catch (err) {
       console.error(err);